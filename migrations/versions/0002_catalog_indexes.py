@@ -0,0 +1,30 @@
+"""catalog indexes for the product query patterns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # owner scoped edit/delete/bulk writes
+    op.create_index("ix_products_admin_user_id_id", "products", ["associated_admin_user_id", "id"])
+    # keyset pagination over (date_posted, id)
+    op.create_index("ix_products_date_posted_id", "products", ["date_posted", "id"])
+    # price range filters and bulk price selections
+    op.create_index("ix_products_price", "products", ["price"])
+
+
+def downgrade():
+    op.drop_index("ix_products_price", table_name="products")
+    op.drop_index("ix_products_date_posted_id", table_name="products")
+    op.drop_index("ix_products_admin_user_id_id", table_name="products")
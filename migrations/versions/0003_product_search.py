@@ -0,0 +1,65 @@
+"""full text search index over product name and description
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect_name = op.get_bind().dialect.name
+
+    if dialect_name == "postgresql":
+        # has to stay identical to _PG_SEARCH_DOCUMENT in src/products/search.py
+        op.execute(
+            "CREATE INDEX ix_products_search ON products USING gin ("
+            "(setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'B')))"
+        )
+
+    elif dialect_name == "sqlite":
+        # prefix='2 3' keeps short prefix queries on the index instead of scanning every term
+        op.execute(
+            "CREATE VIRTUAL TABLE products_fts USING fts5("
+            "product_id UNINDEXED, name, description, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        op.execute(
+            "CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN "
+            "INSERT INTO products_fts (product_id, name, description) VALUES (new.id, new.name, new.description); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN "
+            "DELETE FROM products_fts WHERE product_id = old.id; "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description ON products BEGIN "
+            "DELETE FROM products_fts WHERE product_id = old.id; "
+            "INSERT INTO products_fts (product_id, name, description) VALUES (new.id, new.name, new.description); "
+            "END"
+        )
+        op.execute("INSERT INTO products_fts (product_id, name, description) SELECT id, name, description FROM products")
+
+
+def downgrade():
+    dialect_name = op.get_bind().dialect.name
+
+    if dialect_name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_products_search")
+
+    elif dialect_name == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS products_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS products_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS products_fts_insert")
+        op.execute("DROP TABLE IF EXISTS products_fts")
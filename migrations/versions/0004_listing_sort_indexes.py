@@ -0,0 +1,30 @@
+"""indexes for the listing sort keys and filters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # price sorts page by (price, id), the old single column index still serves range filters
+    # but not the keyset tie breaker, so it is replaced rather than kept alongside
+    op.drop_index("ix_products_price", table_name="products")
+    op.create_index("ix_products_price_id", "products", ["price", "id"])
+    # one admin's storefront listed newest or oldest first
+    op.create_index("ix_products_admin_user_id_date_posted_id", "products", ["associated_admin_user_id", "date_posted", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_products_admin_user_id_date_posted_id", table_name="products")
+    op.drop_index("ix_products_price_id", table_name="products")
+    op.create_index("ix_products_price", "products", ["price"])
@@ -0,0 +1,24 @@
+"""products.updated_at for conditional reads
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("products", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE products SET updated_at = date_posted")
+
+
+def downgrade():
+    op.drop_column("products", "updated_at")
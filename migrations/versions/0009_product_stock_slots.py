@@ -0,0 +1,32 @@
+"""stock slots for hot products
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("products", sa.Column("is_hot", sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_table(
+        "product_stock_slots",
+        sa.Column("product_id", sa.String(), nullable=False),
+        sa.Column("slot", sa.Integer(), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("product_id", "slot"),
+    )
+
+
+def downgrade():
+    op.drop_table("product_stock_slots")
+    op.drop_column("products", "is_hot")
@@ -0,0 +1,92 @@
+"""key the sqlite product search index by rowid
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+
+# the 0003 table found its rows through an unindexed product_id column, so every product update
+# or delete scanned the whole index. this one is an external content table over products: its
+# rows share the products rowid and are removed with the fts5 'delete' command, one lookup each.
+# VACUUM can renumber the rowids of products (it has no INTEGER PRIMARY KEY), so run
+# INSERT INTO products_fts(products_fts) VALUES('rebuild') after one
+
+_DROP_SEARCH_INDEX = (
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TABLE IF EXISTS products_fts",
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    for statement in _DROP_SEARCH_INDEX:
+        op.execute(statement)
+
+    # prefix='2 3' keeps short prefix queries on the index instead of scanning every term
+    op.execute(
+        "CREATE VIRTUAL TABLE products_fts USING fts5("
+        "name, description, content='products', content_rowid='rowid', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts (rowid, name, description) VALUES (new.rowid, new.name, new.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts (products_fts, rowid, name, description) VALUES ('delete', old.rowid, old.name, old.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description ON products BEGIN "
+        "INSERT INTO products_fts (products_fts, rowid, name, description) VALUES ('delete', old.rowid, old.name, old.description); "
+        "INSERT INTO products_fts (rowid, name, description) VALUES (new.rowid, new.name, new.description); "
+        "END"
+    )
+    op.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    for statement in _DROP_SEARCH_INDEX:
+        op.execute(statement)
+
+    op.execute(
+        "CREATE VIRTUAL TABLE products_fts USING fts5("
+        "product_id UNINDEXED, name, description, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts (product_id, name, description) VALUES (new.id, new.name, new.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN "
+        "DELETE FROM products_fts WHERE product_id = old.id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description ON products BEGIN "
+        "DELETE FROM products_fts WHERE product_id = old.id; "
+        "INSERT INTO products_fts (product_id, name, description) VALUES (new.id, new.name, new.description); "
+        "END"
+    )
+    op.execute("INSERT INTO products_fts (product_id, name, description) SELECT id, name, description FROM products")
@@ -0,0 +1,27 @@
+"""outbox events claimed per topic and per node
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("outbox_events", sa.Column("node_id", sa.String(), nullable=True))
+    op.drop_index("ix_outbox_events_status_available_at", table_name="outbox_events")
+    op.create_index("ix_outbox_events_topic_status_available_at", "outbox_events", ["topic", "status", "available_at"])
+
+
+def downgrade():
+    op.drop_index("ix_outbox_events_topic_status_available_at", table_name="outbox_events")
+    op.create_index("ix_outbox_events_status_available_at", "outbox_events", ["status", "available_at"])
+    op.drop_column("outbox_events", "node_id")
@@ -0,0 +1,38 @@
+"""order lines outlive the products they were sold from
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0014"
+down_revision = "0013"
+branch_labels = None
+depends_on = None
+
+# 0007 left the constraint unnamed, sqlite reflects it without a name so batch mode gives it this one
+_UNNAMED_FOREIGN_KEY = "fk_order_items_product_id_products"
+_NAMING_CONVENTION = { "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s" }
+
+
+def upgrade():
+    # order lines keep the product id and unit price as history, deleting a product that was
+    # ordered before must not fail on them
+    product_foreign_keys = [
+        foreign_key for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys("order_items")
+        if foreign_key["referred_table"] == "products"
+    ]
+
+    for product_foreign_key in product_foreign_keys:
+        with op.batch_alter_table("order_items", naming_convention=_NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(product_foreign_key["name"] or _UNNAMED_FOREIGN_KEY, type_="foreignkey")
+
+
+def downgrade():
+    # fails on order lines of products deleted since, those have to be cleaned up by hand first
+    with op.batch_alter_table("order_items") as batch_op:
+        batch_op.create_foreign_key("order_items_product_id_fkey", "products", ["product_id"], ["id"])
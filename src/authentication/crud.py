@@ -1,69 +1,30 @@
 from .schemas import *
 from .models import *
 from sqlalchemy import select, and_, or_ 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status, UploadFile, File, Form
-import os 
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-import json
-import bcrypt
 from .jwt_handeler import *
+from .password_hashing import hash_password, verify_password, rehash_password_if_needed
+from .token_registry import issue_user_tokens
+from ..images.ingestion import stage_image, discard_staged_image, queue_image_upload
 
 load_dotenv()
 
-CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
-CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
-if not CLOUDINARY_CLOUD_NAME or not CLOUDINARY_API_KEY or not CLOUDINARY_API_SECRET:
-    raise ValueError("Unable to load cloudinary config variables to connect to it")
-
-cloudinary.config(
-    cloud_name = CLOUDINARY_CLOUD_NAME,
-    api_key = CLOUDINARY_API_KEY,
-    api_secret = CLOUDINARY_API_SECRET
-)
-
-# function to handle file uploads to cloudinary
-
-def _upload_image_to_cloudinary(
-    image_file: UploadFile = File(..., description="Image file to upload")
-) -> str:
-    try:
-        file_to_upload = cloudinary.uploader.upload(
-            image_file.file,
-            use_filename=True,
-            unique_filename=True
-        )
-        
-        image_url = json.loads(file_to_upload)["secure_url"]
-        
-        return image_url
-        
-    except Exception as e:
-        print(f"There was an error trying to upload the image to cloudinary: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unable to upload the image to cloudinary"
-        )
-        
-
-def signup_admin_user(
-    db: Session,
+async def signup_admin_user(
+    db: AsyncSession,
     username: str = Form(..., description="username"),
     email: str = Form(..., description="email"),
     password: str = Form(..., description="password"),
     user_profile_image: UploadFile = File(None, description="profile image"),
 ):
-    existing_admin_user = db.execute(select(AdminUserModel).where(
+    existing_admin_user = (await db.execute(select(AdminUserModel).where(
         or_(
             AdminUserModel.email == email,
             AdminUserModel.username == username
         )    
-    )).scalar_one_or_none()
+    ))).scalar_one_or_none()
         
     if existing_admin_user:
         raise HTTPException(
@@ -71,23 +32,28 @@ def signup_admin_user(
             detail="Already have an account please login"
         )
             
+    # hashing and staging stay outside the try so a saturated hashing pool (429) or a
+    # rejected image (413/415) reach the client instead of turning into a 500
+    hashed_password = await hash_password(password)
+    
+    staged_profile_image = await stage_image(user_profile_image) if user_profile_image else None
+    
     try:
-        salt = bcrypt.gensalt(rounds=12)
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
-        
-        if user_profile_image:
-            user_image_url = _upload_image_to_cloudinary(image_file=user_profile_image)
+        if staged_profile_image:
             new_admin_user_instance = AdminUserModel(
                 username=username,
                 email=email,
                 password=hashed_password,
-                user_profile_image=user_image_url
+                user_profile_image=staged_profile_image.url
             )
             
             db.add(new_admin_user_instance)
-            db.commit()
+            queue_image_upload(db, staged_profile_image, AdminUserModel.user_profile_image)
+            await db.commit()
+            # committed, the file belongs to the queued upload now
+            staged_profile_image = None
             
-            db.refresh(new_admin_user_instance)
+            await db.refresh(new_admin_user_instance)
             
             return new_admin_user_instance
 
@@ -98,14 +64,17 @@ def signup_admin_user(
         )
             
         db.add(new_admin_user_instance)
-        db.commit()
+        await db.commit()
             
-        db.refresh(new_admin_user_instance)
+        await db.refresh(new_admin_user_instance)
             
         return new_admin_user_instance
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        # nothing will ever upload the staged file, a lost race on the email leaves it behind otherwise
+        if staged_profile_image:
+            discard_staged_image(staged_profile_image)
         print(f"There was an error trying to signup the admin user: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -113,15 +82,15 @@ def signup_admin_user(
         )
         
 
-def signin_admin_user(
+async def signin_admin_user(
     user_data: SigninAdminUserSchema,
-    db: Session
+    db: AsyncSession
 ):
-    existing_admin_user_instance = db.execute(select(AdminUserModel).where(
+    existing_admin_user_instance = (await db.execute(select(AdminUserModel).where(
         or_(
             AdminUserModel.email == user_data.email
         )
-    )).scalar_one_or_none()
+    ))).scalar_one_or_none()
     
     if not existing_admin_user_instance:
         raise HTTPException(
@@ -129,24 +98,30 @@ def signin_admin_user(
             detail="User not found"
         )
         
-    try:
-        checked_password = bcrypt.checkpw(user_data.password.encode("utf-8"), existing_admin_user_instance.password.encode("utf-8"))
-        if not checked_password:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials used for login"
-            )
-            
-        user_tokens_data = {
-            "sub": existing_admin_user_instance.id,
-            "username": existing_admin_user_instance.username
-        }
+    checked_password = await verify_password(user_data.password, existing_admin_user_instance.password)
+    if not checked_password:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials used for login"
+        )
         
-        user_tokens = generate_user_tokens(user_tokens_data)
+    # claims are read before the rehash, a failed rehash rolls back and expires the instance
+    user_tokens_data = {
+        "sub": existing_admin_user_instance.id,
+        "username": existing_admin_user_instance.username,
+        "role": existing_admin_user_instance.role,
+        "user_type": "admin"
+    }
+    
+    await rehash_password_if_needed(db=db, user_instance=existing_admin_user_instance, password=user_data.password)
+    
+    try:
+        user_tokens = await issue_user_tokens(db, user_tokens_data)
             
         return user_tokens
         
     except Exception as e:
+        await db.rollback()
         print(f"There was an error trying to signin the admin user: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -154,39 +129,47 @@ def signin_admin_user(
         )
         
 
-def signup_user(
-    db: Session,
+async def signup_user(
+    db: AsyncSession,
     username: str = Form(..., description="username"),
     email: str = Form(..., description="email"),
     password: str = Form(..., description="password"),
     user_profile_image: UploadFile = File(None, description="user profile image"),
 ):
-    existing_user_instance = db.execute(select(UserModel).where(UserModel.username == username)).scalar_one_or_none()
+    existing_user_instance = (await db.execute(select(UserModel).where(
+        or_(
+            UserModel.email == email,
+            UserModel.username == username
+        )
+    ))).scalar_one_or_none()
     
-    if not existing_user_instance:
+    if existing_user_instance:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User was not found, please log in"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Already have an account please login"
         )
         
+    hashed_password = await hash_password(password)
+    
+    staged_profile_image = await stage_image(user_profile_image) if user_profile_image else None
+    
     try:
-        salt = bcrypt.gensalt(rounds=12)
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
-        
-        if user_profile_image:
-            user_image_url = _upload_image_to_cloudinary(image_file=user_profile_image)
+        if staged_profile_image:
             
             new_user_instance = UserModel(
                 username=username,
                 email=email,
                 password=hashed_password,
-                user_profile_image=user_image_url
+                user_profile_image=staged_profile_image.url
             )
             
             db.add(new_user_instance)
-            db.commit()
+            queue_image_upload(db, staged_profile_image, UserModel.user_profile_image)
+            await db.commit()
+            # committed, the file belongs to the queued upload now
+            staged_profile_image = None
             
-            db.refresh(new_user_instance)
+            await db.refresh(new_user_instance)
             
             return new_user_instance
         
@@ -197,14 +180,17 @@ def signup_user(
         )
             
         db.add(new_user_instance)
-        db.commit()
+        await db.commit()
             
-        db.refresh(new_user_instance)
+        await db.refresh(new_user_instance)
             
         return new_user_instance
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        # nothing will ever upload the staged file, a lost race on the email leaves it behind otherwise
+        if staged_profile_image:
+            discard_staged_image(staged_profile_image)
         print(f"There was an error trying to signup the user: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -212,11 +198,11 @@ def signup_user(
         )
         
 
-def signin_user(
+async def signin_user(
     user_data: SigninNonAdminUserSchema,
-    db: Session
+    db: AsyncSession
 ):
-    existing_user_instance = db.execute(select(UserModel).where(UserModel.username == user_data.username)).scalar_one_or_none()
+    existing_user_instance = (await db.execute(select(UserModel).where(UserModel.username == user_data.username))).scalar_one_or_none()
     
     if not existing_user_instance:
         raise HTTPException(
@@ -224,24 +210,30 @@ def signin_user(
             detail="User not found,invalid credentials"
         )
         
-    try:
-        checked_password = bcrypt.checkpw(user_data.password.encode("utf-8"), existing_user_instance.password.encode("utf-8"))
-        if not checked_password:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid login credentials used"
-            )
-            
-        user_tokens_data = {
-            "sub": existing_user_instance.id,
-            "username": existing_user_instance.username
-        }
+    checked_password = await verify_password(user_data.password, existing_user_instance.password)
+    if not checked_password:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid login credentials used"
+        )
         
-        user_tokens = generate_user_tokens(user_tokens_data)
+    # claims are read before the rehash, a failed rehash rolls back and expires the instance
+    user_tokens_data = {
+        "sub": existing_user_instance.id,
+        "username": existing_user_instance.username,
+        "role": existing_user_instance.role,
+        "user_type": "user"
+    }
+    
+    await rehash_password_if_needed(db=db, user_instance=existing_user_instance, password=user_data.password)
+    
+    try:
+        user_tokens = await issue_user_tokens(db, user_tokens_data)
             
         return user_tokens
         
     except Exception as e:
+        await db.rollback()
         print(f"There was an error trying to signin the suer: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,119 @@
+from fastapi import HTTPException, status, Depends
+from fastapi.security.oauth2 import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..cache import TTLCache
+from .jwt_handeler import *
+from .models import *
+from .token_registry import is_token_family_revoked
+import os
+
+admin_oauth = OAuth2PasswordBearer(tokenUrl="/admin/signin", description="admin_auth_tokens")
+user_oauth = OAuth2PasswordBearer(tokenUrl="/signin", description="user_auth_tokens")
+
+# the signed token already says who the caller is, the database is only checked when we
+# want deleted users locked out before their token expires (or for old tokens without claims)
+AUTH_VERIFY_USER_EXISTS = os.getenv("AUTH_VERIFY_USER_EXISTS", "false").strip().lower() in ("1", "true", "yes", "on")
+AUTH_PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "30"))
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+
+_principal_cache = TTLCache(maxsize=AUTH_PRINCIPAL_CACHE_SIZE, ttl=AUTH_PRINCIPAL_CACHE_TTL)
+
+
+async def _lookup_user_type(
+    db: AsyncSession,
+    user_id: str
+):
+    cached_user_type = _principal_cache.get(user_id)
+    if cached_user_type is not None:
+        return cached_user_type
+
+    if (await db.execute(select(AdminUserModel.id).where(AdminUserModel.id == user_id))).scalar_one_or_none():
+        user_type = "admin"
+    elif (await db.execute(select(UserModel.id).where(UserModel.id == user_id))).scalar_one_or_none():
+        user_type = "user"
+    else:
+        return None
+
+    _principal_cache.set(user_id, user_type)
+
+    return user_type
+
+
+async def _resolve_principal(
+    db: AsyncSession,
+    access_token: str
+) -> dict:
+    decoded_token = decode_access_token(access_token)
+
+    if decoded_token.get("type") != "access":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token type was passed"
+        )
+
+    # an in memory lookup, revoked families are kept on every worker by the revocation sync
+    if is_token_family_revoked(decoded_token.get("fam")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="This session was signed out, sign in again"
+        )
+
+    user_type = decoded_token.get("user_type")
+
+    if user_type is None or AUTH_VERIFY_USER_EXISTS:
+        looked_up_user_type = await _lookup_user_type(db=db, user_id=decoded_token["sub"])
+
+        if looked_up_user_type is None or (user_type is not None and looked_up_user_type != user_type):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Why are you even here when you know you not supposed to be 🗿"
+            )
+
+        user_type = looked_up_user_type
+
+    return {
+        "user_id": decoded_token["sub"],
+        "username": decoded_token["username"],
+        "role": decoded_token.get("role", "admin" if user_type == "admin" else "non_admin"),
+        "user_type": user_type
+    }
+
+
+# any signed in account can browse the catalog
+
+async def get_current_user_principal(
+    db: AsyncSession = Depends(get_async_db),
+    current_user_token: str = Depends(user_oauth)
+) -> dict:
+    return await _resolve_principal(db=db, access_token=current_user_token)
+
+
+async def get_current_admin_principal(
+    db: AsyncSession = Depends(get_async_db),
+    current_user_token: str = Depends(admin_oauth)
+) -> dict:
+    principal = await _resolve_principal(db=db, access_token=current_user_token)
+
+    if principal["user_type"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You dont have permission level to do this"
+        )
+
+    return principal
+
+
+# orders belong to customer accounts, admins can browse but not check out
+
+async def get_current_customer_principal(
+    principal: dict = Depends(get_current_user_principal)
+) -> dict:
+    if principal["user_type"] != "user":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only customer accounts can place orders"
+        )
+
+    return principal
@@ -47,10 +47,12 @@ def generate_refresh_token(user_data: dict) -> str:
             detail="Unable to generate refresh token"
         )
         
-def generate_user_tokens(user_data: dict) -> dict:
+def generate_user_tokens(user_data: dict, token_family: str = None, token_id: str = None) -> dict:
     try:
-        access_token = generate_access_token(user_data)
-        refresh_token = generate_refresh_token(user_data)
+        # both tokens name the family so revoking it locks out the access token as well,
+        # the jti is what the registry rotates on every refresh
+        access_token = generate_access_token({ **user_data, "fam": token_family } if token_family else user_data)
+        refresh_token = generate_refresh_token({ **user_data, "fam": token_family, "jti": token_id } if token_family else user_data)
         
         return {
             "access_token": access_token,
@@ -71,6 +73,21 @@ def decode_access_token(access_token: str) -> dict:
         
         return decoded_token
         
+    # 401 tells the client to refresh or sign in again, a 500 would read as our fault
+    except ExpiredSignatureError as e:
+        print(f"Token expired: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired, refresh it"
+        )
+        
+    except InvalidTokenError as e:
+        print(f"Invalid token passed: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token was passed"
+        )
+        
     except Exception as e:
         print(f"There was an error trying to decode the token: {str(e)}")
         raise HTTPException(
@@ -79,37 +96,15 @@ def decode_access_token(access_token: str) -> dict:
         )
         
 
-def refresh_token(refresh_token: str) -> dict:
-    decoded_token = decode_access_token(refresh_token)
-        
-    if decoded_token["type"] != "refresh":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid token type was passed"
-        )
-            
+def decode_refresh_token(refresh_token: str) -> dict:
     try:
-        user_id = decoded_token["sub"]
-        username = decoded_token["username"]
-        
-        new_tokens_data = {
-            "sub": user_id,
-            "username": username
-        }
-        
-        new_access_token = generate_access_token(new_tokens_data)
-        new_refresh_token = generate_refresh_token(new_tokens_data)
-        
-        return {
-            "access_token": new_access_token,
-            "refresh_token": new_refresh_token
-        }
+        decoded_token = jwt.decode(refresh_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         
     except ExpiredSignatureError as e:
         print(f"Token expired: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token expired, refresh it"
+            detail="Token expired, sign in again"
         )
         
     except InvalidTokenError as e:
@@ -119,13 +114,28 @@ def refresh_token(refresh_token: str) -> dict:
             detail="Invalid token was passed"
         )
         
-    except Exception as e:
-        print(f"Unable to refresh the refresh token: {str(e)}")
+    if decoded_token.get("type") != "refresh":
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unable to refresh the token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid token type was passed"
         )
         
+    return decoded_token
+
+
+def refreshed_token_claims(decoded_token: dict) -> dict:
+    new_tokens_data = {
+        "sub": decoded_token["sub"],
+        "username": decoded_token["username"]
+    }
+    
+    # keep the role claims so the new access token still works on the claims fast path
+    for claim_name in ("role", "user_type"):
+        if claim_name in decoded_token:
+            new_tokens_data[claim_name] = decoded_token[claim_name]
+            
+    return new_tokens_data
+        
 
 def get_current_user_handeler(access_token: str) -> dict:
     try:
@@ -139,6 +149,8 @@ def get_current_user_handeler(access_token: str) -> dict:
             "username": username
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Unable to get the current user: {str(e)}")
         raise HTTPException(
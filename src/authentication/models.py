@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, String, ForeignKey, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from uuid import uuid4 
@@ -27,4 +27,21 @@ class UserModel(Base):
     password = Column(String, nullable=False)
     user_profile_image = Column(String, nullable=True)
     role = Column(String, default="non_admin")
-    date_created = Column(DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    date_created = Column(DateTime, default=lambda: datetime.now(timezone.utc))    
+    
+# one row per refresh token ever handed out, a family is every token rotated from the same sign in
+class RefreshTokenModel(Base):
+    __tablename__ = "refresh_tokens"
+    __table_args__ = (
+        Index("ix_refresh_tokens_family_id", "family_id"),
+        # workers pull new revocations by time, the sweeper deletes by expiry
+        Index("ix_refresh_tokens_revoked_at", "revoked_at"),
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+    )
+    
+    jti = Column(String(32), primary_key=True)
+    family_id = Column(String(32), nullable=False)
+    user_id = Column(String, nullable=False)
+    used_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+import asyncio
+import bcrypt
+import os
+import time
+
+load_dotenv()
+
+# bcrypt at cost 12 is ~250ms of cpu, so it runs in its own process pool instead of on the
+# event loop, and once too many hashes are queued we answer 429 rather than letting logins pile up
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "1"))
+
+_password_hash_pool = None
+_in_flight = 0
+_password_hash_stats = { "hashes": 0, "verifications": 0, "rehashes": 0, "rejected": 0, "failures": 0, "max_in_flight": 0, "total_seconds": 0.0 }
+
+
+def _hash_password_in_worker(password: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _verify_password_in_worker(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+def _get_password_hash_pool() -> ProcessPoolExecutor:
+    global _password_hash_pool
+
+    if _password_hash_pool is None:
+        _password_hash_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+
+    return _password_hash_pool
+
+
+async def _run_in_password_hash_pool(stat_name: str, worker_function, *args):
+    global _in_flight
+
+    if _in_flight >= PASSWORD_HASH_MAX_QUEUE:
+        _password_hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many sign in attempts right now, try again in a moment",
+            headers={ "Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS) }
+        )
+
+    _in_flight += 1
+    _password_hash_stats["max_in_flight"] = max(_password_hash_stats["max_in_flight"], _in_flight)
+    started_at = time.perf_counter()
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_password_hash_pool(), worker_function, *args)
+        _password_hash_stats[stat_name] += 1
+        return result
+
+    except Exception:
+        _password_hash_stats["failures"] += 1
+        raise
+
+    finally:
+        _in_flight -= 1
+        _password_hash_stats["total_seconds"] += time.perf_counter() - started_at
+
+
+async def hash_password(password: str) -> str:
+    return await _run_in_password_hash_pool("hashes", _hash_password_in_worker, password.encode("utf-8"), PASSWORD_HASH_ROUNDS)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run_in_password_hash_pool("verifications", _verify_password_in_worker, password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    # bcrypt hashes look like $2b$12$<salt+hash>, the middle part is the cost factor
+    try:
+        return int(hashed_password.split("$")[2]) != PASSWORD_HASH_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+async def rehash_password_if_needed(
+    db,
+    user_instance,
+    password: str
+):
+    if not password_needs_rehash(user_instance.password):
+        return
+
+    # the login already succeeded, so a failed upgrade only gets logged and retried next time
+    user_id = user_instance.id
+    try:
+        user_instance.password = await hash_password(password)
+        await db.commit()
+        _password_hash_stats["rehashes"] += 1
+
+    except Exception as e:
+        await db.rollback()
+        print(f"Unable to rehash the password for user {user_id}: {str(e)}")
+
+        # the rollback expired the row, reload it here so the caller reading its fields does
+        # not trigger a lazy load, which an async session cannot do
+        try:
+            await db.refresh(user_instance)
+        except Exception as e:
+            print(f"Unable to reload user {user_id} after the failed rehash: {str(e)}")
+
+
+def get_password_hashing_stats() -> dict:
+    completed = _password_hash_stats["hashes"] + _password_hash_stats["verifications"]
+    password_hashing_stats = dict(_password_hash_stats)
+    password_hashing_stats.update({
+        "in_flight": _in_flight,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "workers": PASSWORD_HASH_WORKERS,
+        "rounds": PASSWORD_HASH_ROUNDS,
+        "avg_ms": round(_password_hash_stats["total_seconds"] * 1000 / completed, 2) if completed else 0.0
+    })
+    return password_hashing_stats
+
+
+def shutdown_password_hash_pool():
+    global _password_hash_pool
+
+    if _password_hash_pool is not None:
+        _password_hash_pool.shutdown(wait=False, cancel_futures=True)
+        _password_hash_pool = None
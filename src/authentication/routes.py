@@ -1,13 +1,11 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status, File, Form, UploadFile, APIRouter, Depends
-from ..database import get_db
+from ..database import get_async_db
 from .jwt_handeler import *
 from .schemas import *
 from .crud import *
-from fastapi.security.oauth2 import OAuth2PasswordBearer
-
-admin_oauth = OAuth2PasswordBearer(tokenUrl="/admin/signin", description="admin_auth_tokens")
-user_oauth = OAuth2PasswordBearer(tokenUrl="/signin", description="user_auth_tokens")
+from .dependencies import admin_oauth, user_oauth, get_current_admin_principal, get_current_user_principal
+from .token_registry import rotate_refresh_token, sign_out
 
 router = APIRouter(
     prefix="/auth",
@@ -15,14 +13,14 @@ router = APIRouter(
 )
 
 @router.post("/admin/signup", status_code=status.HTTP_201_CREATED, response_model=DisplayAdminUserSchema)
-def signup_admin_user_route(
-    db: Session = Depends(get_db),
+async def signup_admin_user_route(
+    db: AsyncSession = Depends(get_async_db),
     username: str = Form(..., description="username"),
     email: str = Form(..., description="email"),
     password: str = Form(..., description="password"),
     user_profile_image: UploadFile = File(None, description="user profile image"),
 ):
-    return signup_admin_user(
+    return await signup_admin_user(
         db=db,
         username=username,
         email=email,
@@ -32,34 +30,33 @@ def signup_admin_user_route(
     
 
 @router.post("/admin/signin", status_code=status.HTTP_200_OK, response_model=UserTokensSchema)
-def signin_admin_user_route(
+async def signin_admin_user_route(
     user_data: SigninAdminUserSchema,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return signin_admin_user(
+    return await signin_admin_user(
         user_data=user_data,
         db=db
     )
     
 
 @router.get("/admin/me", status_code=status.HTTP_200_OK, response_model=CurrentUserSchema)
-def get_current_admin_user_route(
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(admin_oauth)
+async def get_current_admin_user_route(
+    current_user: dict = Depends(get_current_admin_principal)
 ):
-    return get_current_user_handeler(access_token=current_user_token)
+    return current_user
 
 
 
 @router.post("/signup", status_code=status.HTTP_201_CREATED, response_model=DisplayNonAdminUserSchema)
-def signup_nromal_user_route(
-    db: Session = Depends(get_db),
+async def signup_nromal_user_route(
+    db: AsyncSession = Depends(get_async_db),
     username: str = Form(..., description="username"),
     email: str = Form(..., description="email"),
     password: str = Form(..., description="password"),
     user_profile_image: UploadFile = File(None, description="user profile image"),
 ):
-    return signup_user(
+    return await signup_user(
         db=db,
         username=username,
         email=email,
@@ -69,19 +66,40 @@ def signup_nromal_user_route(
     
 
 @router.post("/signin", status_code=status.HTTP_200_OK, response_model=UserTokensSchema)
-def signin_normal_user_route(
+async def signin_normal_user_route(
     user_data: SigninNonAdminUserSchema,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return signin_user(
+    return await signin_user(
         user_data=user_data,
         db=db
     )
 
 
 @router.get("/me", status_code=status.HTTP_200_OK, response_model=CurrentUserSchema)
-def get_current_normal_user_route(
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(user_oauth)
+async def get_current_normal_user_route(
+    current_user: dict = Depends(get_current_user_principal)
+):
+    return current_user
+
+
+@router.post("/refresh", status_code=status.HTTP_200_OK, response_model=UserTokensSchema)
+async def refresh_tokens_route(
+    token_data: RefreshTokenSchema,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return get_current_user_handeler(access_token=current_user_token)
\ No newline at end of file
+    return await rotate_refresh_token(
+        db=db,
+        refresh_token=token_data.refresh_token
+    )
+
+
+@router.post("/logout", status_code=status.HTTP_200_OK)
+async def logout_route(
+    token_data: RefreshTokenSchema,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await sign_out(
+        db=db,
+        refresh_token=token_data.refresh_token
+    )
@@ -67,9 +67,15 @@ class UserTokensSchema(BaseModel):
         from_attributes = True 
         
 
+class RefreshTokenSchema(BaseModel):
+    refresh_token: str = Field(..., description="refresh token from the last sign in or refresh, it can only be used once")
+    
+
 class CurrentUserSchema(BaseModel):
     user_id: str
     username: str 
+    role: Optional[str] = None
+    user_type: Optional[str] = None
     
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,231 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from uuid import uuid4
+from ..database import AsyncLocalSession
+from .models import RefreshTokenModel
+from .jwt_handeler import *
+import asyncio
+import os
+import time
+
+load_dotenv()
+
+AUTH_REVOCATION_SYNC_INTERVAL = float(os.getenv("AUTH_REVOCATION_SYNC_INTERVAL", "5"))
+# revocations are pulled by revoked_at, the overlap covers ones that committed late
+AUTH_REVOCATION_SYNC_OVERLAP = float(os.getenv("AUTH_REVOCATION_SYNC_OVERLAP", "60"))
+AUTH_REFRESH_TOKEN_PURGE_INTERVAL = float(os.getenv("AUTH_REFRESH_TOKEN_PURGE_INTERVAL", "3600"))
+
+# family id -> when the last token it could have issued expires. every revoked family stays in
+# here until then, so a revocation check is a dict lookup on every worker. it is deliberately
+# not size bounded, evicting an entry would let a revoked token back in
+_revoked_families = {}
+_token_registry_stats = { "issued": 0, "rotations": 0, "reuse_detected": 0, "revocations": 0, "rejected": 0 }
+
+
+def _utcnow() -> datetime:
+    # stored without a timezone like every other DateTime column
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _remember_revoked_family(family_id: str, revoked_at: datetime):
+    _revoked_families[family_id] = revoked_at + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
+
+def is_token_family_revoked(family_id: str) -> bool:
+    # tokens from before the registry carry no family and are left to expire
+    if not family_id or family_id not in _revoked_families:
+        return False
+
+    _token_registry_stats["rejected"] += 1
+    return True
+
+
+def _record_refresh_token(db: AsyncSession, user_id: str, family_id: str) -> str:
+    token_id = uuid4().hex
+    db.add(RefreshTokenModel(
+        jti=token_id,
+        family_id=family_id,
+        user_id=user_id,
+        expires_at=_utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token_id
+
+
+async def issue_user_tokens(db: AsyncSession, user_tokens_data: dict) -> dict:
+    # every sign in starts a new family, refreshes keep rotating inside it
+    family_id = uuid4().hex
+    token_id = _record_refresh_token(db, user_tokens_data["sub"], family_id)
+    await db.commit()
+
+    _token_registry_stats["issued"] += 1
+    return generate_user_tokens(user_tokens_data, token_family=family_id, token_id=token_id)
+
+
+async def revoke_token_family(db: AsyncSession, family_id: str):
+    revoked_at = _utcnow()
+    await db.execute(
+        update(RefreshTokenModel)
+        .where(RefreshTokenModel.family_id == family_id, RefreshTokenModel.revoked_at.is_(None))
+        .values(revoked_at=revoked_at)
+    )
+    await db.commit()
+
+    # this worker stops accepting the family right away, the others on their next sync
+    _remember_revoked_family(family_id, revoked_at)
+    _token_registry_stats["revocations"] += 1
+
+
+def _registered_token_ids(decoded_token: dict) -> tuple:
+    family_id, token_id = decoded_token.get("fam"), decoded_token.get("jti")
+    if not family_id or not token_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="This refresh token is too old to be rotated, sign in again"
+        )
+
+    if is_token_family_revoked(family_id):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="This session was signed out, sign in again"
+        )
+
+    return family_id, token_id
+
+
+async def rotate_refresh_token(db: AsyncSession, refresh_token: str) -> dict:
+    decoded_token = decode_refresh_token(refresh_token)
+    family_id, token_id = _registered_token_ids(decoded_token)
+
+    try:
+        # marking the token used is the check: only one refresh can ever flip used_at, so
+        # two requests racing with the same token cannot both get a new pair
+        rotated_token = (await db.execute(
+            update(RefreshTokenModel)
+            .where(
+                RefreshTokenModel.jti == token_id,
+                RefreshTokenModel.used_at.is_(None),
+                RefreshTokenModel.revoked_at.is_(None)
+            )
+            .values(used_at=_utcnow())
+            .returning(RefreshTokenModel.user_id)
+        )).first()
+
+        new_token_id = None
+        if rotated_token is not None:
+            new_token_id = _record_refresh_token(db, rotated_token.user_id, family_id)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        print(f"Unable to rotate the refresh token: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to refresh the token"
+        )
+
+    if new_token_id is None:
+        # a signed token of ours that was already used means a copy of it is out there, so
+        # every token from that sign in goes, whichever side the real user is on
+        await revoke_token_family(db, family_id)
+        _token_registry_stats["reuse_detected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="This refresh token was already used, sign in again"
+        )
+
+    _token_registry_stats["rotations"] += 1
+    return generate_user_tokens(refreshed_token_claims(decoded_token), token_family=family_id, token_id=new_token_id)
+
+
+async def sign_out(db: AsyncSession, refresh_token: str):
+    decoded_token = decode_refresh_token(refresh_token)
+    family_id, _ = _registered_token_ids(decoded_token)
+
+    try:
+        await revoke_token_family(db, family_id)
+
+    except Exception as e:
+        await db.rollback()
+        print(f"Unable to revoke the refresh token family: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to sign out at this time"
+        )
+
+    return { "message": "Signed out" }
+
+
+async def _load_revoked_families(revoked_since: datetime) -> int:
+    async with AsyncLocalSession() as db:
+        revoked_families = (await db.execute(
+            select(RefreshTokenModel.family_id, func.max(RefreshTokenModel.revoked_at))
+            .where(RefreshTokenModel.revoked_at > revoked_since)
+            .group_by(RefreshTokenModel.family_id)
+        )).all()
+
+    for family_id, revoked_at in revoked_families:
+        _remember_revoked_family(family_id, revoked_at)
+
+    return len(revoked_families)
+
+
+async def purge_expired_refresh_tokens() -> int:
+    async with AsyncLocalSession() as db:
+        purged_tokens = await db.execute(delete(RefreshTokenModel).where(RefreshTokenModel.expires_at <= _utcnow()))
+        await db.commit()
+
+    return purged_tokens.rowcount
+
+
+class TokenRevocationSync:
+    def __init__(self, interval: float = AUTH_REVOCATION_SYNC_INTERVAL):
+        self.interval = interval
+        self._sync_task = None
+        self._synced_at = None
+        self._purged_at = 0.0
+
+    async def start(self):
+        # every family revoked recently enough to still have live tokens
+        loaded_at = _utcnow()
+        await _load_revoked_families(loaded_at - timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+        self._synced_at = loaded_at
+        self._sync_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"There was an error trying to sync revoked refresh tokens: {str(e)}")
+
+    async def sync(self):
+        synced_at = _utcnow()
+        await _load_revoked_families(self._synced_at - timedelta(seconds=AUTH_REVOCATION_SYNC_OVERLAP))
+        self._synced_at = synced_at
+
+        for family_id, expires_at in list(_revoked_families.items()):
+            if expires_at <= synced_at:
+                del _revoked_families[family_id]
+
+        if time.monotonic() - self._purged_at >= AUTH_REFRESH_TOKEN_PURGE_INTERVAL:
+            await purge_expired_refresh_tokens()
+            self._purged_at = time.monotonic()
+
+
+def get_token_registry_stats() -> dict:
+    token_registry_stats = dict(_token_registry_stats)
+    token_registry_stats["revoked_families"] = len(_revoked_families)
+    return token_registry_stats
+
+
+token_revocations = TokenRevocationSync()
@@ -0,0 +1,21 @@
+from .ttl_cache import TTLCache
+from .backends import CacheBackend, InMemoryCacheBackend, RedisCacheBackend
+from .tiered import TieredCache
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_REDIS_POOL_SIZE = int(os.getenv("CACHE_REDIS_POOL_SIZE", "10"))
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "1.0"))
+
+
+def build_cache_backend() -> CacheBackend:
+    if CACHE_BACKEND == "memory":
+        return InMemoryCacheBackend()
+    if CACHE_BACKEND == "redis":
+        return RedisCacheBackend(CACHE_REDIS_URL, pool_size=CACHE_REDIS_POOL_SIZE, timeout=CACHE_REDIS_TIMEOUT)
+
+    raise ValueError(f"Unknown CACHE_BACKEND {CACHE_BACKEND}, use memory or redis")
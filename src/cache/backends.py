@@ -0,0 +1,294 @@
+from urllib.parse import urlparse
+from .ttl_cache import TTLCache
+from .resp import RespError, encode_command, read_reply
+from ..responses import EncodedPayload, dumps_json, loads_json
+from datetime import datetime
+import asyncio
+
+
+# a backend is where cache entries live when they have to be visible to every worker,
+# plus the pub/sub channel used to tell the other workers to drop their local copies
+
+class CacheBackend:
+    shared = False
+
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def set(self, key: str, value, ttl: float = None):
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    async def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, callback):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemoryCacheBackend(CacheBackend):
+    shared = False
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._subscribers = {}
+        self._published = 0
+
+    async def get(self, key: str):
+        return self._entries.get(key)
+
+    async def set(self, key: str, value, ttl: float = None):
+        self._entries.set(key, value, ttl=ttl)
+
+    async def delete(self, *keys: str):
+        self._entries.delete(*keys)
+
+    async def delete_prefix(self, prefix: str):
+        self._entries.delete_prefix(prefix)
+
+    async def publish(self, channel: str, message: dict):
+        self._published += 1
+        for callback in list(self._subscribers.get(channel, [])):
+            callback(message)
+
+    async def subscribe(self, channel: str, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    async def close(self):
+        self._subscribers.clear()
+
+    def stats(self) -> dict:
+        backend_stats = self._entries.stats()
+        backend_stats.update({ "backend": "memory", "published": self._published })
+        return backend_stats
+
+
+# values that are already encoded (response bodies) are stored as they are behind a marker byte
+# json text never starts with, everything else goes through the json encoder. encoded payloads
+# put their validators on one json line in front of the body
+
+_RAW_VALUE_MARKER = b"\x00"
+_PAYLOAD_VALUE_MARKER = b"\x01"
+
+
+def _encode_cache_value(value) -> bytes:
+    if isinstance(value, bytes):
+        return _RAW_VALUE_MARKER + value
+    if isinstance(value, EncodedPayload):
+        payload_validators = {
+            "etag": value.etag,
+            "last_modified": value.last_modified.isoformat() if value.last_modified is not None else None
+        }
+        return _PAYLOAD_VALUE_MARKER + dumps_json(payload_validators) + b"\n" + value.body
+    return dumps_json(value)
+
+
+def _decode_cache_value(raw_value: bytes):
+    if raw_value[:1] == _RAW_VALUE_MARKER:
+        return raw_value[1:]
+    if raw_value[:1] == _PAYLOAD_VALUE_MARKER:
+        raw_validators, _, body = raw_value[1:].partition(b"\n")
+        payload_validators = loads_json(raw_validators)
+        last_modified = payload_validators.get("last_modified")
+        return EncodedPayload(
+            body=body,
+            etag=payload_validators["etag"],
+            last_modified=datetime.fromisoformat(last_modified) if last_modified else None
+        )
+    return loads_json(raw_value)
+
+
+class RedisCacheBackend(CacheBackend):
+    shared = True
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 1.0, subscribe_retry_delay: float = 1.0):
+        parsed_url = urlparse(url)
+
+        self.host = parsed_url.hostname or "localhost"
+        self.port = parsed_url.port or 6379
+        self.password = parsed_url.password
+        self.database = int(parsed_url.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.subscribe_retry_delay = subscribe_retry_delay
+
+        self._idle_connections = []
+        self._open_connections = 0
+        self._pool_condition = None
+        self._subscriber_tasks = []
+        self._stats = { "commands": 0, "errors": 0, "published": 0, "messages_received": 0, "subscriber_reconnects": 0, "pool_timeouts": 0 }
+
+    async def _open_connection(self, select_database: bool = True):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await writer.drain()
+            await read_reply(reader)
+        if select_database and self.database:
+            writer.write(encode_command("SELECT", self.database))
+            await writer.drain()
+            await read_reply(reader)
+
+        return reader, writer
+
+    async def _acquire(self):
+        if self._pool_condition is None:
+            self._pool_condition = asyncio.Condition()
+
+        async with self._pool_condition:
+            # a stalled cache server must not hang requests, on timeout the caller falls back
+            # to the local tier and the database like on any other backend error
+            try:
+                await asyncio.wait_for(
+                    self._pool_condition.wait_for(lambda: self._idle_connections or self._open_connections < self.pool_size),
+                    self.timeout
+                )
+            except asyncio.TimeoutError:
+                self._stats["pool_timeouts"] += 1
+                raise
+
+            if self._idle_connections:
+                return self._idle_connections.pop()
+
+            self._open_connections += 1
+
+        try:
+            return await self._open_connection()
+        except Exception:
+            async with self._pool_condition:
+                self._open_connections -= 1
+                self._pool_condition.notify()
+            raise
+
+    async def _release(self, connection, broken: bool = False):
+        async with self._pool_condition:
+            if broken:
+                self._open_connections -= 1
+                connection[1].close()
+            else:
+                self._idle_connections.append(connection)
+            self._pool_condition.notify()
+
+    async def execute(self, *args):
+        connection = await self._acquire()
+        reader, writer = connection
+
+        try:
+            writer.write(encode_command(*args))
+            await writer.drain()
+            reply = await asyncio.wait_for(read_reply(reader), self.timeout)
+
+        except RespError:
+            self._stats["errors"] += 1
+            await self._release(connection)
+            raise
+
+        except BaseException:
+            self._stats["errors"] += 1
+            await self._release(connection, broken=True)
+            raise
+
+        self._stats["commands"] += 1
+        await self._release(connection)
+
+        return reply
+
+    async def get(self, key: str):
+        raw_value = await self.execute("GET", key)
+        if raw_value is None:
+            return None
+
+        return _decode_cache_value(raw_value)
+
+    async def set(self, key: str, value, ttl: float = None):
+        if ttl:
+            await self.execute("SET", key, _encode_cache_value(value), "PX", int(ttl * 1000))
+        else:
+            await self.execute("SET", key, _encode_cache_value(value))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.execute("DEL", *keys)
+
+    async def delete_prefix(self, prefix: str):
+        cursor = b"0"
+        while True:
+            cursor, matching_keys = await self.execute("SCAN", cursor, "MATCH", f"{prefix}*", "COUNT", 1000)
+            if matching_keys:
+                await self.execute("DEL", *matching_keys)
+            if cursor in (b"0", "0"):
+                break
+
+    async def publish(self, channel: str, message: dict):
+        await self.execute("PUBLISH", channel, dumps_json(message))
+        self._stats["published"] += 1
+
+    async def subscribe(self, channel: str, callback):
+        subscribed = asyncio.Event()
+        self._subscriber_tasks.append(asyncio.create_task(self._listen(channel, callback, subscribed)))
+
+        # wait for the first subscription so writes right after startup are not missed,
+        # but do not block startup forever when the cache server is down
+        try:
+            await asyncio.wait_for(subscribed.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"Cache subscriber for {channel} is not connected yet, it will keep retrying")
+
+    async def _listen(self, channel: str, callback, subscribed: asyncio.Event):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open_connection(select_database=False)
+                writer.write(encode_command("SUBSCRIBE", channel))
+                await writer.drain()
+                await read_reply(reader)
+                subscribed.set()
+
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        self._stats["messages_received"] += 1
+                        callback(loads_json(reply[2]))
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                print(f"Cache subscriber for {channel} lost its connection: {str(e)}")
+                self._stats["subscriber_reconnects"] += 1
+                await asyncio.sleep(self.subscribe_retry_delay)
+
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def close(self):
+        for subscriber_task in self._subscriber_tasks:
+            subscriber_task.cancel()
+        self._subscriber_tasks.clear()
+
+        for reader, writer in self._idle_connections:
+            writer.close()
+        self._open_connections -= len(self._idle_connections)
+        self._idle_connections.clear()
+
+    def stats(self) -> dict:
+        backend_stats = dict(self._stats)
+        backend_stats.update({
+            "backend": "redis",
+            "open_connections": self._open_connections,
+            "idle_connections": len(self._idle_connections),
+        })
+        return backend_stats
@@ -0,0 +1,67 @@
+import asyncio
+
+
+# just enough of the redis serialization protocol (RESP2) for the cache backend and the stand-in server
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    encoded_parts = [f"*{len(args)}\r\n".encode("utf-8")]
+
+    for arg in args:
+        if isinstance(arg, bytes):
+            arg_bytes = arg
+        else:
+            arg_bytes = str(arg).encode("utf-8")
+        encoded_parts.append(f"${len(arg_bytes)}\r\n".encode("utf-8") + arg_bytes + b"\r\n")
+
+    return b"".join(encoded_parts)
+
+
+def encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return f"-{value}\r\n".encode("utf-8")
+    if isinstance(value, bool):
+        return f":{int(value)}\r\n".encode("utf-8")
+    if isinstance(value, int):
+        return f":{value}\r\n".encode("utf-8")
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode("utf-8")
+    if isinstance(value, bytes):
+        return f"${len(value)}\r\n".encode("utf-8") + value + b"\r\n"
+    if isinstance(value, (list, tuple)):
+        return f"*{len(value)}\r\n".encode("utf-8") + b"".join(encode_reply(item) for item in value)
+
+    raise TypeError(f"Cannot encode {type(value).__name__} as a RESP reply")
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the cache server")
+
+    prefix, payload = line[:1], line[1:-2]
+
+    if prefix == b"+":
+        return payload.decode("utf-8")
+    if prefix == b"-":
+        raise RespError(payload.decode("utf-8"))
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+
+    raise RespError(f"Unexpected reply from the cache server: {line!r}")
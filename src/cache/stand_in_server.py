@@ -0,0 +1,146 @@
+from fnmatch import fnmatchcase
+from .resp import RespError, encode_reply, read_reply
+import argparse
+import asyncio
+import time
+
+
+# small in-process server that speaks the subset of the redis protocol the cache backend
+# uses (strings with expiry, SCAN, pub/sub), so the shared cache can be run and tested
+# offline without a real redis:  python -m src.cache.stand_in_server --port 6399
+
+class StandInRedisServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 6399):
+        self.host = host
+        self.port = port
+        self._values = {}
+        self._expires_at = {}
+        self._channels = {}
+        self._clients = {}
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+
+        # closing the transports lets every client handler see eof and return on its own
+        client_tasks = list(self._clients)
+        for client_writer in self._clients.values():
+            client_writer.close()
+        if client_tasks:
+            await asyncio.gather(*client_tasks, return_exceptions=True)
+
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    def _is_live(self, key: bytes) -> bool:
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires_at.pop(key, None)
+        return key in self._values
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed_channels = set()
+        self._clients[asyncio.current_task()] = writer
+
+        try:
+            while True:
+                try:
+                    command = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    break
+
+                command_name = command[0].upper().decode("utf-8")
+                arguments = command[1:]
+
+                if command_name == "SUBSCRIBE":
+                    for channel in arguments:
+                        self._channels.setdefault(channel, set()).add(writer)
+                        subscribed_channels.add(channel)
+                        writer.write(encode_reply([b"subscribe", channel, len(subscribed_channels)]))
+                else:
+                    try:
+                        writer.write(encode_reply(self._run_command(command_name, arguments)))
+                    except RespError as e:
+                        writer.write(encode_reply(e))
+
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            self._clients.pop(asyncio.current_task(), None)
+            for channel in subscribed_channels:
+                self._channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    def _run_command(self, command_name: str, arguments: list):
+        if command_name in ("PING",):
+            return "PONG"
+        if command_name in ("AUTH", "SELECT"):
+            return "OK"
+        if command_name == "GET":
+            return self._values.get(arguments[0]) if self._is_live(arguments[0]) else None
+        if command_name == "SET":
+            key, value = arguments[0], arguments[1]
+            self._values[key] = value
+            self._expires_at.pop(key, None)
+            options = [option.upper() for option in arguments[2:]]
+            if b"PX" in options:
+                self._expires_at[key] = time.monotonic() + int(arguments[2 + options.index(b"PX") + 1]) / 1000
+            if b"EX" in options:
+                self._expires_at[key] = time.monotonic() + int(arguments[2 + options.index(b"EX") + 1])
+            return "OK"
+        if command_name == "DEL":
+            deleted = 0
+            for key in arguments:
+                if self._is_live(key):
+                    deleted += 1
+                self._values.pop(key, None)
+                self._expires_at.pop(key, None)
+            return deleted
+        if command_name == "SCAN":
+            # a single pass is fine at stand-in sizes, so the cursor always comes back as 0
+            pattern = b"*"
+            options = [option.upper() for option in arguments[1:]]
+            if b"MATCH" in options:
+                pattern = arguments[1 + options.index(b"MATCH") + 1]
+            matching_keys = [
+                key for key in list(self._values)
+                if self._is_live(key) and fnmatchcase(key.decode("utf-8"), pattern.decode("utf-8"))
+            ]
+            return [b"0", matching_keys]
+        if command_name == "FLUSHDB":
+            self._values.clear()
+            self._expires_at.clear()
+            return "OK"
+        if command_name == "PUBLISH":
+            channel, message = arguments[0], arguments[1]
+            subscribers = list(self._channels.get(channel, ()))
+            for subscriber in subscribers:
+                subscriber.write(encode_reply([b"message", channel, message]))
+            return len(subscribers)
+
+        raise RespError(f"ERR unknown command '{command_name}'")
+
+
+async def _serve(host: str, port: int):
+    server = await StandInRedisServer(host=host, port=port).start()
+    print(f"Stand-in cache server listening on {server.host}:{server.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stand-in cache server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    cli_args = parser.parse_args()
+
+    asyncio.run(_serve(cli_args.host, cli_args.port))
@@ -0,0 +1,104 @@
+from uuid import uuid4
+from .ttl_cache import TTLCache
+from .backends import CacheBackend
+
+
+# per worker lru in front of a backend shared by every worker. writes go through
+# invalidate(), which clears the shared copy and publishes the keys so the other
+# workers drop their local copies as soon as the message arrives
+
+class TieredCache:
+    def __init__(self, namespace: str, local: TTLCache, backend: CacheBackend):
+        self.namespace = namespace
+        self.local = local
+        self.backend = backend
+        self.channel = f"{namespace}:invalidate"
+        self.origin = uuid4().hex
+        self._stats = { "backend_hits": 0, "backend_errors": 0, "remote_invalidations": 0 }
+
+    def _backend_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def start(self):
+        try:
+            await self.backend.subscribe(self.channel, self._on_invalidation)
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            print(f"Unable to subscribe to cache invalidations for {self.namespace}: {str(e)}")
+
+    async def close(self):
+        await self.backend.close()
+
+    async def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None or not self.backend.shared:
+            return value
+
+        # the shared tier is an optimisation, when it is down we fall through to the database
+        try:
+            value = await self.backend.get(self._backend_key(key))
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            print(f"Unable to read {key} from the shared cache: {str(e)}")
+            return None
+
+        if value is not None:
+            self._stats["backend_hits"] += 1
+            self.local.set(key, value)
+
+        return value
+
+    async def set(self, key: str, value):
+        self.local.set(key, value)
+
+        if not self.backend.shared:
+            return
+
+        try:
+            await self.backend.set(self._backend_key(key), value, ttl=self.local.ttl)
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            print(f"Unable to write {key} to the shared cache: {str(e)}")
+
+    async def invalidate(self, keys: tuple = (), prefixes: tuple = ()):
+        self._drop_local(keys, prefixes)
+
+        try:
+            if self.backend.shared:
+                await self.backend.delete(*[self._backend_key(key) for key in keys])
+                for prefix in prefixes:
+                    await self.backend.delete_prefix(self._backend_key(prefix))
+
+            await self.backend.publish(self.channel, {
+                "origin": self.origin,
+                "keys": list(keys),
+                "prefixes": list(prefixes)
+            })
+
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            print(f"Unable to publish the cache invalidation for {self.namespace}: {str(e)}")
+
+    def invalidate_local(self, keys: tuple = (), prefixes: tuple = ()):
+        # only this worker's copies, for when the shared invalidation is sent later
+        self._drop_local(keys, prefixes)
+
+    def _drop_local(self, keys, prefixes):
+        if keys:
+            self.local.delete(*keys)
+        for prefix in prefixes:
+            self.local.delete_prefix(prefix)
+
+    def _on_invalidation(self, message: dict):
+        if message.get("origin") == self.origin:
+            return
+
+        self._stats["remote_invalidations"] += 1
+        self._drop_local(message.get("keys", ()), message.get("prefixes", ()))
+
+    def stats(self) -> dict:
+        return {
+            "local": self.local.stats(),
+            "backend": self.backend.stats(),
+            **self._stats
+        }
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+# bounded lru cache where every entry also expires after ttl seconds, safe to share
+# between the event loop and threadpool workers
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = { "hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0 }
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (value, expires_at)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._stats["invalidations"] += 1
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            matching_keys = [key for key in self._entries if isinstance(key, str) and key.startswith(prefix)]
+            for key in matching_keys:
+                del self._entries[key]
+            self._stats["invalidations"] += len(matching_keys)
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            cache_stats = dict(self._stats)
+            cache_stats["size"] = len(self._entries)
+            cache_stats["maxsize"] = self.maxsize
+
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        cache_stats["hit_ratio"] = round(cache_stats["hits"] / lookups, 4) if lookups else 0.0
+
+        return cache_stats
@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from dotenv import load_dotenv
 import os 
+import threading
 
 load_dotenv()
 
@@ -10,12 +12,139 @@ if not DATABASE_URL:
     raise ValueError("Unable to get the database url and load it")
 
 
+# the async engine needs an async driver, so unless ASYNC_DATABASE_URL is set we
+# swap the driver on DATABASE_URL for asyncpg (postgres) or aiosqlite (sqlite)
+
+def _build_async_database_url(database_url: str) -> str:
+    scheme, _, rest = database_url.partition("://")
+    driver_name = scheme.split("+")[0]
+    
+    if driver_name in ("postgres", "postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    if driver_name == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    
+    raise ValueError(f"No async driver configured for the {driver_name} database, set ASYNC_DATABASE_URL")
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _build_async_database_url(DATABASE_URL)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+DB_ECHO = _env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+
+def _build_engine_options(database_url: str) -> dict:
+    driver_name = database_url.partition("://")[0]
+    
+    engine_options = {
+        "echo": DB_ECHO,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    
+    # sqlite picks its own pool class (singleton/static for in memory databases) which
+    # does not take sizing arguments, and it has no server side statement timeout
+    if driver_name.startswith("sqlite"):
+        return engine_options
+    
+    engine_options.update({
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    })
+    
+    if DB_STATEMENT_TIMEOUT_MS > 0 and driver_name.startswith("postgres"):
+        if driver_name.endswith("asyncpg"):
+            engine_options["connect_args"] = { "server_settings": { "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS) } }
+        else:
+            engine_options["connect_args"] = { "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}" }
+            
+    return engine_options
+
+
+# pool counters so we can see checkouts piling up before the pool runs dry
+
+_pool_stats_lock = threading.Lock()
+_pool_stats = {}
+
+
+def _track_pool_events(engine_name: str, tracked_engine):
+    counters = { "connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0, "checked_out": 0, "max_checked_out": 0 }
+    _pool_stats[engine_name] = (tracked_engine, counters)
+    
+    @event.listens_for(tracked_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        with _pool_stats_lock:
+            counters["connects"] += 1
+            
+    @event.listens_for(tracked_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _pool_stats_lock:
+            counters["checkouts"] += 1
+            counters["checked_out"] += 1
+            counters["max_checked_out"] = max(counters["max_checked_out"], counters["checked_out"])
+            
+    @event.listens_for(tracked_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        with _pool_stats_lock:
+            counters["checkins"] += 1
+            counters["checked_out"] = max(counters["checked_out"] - 1, 0)
+            
+    @event.listens_for(tracked_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        with _pool_stats_lock:
+            counters["invalidations"] += 1
+            
+
+def get_pool_stats() -> dict:
+    all_pool_stats = {}
+    
+    with _pool_stats_lock:
+        for engine_name, (tracked_engine, counters) in _pool_stats.items():
+            engine_pool_stats = dict(counters)
+            pool = tracked_engine.pool
+            
+            # only queue pools have a fixed size and an overflow
+            if hasattr(pool, "overflow"):
+                engine_pool_stats.update({
+                    "pool_size": pool.size(),
+                    "overflow": pool.overflow(),
+                    "max_overflow": DB_MAX_OVERFLOW,
+                    "idle": pool.checkedin(),
+                })
+                
+            all_pool_stats[engine_name] = engine_pool_stats
+            
+    return all_pool_stats
+
+
 Base = declarative_base()
 
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, **_build_engine_options(DATABASE_URL))
 
 LocalSession = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_build_engine_options(ASYNC_DATABASE_URL))
+
+_track_pool_events("sync", engine)
+_track_pool_events("async", async_engine.sync_engine)
+
+AsyncLocalSession = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = LocalSession()
     try:
@@ -23,4 +152,9 @@ def get_db():
     finally:
         db.close()
         
-        
\ No newline at end of file
+
+async def get_async_db():
+    async with AsyncLocalSession() as db:
+        yield db
+        
+        
@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, delete, and_
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+from ..database import AsyncLocalSession
+from ..cache import TTLCache
+from ..responses import RawJSONResponse, dumps_json
+from .models import IdempotencyKeyModel
+import asyncio
+import hashlib
+import os
+
+load_dotenv()
+
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_IN_PROGRESS_TIMEOUT = float(os.getenv("IDEMPOTENCY_IN_PROGRESS_TIMEOUT", "60"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "300"))
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+# completed responses by "<scope>:<user id>:<key>", the table is the source of truth across workers
+_completed_responses = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_KEY_TTL)
+_idempotency_stats = { "executed": 0, "replayed": 0, "conflicts": 0, "swept": 0 }
+
+
+@dataclass
+class IdempotentResponse:
+    status_code: int
+    body: bytes
+    replayed: bool = False
+
+    def to_response(self) -> RawJSONResponse:
+        response_headers = { "Idempotent-Replayed": "true" } if self.replayed else None
+        return RawJSONResponse(self.body, status_code=self.status_code, headers=response_headers)
+
+
+def request_fingerprint(*request_parts) -> str:
+    return hashlib.sha256(dumps_json([str(request_part) for request_part in request_parts])).hexdigest()
+
+
+def _utcnow() -> datetime:
+    # stored without a timezone like every other DateTime column
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _check_fingerprint(fingerprint: str, stored_fingerprint: str):
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="This Idempotency-Key was already used for a different request"
+        )
+
+
+def _replay(cache_key: str, fingerprint: str, stored_fingerprint: str, response_status: int, response_body: bytes) -> IdempotentResponse:
+    _check_fingerprint(fingerprint, stored_fingerprint)
+    _completed_responses.set(cache_key, (stored_fingerprint, response_status, response_body))
+    _idempotency_stats["replayed"] += 1
+    return IdempotentResponse(status_code=response_status, body=response_body, replayed=True)
+
+
+async def _claim_key(scope: str, user_id: str, idempotency_key: str, fingerprint: str):
+    # the primary key insert is the lock: exactly one request gets to run the handler,
+    # everyone else finds the row and either replays it or is told to come back later
+    async with AsyncLocalSession() as db:
+        for _ in range(2):
+            db.add(IdempotencyKeyModel(
+                scope=scope,
+                user_id=user_id,
+                key=idempotency_key,
+                fingerprint=fingerprint,
+                expires_at=_utcnow() + timedelta(seconds=IDEMPOTENCY_IN_PROGRESS_TIMEOUT)
+            ))
+            try:
+                await db.commit()
+                return None
+            except IntegrityError:
+                await db.rollback()
+
+            existing_key = (await db.execute(select(IdempotencyKeyModel).where(and_(
+                IdempotencyKeyModel.scope == scope,
+                IdempotencyKeyModel.user_id == user_id,
+                IdempotencyKeyModel.key == idempotency_key
+            )))).scalar_one_or_none()
+
+            if existing_key is None:
+                continue
+
+            # an expired record (or a claim left behind by a crashed request) is taken over
+            if existing_key.expires_at <= _utcnow():
+                await db.delete(existing_key)
+                await db.commit()
+                continue
+
+            # a different request reusing the key is told so whether or not the first one finished
+            _check_fingerprint(fingerprint, existing_key.fingerprint)
+            return existing_key
+
+    return None
+
+
+async def _complete_key(scope: str, user_id: str, idempotency_key: str, response_status: int, response_body: bytes):
+    async with AsyncLocalSession() as db:
+        await db.execute(
+            update(IdempotencyKeyModel)
+            .where(and_(
+                IdempotencyKeyModel.scope == scope,
+                IdempotencyKeyModel.user_id == user_id,
+                IdempotencyKeyModel.key == idempotency_key
+            ))
+            .values(
+                status="completed",
+                response_status=response_status,
+                response_body=response_body,
+                expires_at=_utcnow() + timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+            )
+        )
+        await db.commit()
+
+
+async def _release_key(scope: str, user_id: str, idempotency_key: str):
+    async with AsyncLocalSession() as db:
+        await db.execute(
+            delete(IdempotencyKeyModel)
+            .where(and_(
+                IdempotencyKeyModel.scope == scope,
+                IdempotencyKeyModel.user_id == user_id,
+                IdempotencyKeyModel.key == idempotency_key,
+                IdempotencyKeyModel.status == "in_progress"
+            ))
+        )
+        await db.commit()
+
+
+# runs handler once per (scope, user, key) and hands every retry the stored response. only
+# successful responses are stored, a failed attempt releases the key so the retry runs for real
+
+async def run_idempotent(
+    scope: str,
+    user_id: str,
+    idempotency_key: str,
+    fingerprint: str,
+    handler,
+    serialize,
+    status_code: int
+) -> IdempotentResponse:
+    if idempotency_key is None:
+        return IdempotentResponse(status_code=status_code, body=dumps_json(serialize(await handler())))
+
+    if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key has to be between 1 and {IDEMPOTENCY_MAX_KEY_LENGTH} characters"
+        )
+
+    cache_key = f"{scope}:{user_id}:{idempotency_key}"
+    completed_response = _completed_responses.get(cache_key)
+    if completed_response is not None:
+        return _replay(cache_key, fingerprint, *completed_response)
+
+    existing_key = await _claim_key(scope, user_id, idempotency_key, fingerprint)
+    if existing_key is not None:
+        if existing_key.status == "completed":
+            return _replay(cache_key, fingerprint, existing_key.fingerprint, existing_key.response_status, existing_key.response_body)
+
+        _idempotency_stats["conflicts"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still being processed",
+            headers={ "Retry-After": "1" }
+        )
+
+    try:
+        response_body = dumps_json(serialize(await handler()))
+    except BaseException:
+        await _release_key(scope, user_id, idempotency_key)
+        raise
+
+    _idempotency_stats["executed"] += 1
+
+    # the write already happened, failing to record it only costs the replay
+    try:
+        await _complete_key(scope, user_id, idempotency_key, status_code, response_body)
+        _completed_responses.set(cache_key, (fingerprint, status_code, response_body))
+    except Exception as e:
+        print(f"Unable to record the response for Idempotency-Key {idempotency_key}: {str(e)}")
+
+    return IdempotentResponse(status_code=status_code, body=response_body)
+
+
+async def purge_expired_idempotency_keys() -> int:
+    async with AsyncLocalSession() as db:
+        purged_keys = await db.execute(delete(IdempotencyKeyModel).where(IdempotencyKeyModel.expires_at <= _utcnow()))
+        await db.commit()
+
+    _idempotency_stats["swept"] += purged_keys.rowcount
+    return purged_keys.rowcount
+
+
+class IdempotencyKeySweeper:
+    def __init__(self, interval: float = IDEMPOTENCY_SWEEP_INTERVAL):
+        self.interval = interval
+        self._sweeper_task = None
+
+    async def start(self):
+        self._sweeper_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            await asyncio.gather(self._sweeper_task, return_exceptions=True)
+            self._sweeper_task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await purge_expired_idempotency_keys()
+            except Exception as e:
+                print(f"There was an error trying to purge expired idempotency keys: {str(e)}")
+
+
+def get_idempotency_stats() -> dict:
+    idempotency_stats = dict(_idempotency_stats)
+    idempotency_stats["cached"] = _completed_responses.stats()["size"]
+    return idempotency_stats
+
+
+idempotency_key_sweeper = IdempotencyKeySweeper()
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, DateTime, Integer, LargeBinary, Index
+from datetime import datetime, timezone
+from ..database import Base
+
+class IdempotencyKeyModel(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        # the sweeper deletes by expiry
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+    
+    scope = Column(String, primary_key=True)
+    user_id = Column(String, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(String, nullable=False, default="in_progress")
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    date_created = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False)
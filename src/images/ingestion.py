@@ -0,0 +1,261 @@
+from dataclasses import dataclass, field, asdict
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, inspect as sa_inspect
+from dotenv import load_dotenv
+from uuid import uuid4
+from ..database import AsyncLocalSession, Base
+from ..cache import TTLCache
+from ..outbox.dispatcher import add_outbox_event, outbox_handler
+from .models import ImageAssetModel
+from .storage import StorageProvider, build_storage_provider
+from .uploads import stream_upload_to_path
+import asyncio
+import os
+import tempfile
+
+load_dotenv()
+
+IMAGE_STAGING_DIR = os.getenv("IMAGE_STAGING_DIR", os.path.join(tempfile.gettempdir(), "ecom_image_staging"))
+PENDING_IMAGE_BASE_URL = os.getenv("PENDING_IMAGE_BASE_URL", "/media/pending")
+# uploads pushed to the storage provider at the same time, across every batch the outbox hands over
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", "4"))
+IMAGE_DIGEST_CACHE_SIZE = int(os.getenv("IMAGE_DIGEST_CACHE_SIZE", "50000"))
+IMAGE_DIGEST_CACHE_TTL = float(os.getenv("IMAGE_DIGEST_CACHE_TTL", "86400"))
+
+os.makedirs(IMAGE_STAGING_DIR, exist_ok=True)
+
+IMAGE_UPLOAD_TOPIC = "images.upload"
+
+
+@dataclass
+class StagedImage:
+    path: str
+    filename: str
+    pending_url: str
+    sha256: str = None
+    content_type: str = None
+    size: int = 0
+    stored_url: str = None
+
+    # what goes on the row: the final url when the same bytes were stored before, else the pending one
+    @property
+    def url(self) -> str:
+        return self.stored_url or self.pending_url
+
+
+@dataclass
+class ImageUploadJob:
+    staged_image: StagedImage
+    target_column: object
+    # (topic, payload) outbox events written in the same transaction as the url swap
+    follow_up_events: list = field(default_factory=list)
+
+
+_image_upload_stats = { "uploaded": 0, "deduplicated": 0, "failed": 0, "orphaned": 0 }
+
+# sha256 -> stored url for images we already pushed to the storage provider, the table is the
+# source of truth and this cache keeps repeat lookups off the database
+_image_url_by_digest = TTLCache(maxsize=IMAGE_DIGEST_CACHE_SIZE, ttl=IMAGE_DIGEST_CACHE_TTL)
+
+
+async def lookup_stored_image_url(sha256: str):
+    stored_url = _image_url_by_digest.get(sha256)
+    if stored_url is not None:
+        return stored_url
+
+    async with AsyncLocalSession() as db:
+        stored_url = (await db.execute(select(ImageAssetModel.url).where(ImageAssetModel.sha256 == sha256))).scalar_one_or_none()
+
+    if stored_url is not None:
+        _image_url_by_digest.set(sha256, stored_url)
+
+    return stored_url
+
+
+async def record_stored_image(staged_image, image_url: str):
+    async with AsyncLocalSession() as db:
+        await db.merge(ImageAssetModel(
+            sha256=staged_image.sha256,
+            url=image_url,
+            content_type=staged_image.content_type,
+            size=staged_image.size
+        ))
+        await db.commit()
+
+    _image_url_by_digest.set(staged_image.sha256, image_url)
+
+
+# requests only copy the upload into the staging dir and save the pending url on the row,
+# the push to the storage provider happens later when the outbox delivers the upload event
+
+async def stage_image(image_file: UploadFile) -> StagedImage:
+    staged_name = uuid4().hex
+    staging_path = os.path.join(IMAGE_STAGING_DIR, f"{staged_name}.part")
+
+    streamed_upload = await stream_upload_to_path(image_file, staging_path)
+
+    # the extension comes from the sniffed content, not from whatever the client called the file
+    filename = f"{staged_name}{streamed_upload.extension}"
+    staged_path = os.path.join(IMAGE_STAGING_DIR, filename)
+    os.replace(staging_path, staged_path)
+
+    staged_image = StagedImage(
+        path=staged_path,
+        filename=filename,
+        pending_url=f"{PENDING_IMAGE_BASE_URL}/{filename}",
+        sha256=streamed_upload.sha256,
+        content_type=streamed_upload.content_type,
+        size=streamed_upload.size
+    )
+
+    staged_image.stored_url = await lookup_stored_image_url(staged_image.sha256)
+    if staged_image.stored_url is not None:
+        discard_staged_image(staged_image)
+
+    return staged_image
+
+
+def discard_staged_image(staged_image: StagedImage):
+    try:
+        os.remove(staged_image.path)
+    except FileNotFoundError:
+        pass
+
+
+class ImageUploader:
+    def __init__(self, concurrency: int = IMAGE_UPLOAD_CONCURRENCY):
+        self._storage_provider = None
+        self._upload_slots = asyncio.Semaphore(concurrency)
+        self._digest_locks = {}
+        self._digest_lock_users = {}
+
+    @property
+    def storage_provider(self) -> StorageProvider:
+        if self._storage_provider is None:
+            self._storage_provider = build_storage_provider()
+        return self._storage_provider
+
+    async def process(self, staged_image: StagedImage, target_column, follow_up_events=()):
+        # one attempt per delivery, a failure raises and the outbox retries the event with its backoff
+        async with self._upload_slots:
+            await self._process(ImageUploadJob(staged_image=staged_image, target_column=target_column, follow_up_events=list(follow_up_events)))
+
+    def _upload_staged_image(self, staged_image: StagedImage) -> str:
+        with open(staged_image.path, "rb") as staged_file:
+            return self.storage_provider.upload(staged_file, staged_image.filename)
+
+    async def _process(self, upload_job: ImageUploadJob):
+        staged_image = upload_job.staged_image
+
+        # jobs for the same bytes queue up behind each other, so only the first one uploads
+        # and the rest pick its url up from the digest index
+        digest_lock = self._digest_locks.setdefault(staged_image.sha256, asyncio.Lock())
+        self._digest_lock_users[staged_image.sha256] = self._digest_lock_users.get(staged_image.sha256, 0) + 1
+        try:
+            async with digest_lock:
+                image_url = await lookup_stored_image_url(staged_image.sha256)
+                if image_url is not None:
+                    _image_upload_stats["deduplicated"] += 1
+                else:
+                    try:
+                        image_url = await run_in_threadpool(self._upload_staged_image, staged_image)
+                    except Exception:
+                        _image_upload_stats["failed"] += 1
+                        raise
+                    _image_upload_stats["uploaded"] += 1
+
+                    # losing the index entry only costs a future duplicate upload, the row still gets its url
+                    try:
+                        await record_stored_image(staged_image, image_url)
+                    except Exception as e:
+                        print(f"Unable to record the stored image {staged_image.sha256}: {str(e)}")
+        finally:
+            self._digest_lock_users[staged_image.sha256] -= 1
+            if self._digest_lock_users[staged_image.sha256] == 0:
+                del self._digest_lock_users[staged_image.sha256]
+                del self._digest_locks[staged_image.sha256]
+
+        await self._swap_pending_url(upload_job, image_url)
+
+    async def _swap_pending_url(self, upload_job: ImageUploadJob, image_url: str):
+        staged_image = upload_job.staged_image
+
+        # only swap rows that still point at the pending url, an edit in the meantime wins
+        target_column = upload_job.target_column
+        swapped_values = { target_column.key: image_url }
+
+        # the row changed, so versioned rows move on and stale If-Match headers stop matching
+        version_column = sa_inspect(target_column.class_).version_id_col
+        if version_column is not None:
+            swapped_values[version_column.key] = version_column + 1
+
+        async with AsyncLocalSession() as db:
+            updated_rows = await db.execute(
+                update(target_column.class_)
+                .where(target_column == staged_image.pending_url)
+                .values(swapped_values)
+            )
+            if updated_rows.rowcount:
+                for follow_up_topic, follow_up_payload in upload_job.follow_up_events:
+                    add_outbox_event(db, follow_up_topic, follow_up_payload)
+            await db.commit()
+
+        if updated_rows.rowcount == 0:
+            _image_upload_stats["orphaned"] += 1
+
+        discard_staged_image(staged_image)
+
+
+image_uploader = ImageUploader()
+
+
+# writes queue their uploads in the outbox instead of pushing them straight away, so an
+# upload is never lost to a crash between the commit and the push. the staged file only
+# exists on this node, so the event is node local and only this node's dispatcher takes it
+
+def _image_target(target_column) -> str:
+    return f"{target_column.class_.__tablename__}.{target_column.key}"
+
+
+def _resolve_image_target(image_target: str):
+    table_name, column_key = image_target.split(".", 1)
+    for mapper in Base.registry.mappers:
+        if mapper.local_table.name == table_name:
+            return getattr(mapper.class_, column_key)
+
+    raise LookupError(f"No model for the image target {image_target}")
+
+
+def queue_image_upload(db, staged_image: StagedImage, target_column, follow_up_events=()):
+    if staged_image.stored_url is not None:
+        _image_upload_stats["deduplicated"] += 1
+        return
+
+    add_outbox_event(db, IMAGE_UPLOAD_TOPIC, {
+        "staged_image": asdict(staged_image),
+        "target": _image_target(target_column),
+        "follow_up_events": [list(follow_up_event) for follow_up_event in follow_up_events]
+    }, node_local=True)
+
+
+@outbox_handler(IMAGE_UPLOAD_TOPIC)
+async def _deliver_image_uploads(payloads: list):
+    # a retried batch redoes the uploads that went through, the digest index turns those
+    # into lookups and the swap only matches rows still on the pending url
+    upload_results = await asyncio.gather(*[
+        image_uploader.process(
+            StagedImage(**payload["staged_image"]),
+            _resolve_image_target(payload["target"]),
+            follow_up_events=[tuple(follow_up_event) for follow_up_event in payload["follow_up_events"]]
+        )
+        for payload in payloads
+    ], return_exceptions=True)
+
+    upload_errors = [upload_result for upload_result in upload_results if isinstance(upload_result, Exception)]
+    if upload_errors:
+        raise upload_errors[0]
+
+
+def get_image_upload_stats() -> dict:
+    return dict(_image_upload_stats)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from datetime import datetime, timezone
+from ..database import Base
+
+class ImageAssetModel(Base):
+    __tablename__ = "image_assets"
+    
+    sha256 = Column(String(64), primary_key=True)
+    url = Column(String, nullable=False)
+    content_type = Column(String, nullable=True)
+    size = Column(Integer, nullable=True)
+    date_created = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,81 @@
+from dotenv import load_dotenv
+from typing import BinaryIO
+import os
+import shutil
+
+load_dotenv()
+
+IMAGE_STORAGE_PROVIDER = os.getenv("IMAGE_STORAGE_PROVIDER", "cloudinary")
+IMAGE_LOCAL_STORAGE_DIR = os.getenv("IMAGE_LOCAL_STORAGE_DIR", os.path.join("media", "images"))
+IMAGE_LOCAL_BASE_URL = os.getenv("IMAGE_LOCAL_BASE_URL", "/media/images")
+
+
+# a storage provider takes a file that is already on local disk and returns its public url,
+# uploads are blocking calls and always run on a worker, never on the event loop
+
+class StorageProvider:
+    name = "base"
+
+    def upload(self, image_file: BinaryIO, filename: str) -> str:
+        raise NotImplementedError
+
+
+class CloudinaryStorageProvider(StorageProvider):
+    name = "cloudinary"
+
+    def __init__(self):
+        import cloudinary
+        import cloudinary.uploader
+
+        cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+        api_key = os.getenv("CLOUDINARY_API_KEY")
+        api_secret = os.getenv("CLOUDINARY_API_SECRET")
+
+        if not cloud_name or not api_key or not api_secret:
+            raise ValueError("Unable to load cloudinary config variables to connect to it")
+
+        cloudinary.config(
+            cloud_name = cloud_name,
+            api_key = api_key,
+            api_secret = api_secret
+        )
+        self._uploader = cloudinary.uploader
+
+    def upload(self, image_file: BinaryIO, filename: str) -> str:
+        uploaded_file = self._uploader.upload(
+            image_file,
+            public_id=os.path.splitext(filename)[0],
+            use_filename=True,
+            unique_filename=True
+        )
+
+        return uploaded_file["secure_url"]
+
+
+class LocalFileSystemStorageProvider(StorageProvider):
+    name = "local"
+
+    def __init__(self, root_dir: str = IMAGE_LOCAL_STORAGE_DIR, base_url: str = IMAGE_LOCAL_BASE_URL):
+        self.root_dir = root_dir
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def upload(self, image_file: BinaryIO, filename: str) -> str:
+        stored_path = os.path.join(self.root_dir, filename)
+        temporary_path = stored_path + ".part"
+
+        # write next to the final name and rename, so a retried upload never leaves half a file behind
+        with open(temporary_path, "wb") as stored_file:
+            shutil.copyfileobj(image_file, stored_file)
+        os.replace(temporary_path, stored_path)
+
+        return f"{self.base_url}/{filename}"
+
+
+def build_storage_provider() -> StorageProvider:
+    if IMAGE_STORAGE_PROVIDER == "cloudinary":
+        return CloudinaryStorageProvider()
+    if IMAGE_STORAGE_PROVIDER == "local":
+        return LocalFileSystemStorageProvider()
+
+    raise ValueError(f"Unknown IMAGE_STORAGE_PROVIDER {IMAGE_STORAGE_PROVIDER}, use cloudinary or local")
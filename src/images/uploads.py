@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from fastapi import HTTPException, status, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+import hashlib
+import os
+
+load_dotenv()
+
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+IMAGE_UPLOAD_CHUNK_SIZE = int(os.getenv("IMAGE_UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+# (content type, extension) for the leading bytes of each image format we accept
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ("image/jpeg", ".jpg")),
+    (b"\x89PNG\r\n\x1a\n", ("image/png", ".png")),
+    (b"GIF87a", ("image/gif", ".gif")),
+    (b"GIF89a", ("image/gif", ".gif")),
+)
+
+
+@dataclass
+class StreamedUpload:
+    size: int
+    sha256: str
+    content_type: str
+    extension: str
+
+
+def sniff_image_type(header_bytes: bytes):
+    for signature, image_type in _IMAGE_SIGNATURES:
+        if header_bytes.startswith(signature):
+            return image_type
+
+    if header_bytes[:4] == b"RIFF" and header_bytes[8:12] == b"WEBP":
+        return ("image/webp", ".webp")
+
+    return None
+
+
+class _UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _stream_upload_to_path(image_file: UploadFile, destination_path: str, max_bytes: int) -> StreamedUpload:
+    upload_hash = hashlib.sha256()
+    upload_size = 0
+    image_type = None
+
+    image_file.file.seek(0)
+
+    with open(destination_path, "wb") as destination_file:
+        while True:
+            chunk = image_file.file.read(IMAGE_UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            if image_type is None:
+                image_type = sniff_image_type(chunk[:16])
+                if image_type is None:
+                    raise _UploadRejected(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Only jpeg, png, gif and webp images are allowed")
+
+            upload_size += len(chunk)
+            if upload_size > max_bytes:
+                raise _UploadRejected(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"Images cannot be bigger than {max_bytes} bytes")
+
+            upload_hash.update(chunk)
+            destination_file.write(chunk)
+
+    if image_type is None:
+        raise _UploadRejected(status.HTTP_400_BAD_REQUEST, "The uploaded image is empty")
+
+    return StreamedUpload(
+        size=upload_size,
+        sha256=upload_hash.hexdigest(),
+        content_type=image_type[0],
+        extension=image_type[1]
+    )
+
+
+# copies the upload to disk one chunk at a time, checking the magic bytes on the first chunk,
+# stopping as soon as the size limit is crossed and hashing as it goes, so the body is never
+# held in memory and never read twice
+
+async def stream_upload_to_path(
+    image_file: UploadFile,
+    destination_path: str,
+    max_bytes: int = IMAGE_MAX_UPLOAD_BYTES
+) -> StreamedUpload:
+    try:
+        return await run_in_threadpool(_stream_upload_to_path, image_file, destination_path, max_bytes)
+
+    except _UploadRejected as e:
+        _remove_partial_file(destination_path)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    except Exception:
+        _remove_partial_file(destination_path)
+        raise
+
+
+def _remove_partial_file(destination_path: str):
+    try:
+        os.remove(destination_path)
+    except FileNotFoundError:
+        pass
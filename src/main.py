@@ -1,12 +1,61 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from src.authentication.routes import router as auth_routes
 from src.products.routes import router as products_routes
+from src.order_items.routes import router as order_routes
+from src.database import get_pool_stats
+from src.products.crud import product_cache
+from src.authentication.password_hashing import get_password_hashing_stats, shutdown_password_hash_pool
+from src.images.ingestion import get_image_upload_stats, IMAGE_STAGING_DIR, PENDING_IMAGE_BASE_URL
+from src.images.storage import IMAGE_STORAGE_PROVIDER, IMAGE_LOCAL_STORAGE_DIR, IMAGE_LOCAL_BASE_URL
+from src.images.uploads import IMAGE_MAX_UPLOAD_BYTES
+from src.middleware import MaxBodySizeMiddleware, CompressionMiddleware, get_compression_stats
+from src.products.bulk import PRODUCT_IMPORT_MAX_BYTES
+from src.schema_check import check_database_schema
+from src.responses import FastJSONResponse
+from src.idempotency.keys import idempotency_key_sweeper, get_idempotency_stats
+from src.products.inventory import stock_rebalancer, get_inventory_stats
+from src.outbox.dispatcher import outbox_dispatcher
+from src.authentication.token_registry import token_revocations, get_token_registry_stats
+import os
+
+# room for one image plus the rest of the multipart form
+MAX_REQUEST_BODY_BYTES = int(os.getenv("MAX_REQUEST_BODY_BYTES", str(IMAGE_MAX_UPLOAD_BYTES + 1024 * 1024)))
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "1000"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # fail fast on a database that is missing migrations instead of erroring on the first query
+    await run_in_threadpool(check_database_schema)
+    await product_cache.start()
+    await token_revocations.start()
+    # an event cut off by shutdown is picked up again once its claim times out
+    await outbox_dispatcher.start()
+    await idempotency_key_sweeper.start()
+    await stock_rebalancer.start()
+    yield
+    await stock_rebalancer.stop()
+    await idempotency_key_sweeper.stop()
+    await outbox_dispatcher.stop()
+    await token_revocations.stop()
+    await product_cache.close()
+    shutdown_password_hash_pool()
+
 
 app = FastAPI(
     title="Ecomm website backend",
     description="This is the backend for our first ecom so we integrate with the frontend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 app.add_middleware(
@@ -17,9 +66,48 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_body_size=MAX_REQUEST_BODY_BYTES,
+    path_limits={ "/products/admin/import": PRODUCT_IMPORT_MAX_BYTES }
+)
+
+# added last so it wraps everything else and sees the final response bodies
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+    zstd_level=COMPRESSION_ZSTD_LEVEL,
+    cache_size=COMPRESSION_CACHE_SIZE
+)
+
 app.include_router(auth_routes)
 app.include_router(products_routes)
+app.include_router(order_routes)
+
+# images stay reachable on their pending url until the upload worker swaps in the final one
+app.mount(PENDING_IMAGE_BASE_URL, StaticFiles(directory=IMAGE_STAGING_DIR), name="pending_images")
+
+if IMAGE_STORAGE_PROVIDER == "local":
+    os.makedirs(IMAGE_LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount(IMAGE_LOCAL_BASE_URL, StaticFiles(directory=IMAGE_LOCAL_STORAGE_DIR), name="local_images")
 
 @app.get("/")
 def home_root():
-    return { "message": "This is the main home root" }
\ No newline at end of file
+    return { "message": "This is the main home root" }
+
+
+@app.get("/metrics")
+def metrics_root():
+    return {
+        "db_pool": get_pool_stats(),
+        "product_cache": product_cache.stats(),
+        "password_hashing": get_password_hashing_stats(),
+        "image_uploads": get_image_upload_stats(),
+        "compression": get_compression_stats(),
+        "idempotency": get_idempotency_stats(),
+        "inventory": get_inventory_stats(),
+        "outbox": outbox_dispatcher.stats(),
+        "refresh_tokens": get_token_registry_stats()
+    }
@@ -0,0 +1,302 @@
+from starlette.datastructures import Headers, MutableHeaders
+from .cache import TTLCache
+import hashlib
+import json
+import threading
+import zlib
+
+
+# rejects request bodies over the limit before the multipart parser spools them to disk:
+# a declared content-length is checked up front, and chunked bodies are counted as they
+# arrive and cut off as soon as they cross the limit
+
+class MaxBodySizeMiddleware:
+    def __init__(self, app, max_body_size: int, path_limits: dict = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_limits = path_limits or {}
+
+    def _limit_for_path(self, path: str) -> int:
+        for path_prefix, path_limit in self.path_limits.items():
+            if path.startswith(path_prefix):
+                return path_limit
+        return self.max_body_size
+
+    async def _send_too_large(self, send, body_limit: int):
+        response_body = json.dumps({ "detail": f"Request body cannot be bigger than {body_limit} bytes" }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(response_body)).encode("utf-8")),
+                (b"connection", b"close"),
+            ]
+        })
+        await send({ "type": "http.response.body", "body": response_body })
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS", "DELETE"):
+            await self.app(scope, receive, send)
+            return
+
+        body_limit = self._limit_for_path(scope["path"])
+
+        declared_length = dict(scope["headers"]).get(b"content-length")
+        if declared_length is not None and declared_length.isdigit() and int(declared_length) > body_limit:
+            await self._send_too_large(send, body_limit)
+            return
+
+        received_bytes = 0
+        body_too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received_bytes, body_too_large
+
+            if body_too_large:
+                return { "type": "http.disconnect" }
+
+            message = await receive()
+            if message["type"] == "http.request":
+                received_bytes += len(message.get("body", b""))
+                if received_bytes > body_limit:
+                    body_too_large = True
+                    return { "type": "http.disconnect" }
+
+            return message
+
+        # once the body is cut off whatever the app answers (usually a parse error) is dropped for the 413
+        async def guarded_send(message):
+            nonlocal response_started
+
+            if not body_too_large:
+                response_started = response_started or message["type"] == "http.response.start"
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not body_too_large:
+                raise
+
+        if body_too_large and not response_started:
+            await self._send_too_large(send, body_limit)
+
+
+# optional encoders, gzip is always there and the others are used when their package is installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+_compression_stats_lock = threading.Lock()
+_compression_stats = { "compressed": 0, "streamed": 0, "skipped_small": 0, "cache_hits": 0, "bytes_in": 0, "bytes_out": 0 }
+
+
+def _count_compression(**counts):
+    with _compression_stats_lock:
+        for counter_name, count in counts.items():
+            _compression_stats[counter_name] += count
+
+
+def get_compression_stats() -> dict:
+    with _compression_stats_lock:
+        compression_stats = dict(_compression_stats)
+
+    compression_stats["encodings"] = list(available_encodings())
+    return compression_stats
+
+
+def available_encodings() -> tuple:
+    # server preference when the client rates several encodings the same
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return tuple(encodings)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    # every chunk is flushed so ndjson lines reach the client as they are produced
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _compress_body(encoding: str, body: bytes, level: int) -> bytes:
+    if encoding == "gzip":
+        gzip_compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return gzip_compressor.compress(body) + gzip_compressor.flush()
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# compresses responses for clients that accept it. whole bodies under minimum_size go out as
+# they are, streamed bodies are compressed chunk by chunk, and cacheable whole bodies (the ones
+# with an etag) keep their compressed bytes keyed by a digest of the body, so a hot listing is
+# only compressed once. hashing is far cheaper than compressing, and unlike the etag the digest
+# can never point at a different body
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+        cache_size: int = 1000,
+        cache_ttl: float = 3600
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = { "gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level }
+        self.encodings = available_encodings()
+        self._compressed_bodies = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def _negotiate(self, accept_encoding: str):
+        encoding_weights = {}
+        for accepted in accept_encoding.split(","):
+            encoding_name, _, parameters = accepted.strip().partition(";")
+            weight = 1.0
+            parameters = parameters.strip()
+            if parameters.startswith("q="):
+                try:
+                    weight = float(parameters[2:])
+                except ValueError:
+                    weight = 0.0
+            encoding_weights[encoding_name.strip().lower()] = weight
+
+        wildcard_weight = encoding_weights.get("*", 0.0)
+        best_encoding, best_weight = None, 0.0
+        for encoding in self.encodings:
+            weight = encoding_weights.get(encoding, wildcard_weight)
+            if weight > best_weight:
+                best_encoding, best_weight = encoding, weight
+
+        return best_encoding
+
+    def _is_compressible(self, response_start: dict, headers: MutableHeaders) -> bool:
+        if response_start["status"] in (204, 304) or "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_CONTENT_TYPES)
+
+    def _weaken_etag(self, headers: MutableHeaders):
+        # the compressed body is a different representation, a weak etag keeps
+        # If-None-Match working since the comparison ignores the W/ prefix
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        response_start = None
+        passthrough = False
+        stream_compressor = None
+
+        async def compressing_send(message):
+            nonlocal response_start, passthrough, stream_compressor
+
+            # the start is held back until the first body chunk shows how big the response is
+            if message["type"] == "http.response.start":
+                response_start = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if stream_compressor is not None:
+                compressed_chunk = stream_compressor.compress(body)
+                if not more_body:
+                    compressed_chunk += stream_compressor.finish()
+                _count_compression(bytes_in=len(body), bytes_out=len(compressed_chunk))
+                await send({ "type": "http.response.body", "body": compressed_chunk, "more_body": more_body })
+                return
+
+            headers = MutableHeaders(raw=response_start["headers"])
+            if response_start["status"] == 304:
+                self._weaken_etag(headers)
+            if not self._is_compressible(response_start, headers):
+                passthrough = True
+                await send(response_start)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+
+            if not more_body and len(body) < self.minimum_size:
+                passthrough = True
+                _count_compression(skipped_small=1)
+                await send(response_start)
+                await send(message)
+                return
+
+            cacheable = "etag" in headers
+            self._weaken_etag(headers)
+            headers["content-encoding"] = encoding
+
+            if more_body:
+                del headers["content-length"]
+                stream_compressor = _StreamCompressor(encoding, self.levels[encoding])
+                compressed_chunk = stream_compressor.compress(body)
+                _count_compression(streamed=1, bytes_in=len(body), bytes_out=len(compressed_chunk))
+                await send(response_start)
+                await send({ "type": "http.response.body", "body": compressed_chunk, "more_body": True })
+                return
+
+            body_cache_key = f"{encoding}:{hashlib.blake2b(body, digest_size=16).hexdigest()}" if cacheable else None
+            compressed_body = self._compressed_bodies.get(body_cache_key) if cacheable else None
+            if compressed_body is not None:
+                _count_compression(cache_hits=1)
+            else:
+                compressed_body = _compress_body(encoding, body, self.levels[encoding])
+                if cacheable:
+                    self._compressed_bodies.set(body_cache_key, compressed_body)
+
+            _count_compression(compressed=1, bytes_in=len(body), bytes_out=len(compressed_body))
+            headers["content-length"] = str(len(compressed_body))
+            await send(response_start)
+            await send({ "type": "http.response.body", "body": compressed_body })
+
+        await self.app(scope, receive, compressing_send)
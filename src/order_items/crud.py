@@ -0,0 +1,156 @@
+from .schemas import *
+from .models import *
+from ..products.models import ProductModel
+from ..products.crud import invalidate_product_stock
+from ..products.inventory import reserve_stock, OutOfStockError
+from ..pagination import encode_cursor, decode_cursor, resolve_page_size
+from fastapi import HTTPException, status
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from datetime import datetime
+import os
+
+load_dotenv()
+
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "50"))
+ORDERS_MAX_PAGE_SIZE = int(os.getenv("ORDERS_MAX_PAGE_SIZE", "500"))
+
+
+async def checkout(
+    db: AsyncSession,
+    user_id: str,
+    checkout_data: CheckoutSchema
+):
+    requested_quantities = {}
+    for checkout_item in checkout_data.items:
+        requested_quantities[checkout_item.product_id] = requested_quantities.get(checkout_item.product_id, 0) + checkout_item.quantity
+        
+    # one read for every product in the cart, it picks the reservation path and the price
+    checkout_products = {
+        checkout_product.id: checkout_product
+        for checkout_product in (await db.execute(
+            select(ProductModel.id, ProductModel.price, ProductModel.is_hot).where(ProductModel.id.in_(list(requested_quantities)))
+        )).all()
+    }
+    missing_product_ids = sorted(set(requested_quantities) - set(checkout_products))
+    if missing_product_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product {missing_product_ids[0]} was not found"
+        )
+        
+    try:
+        # rows are always reserved in id order, so two carts sharing products lock them in
+        # the same order and cannot deadlock each other. the stock check and the decrement
+        # are one statement, so two checkouts can never both see the last unit
+        for product_id in sorted(requested_quantities):
+            await reserve_stock(db, product_id, requested_quantities[product_id], checkout_products[product_id].is_hot)
+            
+        unit_prices = { product_id: checkout_products[product_id].price or 0 for product_id in requested_quantities }
+        
+        new_order_instance = OrderModel(
+            user_id=user_id,
+            total_price=sum(unit_prices[product_id] * quantity for product_id, quantity in requested_quantities.items()),
+            items=[
+                OrderItemModel(product_id=product_id, quantity=quantity, unit_price=unit_prices[product_id])
+                for product_id, quantity in requested_quantities.items()
+            ]
+        )
+        db.add(new_order_instance)
+        await db.commit()
+        
+    except OutOfStockError as e:
+        # nothing from this checkout sticks, the reservations made so far are rolled back with it
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Not enough stock left for product {e.product_id}"
+        )
+        
+    except Exception as e:
+        await db.rollback()
+        print(f"There was an error trying to check out: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to place this order"
+        )
+        
+    invalidate_product_stock(*requested_quantities)
+    return new_order_instance
+
+
+async def view_my_orders(
+    db: AsyncSession,
+    user_id: str,
+    cursor: str = None,
+    limit: int = None
+):
+    page_size = resolve_page_size(limit, ORDERS_PAGE_SIZE, ORDERS_MAX_PAGE_SIZE)
+    
+    orders_query = (
+        select(OrderModel)
+        .where(OrderModel.user_id == user_id)
+        .order_by(OrderModel.date_created.desc(), OrderModel.id.desc())
+    )
+    
+    if cursor:
+        try:
+            last_date_created, last_order_id = decode_cursor(cursor)
+            last_date_created = datetime.fromisoformat(last_date_created)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Invalid order cursor was passed: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor was passed"
+            )
+            
+        orders_query = orders_query.where(
+            or_(
+                OrderModel.date_created < last_date_created,
+                and_(
+                    OrderModel.date_created == last_date_created,
+                    OrderModel.id < str(last_order_id)
+                )
+            )
+        )
+        
+    try:
+        orders_page = (await db.execute(orders_query.limit(page_size + 1))).scalars().all()
+        
+        next_cursor = None
+        if len(orders_page) > page_size:
+            orders_page = orders_page[:page_size]
+            next_cursor = encode_cursor([orders_page[-1].date_created.isoformat(), orders_page[-1].id])
+            
+        return { "items": orders_page, "next_cursor": next_cursor }
+        
+    except Exception as e:
+        print(f"Unable to fetch orders from the db: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to fetch your orders at this time"
+        )
+        
+
+async def view_single_order(
+    db: AsyncSession,
+    user_id: str,
+    order_id: str
+):
+    order_instance = (await db.execute(select(OrderModel).where(
+        and_(
+            OrderModel.id == order_id,
+            OrderModel.user_id == user_id
+        )
+    ))).scalar_one_or_none()
+    
+    if not order_instance:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Requested order was not found"
+        )
+        
+    return order_instance
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+from uuid import uuid4
+from ..database import Base
+
+class OrderModel(Base):
+    __tablename__ = "orders"
+    __table_args__ = (
+        # a customer's order history, newest first
+        Index("ix_orders_user_id_date_created", "user_id", "date_created"),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: uuid4().hex)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    status = Column(String, nullable=False, default="placed")
+    total_price = Column(Integer, nullable=False)
+    date_created = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    items = relationship("OrderItemModel", back_populates="order", lazy="selectin")
+    
+    
+class OrderItemModel(Base):
+    __tablename__ = "order_items"
+    
+    id = Column(String, primary_key=True, default=lambda: uuid4().hex)
+    order_id = Column(String, ForeignKey("orders.id"), nullable=False, index=True)
+    # no foreign key on purpose, deleting a product must not fail on (or rewrite) past orders
+    product_id = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    # the price at checkout, later price changes do not rewrite old orders
+    unit_price = Column(Integer, nullable=False)
+    
+    order = relationship("OrderModel", back_populates="items")
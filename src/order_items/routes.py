@@ -0,0 +1,66 @@
+from .crud import *
+from .schemas import *
+from ..authentication.dependencies import get_current_customer_principal
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import status, Depends, APIRouter, Query, Header
+from ..database import get_async_db
+from ..idempotency.keys import run_idempotent, request_fingerprint
+from functools import partial
+
+
+router = APIRouter(
+    prefix="/orders",
+    tags=["Orders Endpoint"]
+)
+
+
+@router.post("/checkout", status_code=status.HTTP_201_CREATED, response_model=DisplayOrderSchema)
+async def checkout_route(
+    checkout_data: CheckoutSchema,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: str = Header(None, description="retries with the same key get the first order back instead of placing another one"),
+    current_user: dict = Depends(get_current_customer_principal)
+):
+    idempotent_response = await run_idempotent(
+        scope="orders:checkout",
+        user_id=current_user["user_id"],
+        idempotency_key=idempotency_key,
+        fingerprint=request_fingerprint(checkout_data.model_dump_json()),
+        handler=partial(
+            checkout,
+            db=db,
+            user_id=current_user["user_id"],
+            checkout_data=checkout_data
+        ),
+        serialize=lambda order_instance: DisplayOrderSchema.model_validate(order_instance).model_dump(mode="json"),
+        status_code=status.HTTP_201_CREATED
+    )
+    return idempotent_response.to_response()
+
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=OrderPageSchema)
+async def get_my_orders_route(
+    db: AsyncSession = Depends(get_async_db),
+    cursor: str = Query(None, description="cursor returned by the previous page"),
+    limit: int = Query(None, description="page size"),
+    current_user: dict = Depends(get_current_customer_principal)
+):
+    return await view_my_orders(
+        db=db,
+        user_id=current_user["user_id"],
+        cursor=cursor,
+        limit=limit
+    )
+
+
+@router.get("/{order_id}", status_code=status.HTTP_200_OK, response_model=DisplayOrderSchema)
+async def get_single_order_route(
+    order_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_customer_principal)
+):
+    return await view_single_order(
+        db=db,
+        user_id=current_user["user_id"],
+        order_id=order_id
+    )
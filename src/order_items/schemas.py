@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+
+class CheckoutItemSchema(BaseModel):
+    product_id: str = Field(..., description="product to buy")
+    quantity: int = Field(..., ge=1, description="how many")
+    
+
+class CheckoutSchema(BaseModel):
+    items: List[CheckoutItemSchema] = Field(..., min_length=1, max_length=100, description="lines of the order")
+    
+    
+class DisplayOrderItemSchema(BaseModel):
+    product_id: str
+    quantity: int
+    unit_price: float
+    
+    class Config:
+        from_attributes = True
+        
+        
+class DisplayOrderSchema(BaseModel):
+    id: str
+    status: str
+    total_price: float
+    date_created: datetime
+    items: List[DisplayOrderItemSchema]
+    
+    class Config:
+        from_attributes = True
+        
+
+class OrderPageSchema(BaseModel):
+    items: List[DisplayOrderSchema]
+    next_cursor: Optional[str] = Field(None, description="opaque cursor for the next page, null on the last page")
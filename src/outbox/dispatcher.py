@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, delete, event, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from ..database import AsyncLocalSession
+from ..responses import dumps_json, loads_json
+from .models import OutboxEventModel
+import asyncio
+import os
+import socket
+
+load_dotenv()
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "1"))
+OUTBOX_RETRY_MAX_BACKOFF = float(os.getenv("OUTBOX_RETRY_MAX_BACKOFF", "600"))
+# a claimed batch that is not finished in this long (the worker died) becomes due again
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", "300"))
+# node local events (uploads of files staged on this machine) are only claimed by dispatchers
+# with the same node id. every worker on a host shares the staging dir, so the host is the node
+OUTBOX_NODE_ID = os.getenv("OUTBOX_NODE_ID", socket.gethostname())
+
+# topic -> async handler taking every payload of that topic in a batch. delivery is at least
+# once, so handlers have to be safe to run again for payloads they already handled
+_outbox_handlers = {}
+_outbox_stats = { "delivered": 0, "retried": 0, "failed": 0, "batches": 0 }
+
+
+def outbox_handler(topic: str):
+    def register(handler):
+        _outbox_handlers[topic] = handler
+        return handler
+    return register
+
+
+def _utcnow() -> datetime:
+    # stored without a timezone like every other DateTime column
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def add_outbox_event(db: AsyncSession, topic: str, payload: dict, node_local: bool = False):
+    # the event is only a row in the caller's transaction, it exists exactly when the write does
+    db.add(OutboxEventModel(
+        topic=topic,
+        payload=dumps_json(payload).decode("utf-8"),
+        node_id=OUTBOX_NODE_ID if node_local else None,
+        available_at=_utcnow()
+    ))
+
+    # wake the topics once the transaction commits instead of waiting for the next poll
+    woken_topics = db.sync_session.info.setdefault("outbox_topics", set())
+    if not woken_topics:
+        event.listen(db.sync_session, "after_commit", _wake_dispatcher_after_commit, once=True)
+    woken_topics.add(topic)
+
+
+def _wake_dispatcher_after_commit(session):
+    for topic in session.info.pop("outbox_topics", ()):
+        outbox_dispatcher.notify(topic)
+
+
+class OutboxDispatcher:
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeups = {}
+        self._dispatcher_tasks = {}
+
+    async def start(self):
+        # one loop per topic, so slow deliveries (image uploads) never hold up quick ones (cache
+        # invalidations). events of a topic with no handler here are left for a node that has one
+        for topic in _outbox_handlers:
+            self._wakeups[topic] = asyncio.Event()
+            self._dispatcher_tasks[topic] = asyncio.create_task(self._run(topic))
+
+    async def stop(self):
+        # a batch cut off here is claimed again once its claim times out
+        dispatcher_tasks = list(self._dispatcher_tasks.values())
+        for dispatcher_task in dispatcher_tasks:
+            dispatcher_task.cancel()
+        await asyncio.gather(*dispatcher_tasks, return_exceptions=True)
+        self._dispatcher_tasks = {}
+        self._wakeups = {}
+
+    def notify(self, topic: str = None):
+        for wakeup_topic, wakeup in self._wakeups.items():
+            if topic is None or wakeup_topic == topic:
+                wakeup.set()
+
+    async def _run(self, topic: str):
+        wakeup = self._wakeups[topic]
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+            try:
+                # a full batch means there is probably more waiting, keep draining
+                while await self.dispatch_batch(topic) >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"There was an error trying to dispatch {topic} outbox events: {str(e)}")
+
+    async def _claim_batch(self, topic: str) -> tuple:
+        claimed_at = _utcnow()
+        claimed_until = claimed_at + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+
+        async with AsyncLocalSession() as db:
+            due_event_ids = (await db.execute(
+                select(OutboxEventModel.id)
+                .where(
+                    OutboxEventModel.topic == topic,
+                    OutboxEventModel.status == "pending",
+                    OutboxEventModel.available_at <= claimed_at,
+                    or_(OutboxEventModel.node_id.is_(None), OutboxEventModel.node_id == OUTBOX_NODE_ID)
+                )
+                .order_by(OutboxEventModel.available_at, OutboxEventModel.id)
+                .limit(self.batch_size)
+            )).scalars().all()
+            if not due_event_ids:
+                return [], claimed_until
+
+            # pushing available_at out is the claim, an event another worker claimed first is
+            # no longer due and drops out of this update
+            claimed_events = (await db.execute(
+                update(OutboxEventModel)
+                .where(OutboxEventModel.id.in_(due_event_ids), OutboxEventModel.available_at <= claimed_at)
+                .values(
+                    available_at=claimed_until,
+                    attempts=OutboxEventModel.attempts + 1
+                )
+                .returning(OutboxEventModel.id, OutboxEventModel.payload, OutboxEventModel.attempts)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+
+        return sorted(claimed_events, key=lambda claimed_event: claimed_event.id), claimed_until
+
+    async def dispatch_batch(self, topic: str) -> int:
+        claimed_events, claimed_until = await self._claim_batch(topic)
+        if not claimed_events:
+            return 0
+
+        delivered_event_ids = []
+        failed_events = []
+        try:
+            await _outbox_handlers[topic]([loads_json(claimed_event.payload) for claimed_event in claimed_events])
+            delivered_event_ids = [claimed_event.id for claimed_event in claimed_events]
+
+        except Exception as e:
+            print(f"There was an error trying to deliver {len(claimed_events)} {topic} outbox events: {str(e)}")
+            failed_events = [(claimed_event, str(e)) for claimed_event in claimed_events]
+
+        await self._finish_batch(delivered_event_ids, failed_events, claimed_until)
+        _outbox_stats["batches"] += 1
+
+        return len(claimed_events)
+
+    async def _finish_batch(self, delivered_event_ids: list, failed_events: list, claimed_until: datetime):
+        # only rows still holding this claim are touched. once a claim timed out another worker
+        # owns the event, and sqlite hands the id of a deleted last row to the next insert
+        async with AsyncLocalSession() as db:
+            if delivered_event_ids:
+                await db.execute(delete(OutboxEventModel).where(
+                    OutboxEventModel.id.in_(delivered_event_ids),
+                    OutboxEventModel.available_at == claimed_until
+                ))
+
+            for failed_event, failure in failed_events:
+                if failed_event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    # kept for a look by hand, the dispatcher never picks failed events up again
+                    failed_values = { "status": "failed", "last_error": failure }
+                else:
+                    retry_delay = min(OUTBOX_RETRY_BACKOFF * 2 ** (failed_event.attempts - 1), OUTBOX_RETRY_MAX_BACKOFF)
+                    failed_values = { "available_at": _utcnow() + timedelta(seconds=retry_delay), "last_error": failure }
+
+                await db.execute(
+                    update(OutboxEventModel)
+                    .where(OutboxEventModel.id == failed_event.id, OutboxEventModel.available_at == claimed_until)
+                    .values(failed_values)
+                )
+
+            await db.commit()
+
+        _outbox_stats["delivered"] += len(delivered_event_ids)
+        for failed_event, _ in failed_events:
+            _outbox_stats["failed" if failed_event.attempts >= OUTBOX_MAX_ATTEMPTS else "retried"] += 1
+
+    def stats(self) -> dict:
+        outbox_stats = dict(_outbox_stats)
+        outbox_stats["running"] = bool(self._dispatcher_tasks)
+        outbox_stats["node_id"] = OUTBOX_NODE_ID
+        return outbox_stats
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Text, DateTime, Integer, Index
+from datetime import datetime, timezone
+from ..database import Base
+
+class OutboxEventModel(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # each topic's dispatcher claims its pending events that are due, oldest first
+        Index("ix_outbox_events_topic_status_available_at", "topic", "status", "available_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    # pending until delivered (the row is deleted then), failed once it ran out of attempts
+    status = Column(String, nullable=False, default="pending")
+    # set for events only the node that wrote them can deliver, none for everything else
+    node_id = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    date_created = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,38 @@
+from fastapi import HTTPException, status
+import base64
+import json
+
+
+# cursors are opaque to clients, they just carry the sort values of the last row on a page
+
+def encode_cursor(cursor_values: list) -> str:
+    raw_cursor = json.dumps(cursor_values)
+    return base64.urlsafe_b64encode(raw_cursor.encode("utf-8")).decode("utf-8").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        cursor_values = json.loads(base64.urlsafe_b64decode(padded_cursor.encode("utf-8")))
+        if not isinstance(cursor_values, list):
+            raise ValueError("cursor is not a list")
+
+        return cursor_values
+
+    except Exception as e:
+        print(f"Invalid cursor was passed: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor was passed"
+        )
+
+
+def resolve_page_size(limit: int, default_page_size: int, max_page_size: int) -> int:
+    page_size = limit or default_page_size
+    if page_size < 1 or page_size > max_page_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Page size has to be between 1 and {max_page_size}"
+        )
+
+    return page_size
@@ -0,0 +1,296 @@
+from .schemas import *
+from .models import *
+from .crud import queue_product_cache_invalidation, _build_product_filters
+from fastapi import HTTPException, status, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, insert, update, delete, func, cast, Integer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from uuid import uuid4
+import codecs
+import csv
+import json
+import os
+
+load_dotenv()
+
+PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv("PRODUCT_IMPORT_BATCH_SIZE", "1000"))
+PRODUCT_IMPORT_MAX_BYTES = int(os.getenv("PRODUCT_IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+
+
+def _detect_import_format(import_file: UploadFile, import_format: str = None) -> str:
+    if import_format:
+        detected_format = import_format.lower()
+    elif (import_file.filename or "").lower().endswith((".ndjson", ".jsonl")) or import_file.content_type in ("application/x-ndjson", "application/jsonl"):
+        detected_format = "ndjson"
+    else:
+        detected_format = "csv"
+
+    if detected_format not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Imports have to be csv or ndjson"
+        )
+
+    return detected_format
+
+
+# yields (row number, raw row or parse error) straight off the spooled upload, nothing is read ahead
+
+def _iter_import_rows(import_file: UploadFile, import_format: str):
+    import_file.file.seek(0)
+    text_lines = codecs.getreader("utf-8")(import_file.file)
+
+    if import_format == "csv":
+        csv_rows = csv.DictReader(text_lines)
+        row_number = 0
+        while True:
+            row_number += 1
+            try:
+                raw_row = next(csv_rows)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # the reader moves past the broken line, so the rest of the file still imports
+                yield row_number, ValueError(f"Invalid csv: {str(e)}")
+                continue
+            yield row_number, raw_row
+
+    row_number = 0
+    for line in text_lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"Invalid json: {str(e)}")
+
+
+def _read_import_batch(import_rows) -> list:
+    import_batch = []
+    for import_row in import_rows:
+        import_batch.append(import_row)
+        if len(import_batch) >= PRODUCT_IMPORT_BATCH_SIZE:
+            break
+    return import_batch
+
+
+def _validate_import_row(raw_row):
+    if isinstance(raw_row, Exception):
+        return None, [str(raw_row)]
+    if not isinstance(raw_row, dict):
+        return None, ["Each row has to be an object"]
+
+    try:
+        product_data = CreateProductSchema.model_validate(raw_row)
+    except ValidationError as e:
+        return None, [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+    # same rules upload_new_product applies to a single product
+    row_errors = []
+    if product_data.quantity < 0:
+        row_errors.append("quantity: cannot be less than 0")
+    if len(product_data.description) > 2000:
+        row_errors.append("description: cannot be longer than 2000 characters")
+    if not float(product_data.price).is_integer():
+        row_errors.append("price: has to be a whole number")
+
+    return product_data, row_errors
+
+
+async def bulk_import_products(
+    db: AsyncSession,
+    associated_admin_user_id: str,
+    import_file: UploadFile,
+    import_format: str = None
+):
+    import_format = _detect_import_format(import_file, import_format)
+    import_rows = _iter_import_rows(import_file, import_format)
+
+    import_results = []
+    seen_product_names = set()
+    created_count = 0
+
+    while True:
+        try:
+            import_batch = await run_in_threadpool(_read_import_batch, import_rows)
+        except UnicodeDecodeError as e:
+            print(f"Product import is not valid utf-8: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Imports have to be utf-8 encoded, {created_count} products before the bad bytes were imported"
+            )
+        if not import_batch:
+            break
+
+        valid_rows = []
+        for row_number, raw_row in import_batch:
+            product_data, row_errors = _validate_import_row(raw_row)
+
+            if not row_errors and product_data.name in seen_product_names:
+                row_errors.append("name: already used earlier in this file")
+
+            if row_errors:
+                import_results.append({ "row": row_number, "status": "failed", "errors": row_errors })
+                continue
+
+            seen_product_names.add(product_data.name)
+            valid_rows.append((row_number, product_data))
+
+        if not valid_rows:
+            continue
+
+        # one set based lookup per batch instead of a select per row
+        batch_names = [product_data.name for _, product_data in valid_rows]
+        existing_names = set((await db.execute(select(ProductModel.name).where(ProductModel.name.in_(batch_names)))).scalars().all())
+
+        new_product_rows = []
+        new_product_row_numbers = []
+        for row_number, product_data in valid_rows:
+            if product_data.name in existing_names:
+                import_results.append({ "row": row_number, "status": "failed", "errors": ["name: a product with this name already exists"] })
+                continue
+
+            new_product_rows.append({
+                "id": uuid4().hex,
+                "associated_admin_user_id": associated_admin_user_id,
+                "name": product_data.name,
+                "description": product_data.description,
+                "price": int(product_data.price),
+                "quantity": product_data.quantity,
+                "product_header_image": product_data.product_header_image,
+                "date_posted": datetime.now(timezone.utc)
+            })
+            new_product_row_numbers.append(row_number)
+
+        if not new_product_rows:
+            continue
+
+        try:
+            await db.execute(insert(ProductModel), new_product_rows)
+            queue_product_cache_invalidation(db)
+            await db.commit()
+
+        except IntegrityError as e:
+            # someone created one of these names between our check and the insert, the batch is
+            # rolled back as a whole so those rows can just be imported again
+            await db.rollback()
+            print(f"Product import batch hit a conflict: {str(e)}")
+            for row_number in new_product_row_numbers:
+                import_results.append({ "row": row_number, "status": "failed", "errors": ["batch conflicted with a concurrent write, retry this row"] })
+            continue
+
+        except Exception as e:
+            await db.rollback()
+            print(f"There was an error trying to import a product batch: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Unable to import products, rows before {new_product_row_numbers[0]} were imported"
+            )
+
+        created_count += len(new_product_rows)
+        for row_number, new_product_row in zip(new_product_row_numbers, new_product_rows):
+            import_results.append({ "row": row_number, "status": "created", "id": new_product_row["id"] })
+
+    import_results.sort(key=lambda import_result: import_result["row"])
+
+    return {
+        "created": created_count,
+        "failed": len(import_results) - created_count,
+        "results": import_results
+    }
+
+
+def _bulk_selection_conditions(
+    user_id: str,
+    product_selection: BulkProductSelectionSchema
+) -> list:
+    # the ownership check is part of the statement, other admins' products never match
+    selection_conditions = [ProductModel.associated_admin_user_id == user_id]
+
+    if product_selection.ids is not None:
+        selection_conditions.append(ProductModel.id.in_(product_selection.ids))
+    else:
+        selection_conditions.extend(_build_product_filters(product_selection.filter))
+
+    return selection_conditions
+
+
+async def bulk_update_products(
+    db: AsyncSession,
+    user_id: str,
+    update_data: BulkUpdateProductsSchema
+):
+    new_values = {}
+    if update_data.price is not None:
+        new_values["price"] = update_data.price
+    if update_data.price_change_percent is not None:
+        new_values["price"] = cast(func.round(ProductModel.price * (1 + update_data.price_change_percent / 100)), Integer)
+    if update_data.quantity is not None:
+        new_values["quantity"] = update_data.quantity
+    # core updates skip version_id_col, so the bump is part of the statement
+    new_values["version"] = ProductModel.version + 1
+
+    try:
+        updated_product_ids = (await db.execute(
+            update(ProductModel)
+            .where(*_bulk_selection_conditions(user_id, update_data))
+            .values(new_values)
+            .returning(ProductModel.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+
+        # a new quantity is the whole stock of hot products too, the rebalancer spreads it over the slots again.
+        # this runs after the update so an in_stock filter still sees the stock the products had before
+        if update_data.quantity is not None:
+            for batch_start in range(0, len(updated_product_ids), PRODUCT_IMPORT_BATCH_SIZE):
+                await db.execute(
+                    update(ProductStockSlotModel)
+                    .where(ProductStockSlotModel.product_id.in_(updated_product_ids[batch_start:batch_start + PRODUCT_IMPORT_BATCH_SIZE]))
+                    .values(quantity=0)
+                    .execution_options(synchronize_session=False)
+                )
+        if updated_product_ids:
+            queue_product_cache_invalidation(db, *updated_product_ids)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        print(f"There was an error trying to bulk update products: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to update these products"
+        )
+
+    return { "affected": len(updated_product_ids) }
+
+
+async def bulk_delete_products(
+    db: AsyncSession,
+    user_id: str,
+    delete_data: BulkDeleteProductsSchema
+):
+    try:
+        deleted_product_ids = (await db.execute(
+            delete(ProductModel)
+            .where(*_bulk_selection_conditions(user_id, delete_data))
+            .returning(ProductModel.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        if deleted_product_ids:
+            queue_product_cache_invalidation(db, *deleted_product_ids)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        print(f"There was an error trying to bulk delete products: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to delete these products"
+        )
+
+    return { "affected": len(deleted_product_ids) }
@@ -1,109 +1,182 @@
 from .schemas import *
 from .models import *
-from ..authentication.routes import admin_oauth, user_oauth
 from ..authentication.models import *
 from fastapi import HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 import os 
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 import json
-from sqlalchemy import select, and_, or_
-from ..authentication.crud import _upload_image_to_cloudinary
+from sqlalchemy import select, update, delete, and_, or_, func, case, true
+from ..images.ingestion import StagedImage, stage_image, discard_staged_image, queue_image_upload
+from ..outbox.dispatcher import add_outbox_event, outbox_handler
+from sqlalchemy import event
+from ..database import AsyncLocalSession
+from ..cache import TTLCache, TieredCache, build_cache_backend
+from ..responses import EncodedPayload, content_etag, dumps_json
+from ..pagination import encode_cursor, decode_cursor, resolve_page_size
+from datetime import datetime
+import asyncio
 
 load_dotenv()
 
-CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
-CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+PRODUCTS_PAGE_SIZE = int(os.getenv("PRODUCTS_PAGE_SIZE", "50"))
+PRODUCTS_MAX_PAGE_SIZE = int(os.getenv("PRODUCTS_MAX_PAGE_SIZE", "500"))
+PRODUCTS_STREAM_BATCH_SIZE = int(os.getenv("PRODUCTS_STREAM_BATCH_SIZE", "1000"))
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "10000"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "60"))
+# how long sold product ids are gathered before their cache entries are dropped everywhere
+PRODUCT_STOCK_INVALIDATION_DELAY = float(os.getenv("PRODUCT_STOCK_INVALIDATION_DELAY", "0.05"))
+# lower bounds of the price facet buckets, the last bucket is open ended
+PRODUCT_PRICE_FACET_BOUNDS = [int(bound) for bound in os.getenv("PRODUCT_PRICE_FACET_BOUNDS", "0,25,50,100,250,500,1000").split(",")]
 
-if not CLOUDINARY_CLOUD_NAME or not CLOUDINARY_API_KEY or not CLOUDINARY_API_SECRET:
-    raise ValueError("Unable to load cloudinary config variables to connect to it")
-
-cloudinary.config(
-    cloud_name = CLOUDINARY_CLOUD_NAME,
-    api_key = CLOUDINARY_API_KEY,
-    api_secret = CLOUDINARY_API_SECRET
+# encoded json bodies (bytes ready to send, with their etag) of products, listing pages and search pages, keyed "product:<id>",
+# "listing:<sort>:<filter>:<facets>:<fields>:<cursor>:<limit>" and "search:<query>:<fields>:<cursor>:<limit>"
+product_cache = TieredCache(
+    namespace="products",
+    local=TTLCache(maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL),
+    backend=build_cache_backend()
 )
 
-def _upload_image_to_cloudinary(
-    image_file: UploadFile = File(..., description="Image file to upload")
-) -> str:
-    try:
-        file_to_upload = cloudinary.uploader.upload(
-            image_file.file,
-            use_filename=True,
-            unique_filename=True
-        )
-        
-        image_url = json.loads(file_to_upload)["secure_url"]
-        
-        return image_url
+# any catalog write can shift rows between listing and search pages, so every cached page goes along
+# with the product. sales are the exception, see invalidate_product_stock
+
+PRODUCT_CACHE_MAX_INVALIDATION_KEYS = 1000
+
+PRODUCT_CACHE_INVALIDATION_TOPIC = "products.cache_invalidate"
+
+def _product_cache_keys(product_ids, listings: bool = True) -> tuple:
+    listing_prefixes = ("listing:", "search:") if listings else ()
+    
+    # past a point, dropping every cached product is cheaper than publishing thousands of keys
+    if len(product_ids) > PRODUCT_CACHE_MAX_INVALIDATION_KEYS:
+        return (), ("product:",) + listing_prefixes
+    
+    return tuple(f"product:{product_id}" for product_id in product_ids), listing_prefixes
+
+
+async def _invalidate_product_cache(*product_ids: str, listings: bool = True):
+    invalidated_keys, invalidated_prefixes = _product_cache_keys(product_ids, listings)
+    await product_cache.invalidate(keys=invalidated_keys, prefixes=invalidated_prefixes)
+    
+
+def queue_product_cache_invalidation(db: AsyncSession, *product_ids: str):
+    # the shared tier and the other workers are cleared by the outbox dispatcher, this worker
+    # drops its own copies as soon as the write commits so it always reads its own writes
+    add_outbox_event(db, PRODUCT_CACHE_INVALIDATION_TOPIC, { "product_ids": list(product_ids) })
+    
+    invalidated_keys, invalidated_prefixes = _product_cache_keys(product_ids)
+    event.listen(
+        db.sync_session,
+        "after_commit",
+        lambda _: product_cache.invalidate_local(keys=invalidated_keys, prefixes=invalidated_prefixes),
+        once=True
+    )
+    
+
+# a sale only moves quantities, so it drops the product details and leaves listing and search
+# pages to expire on their own (PRODUCT_CACHE_TTL) instead of clearing them on every checkout.
+# sales are not in the outbox either, a lost one costs at most PRODUCT_CACHE_TTL of stale stock
+
+# product ids sold since the last stock invalidation went out
+_pending_stock_invalidations = set()
+_stock_invalidation_task = None
+
+
+def invalidate_product_stock(*product_ids: str):
+    # called once the sale committed. this worker drops its copies right away, the shared tier
+    # and the other workers get every sale from the next few milliseconds in one invalidation
+    global _stock_invalidation_task
+    
+    invalidated_keys, invalidated_prefixes = _product_cache_keys(product_ids, listings=False)
+    product_cache.invalidate_local(keys=invalidated_keys, prefixes=invalidated_prefixes)
+    
+    _pending_stock_invalidations.update(product_ids)
+    if _stock_invalidation_task is None or _stock_invalidation_task.done():
+        _stock_invalidation_task = asyncio.create_task(_send_stock_invalidations())
+
+
+async def _send_stock_invalidations():
+    while _pending_stock_invalidations:
+        await asyncio.sleep(PRODUCT_STOCK_INVALIDATION_DELAY)
         
-    except Exception as e:
-        print(f"There was an error trying to upload the image to cloudinary: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unable to upload the image to cloudinary"
-        )
+        sold_product_ids = sorted(_pending_stock_invalidations)
+        _pending_stock_invalidations.clear()
+        await _invalidate_product_cache(*sold_product_ids, listings=False)
         
 
-def upload_new_product(
-    db: Session,
+@outbox_handler(PRODUCT_CACHE_INVALIDATION_TOPIC)
+async def _deliver_product_cache_invalidations(payloads: list):
+    # the whole batch goes out as one invalidation
+    invalidated_product_ids = { product_id for payload in payloads for product_id in payload["product_ids"] }
+    await _invalidate_product_cache(*sorted(invalidated_product_ids))
+    
+
+async def upload_new_product(
+    db: AsyncSession,
     associated_admin_user_id: str,
+    staged_product_image: StagedImage,
     name: str = Form(..., description="product name"),
     description: str = Form(..., description="description"),
     price: int = Form(..., description="price"),
     quantity: int = Form(..., description="quantity"),
-    product_header_image: UploadFile = File(..., description="product_header_image"),
 ):
-    existing_product_instance = db.execute(select(ProductModel).where(ProductModel.name == name)).scalar_one_or_none()
+    existing_product_instance = (await db.execute(select(ProductModel).where(ProductModel.name == name))).scalar_one_or_none()
     if existing_product_instance:
+        discard_staged_image(staged_product_image)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Products cannot have the exact same name"
         )
         
-    valid_admin_user_instance = db.execute(select(AdminUserModel).where(AdminUserModel.id == associated_admin_user_id)).scalar_one_or_none()
-    if not valid_admin_user_instance:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You dont have permission level to add a new product"
-        )
-        
     if quantity < 0:
+        discard_staged_image(staged_product_image)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Quantity of products cannot be less than 0 or negative, please add valid numbers or else"
         )
         
     if len(description) > 2000:
+        discard_staged_image(staged_product_image)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Aight g hang it up, too much content 🤣☠️"
         )
-        
+    
+    # the image was staged by the route, it needs its content hash for the idempotency fingerprint
     try:
-        new_product_image_url = _upload_image_to_cloudinary(image_file=product_header_image)
         new_product_instance = ProductModel(
+            associated_admin_user_id=associated_admin_user_id,
             name=name,
             description=description,
             price=price,
             quantity=quantity,
-            product_header_image=new_product_image_url
+            product_header_image=staged_product_image.url
         )
         
         db.add(new_product_instance)
-        db.commit()
+        # flushed first so the follow up invalidation knows the new id
+        await db.flush()
         
-        db.refresh(new_product_instance)
+        queue_product_cache_invalidation(db)
+        queue_image_upload(
+            db,
+            staged_product_image,
+            ProductModel.product_header_image,
+            follow_up_events=[(PRODUCT_CACHE_INVALIDATION_TOPIC, { "product_ids": [new_product_instance.id] })]
+        )
+        await db.commit()
+        # committed, the file belongs to the queued upload now
+        staged_product_image = None
+        
+        await db.refresh(new_product_instance)
         
         return new_product_instance
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        if staged_product_image is not None:
+            discard_staged_image(staged_product_image)
         print(f"There was an error trying to add new product: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -111,26 +184,254 @@ def upload_new_product(
         )
         
 
-def view_all_products(
-    db: Session,
-    user_id: str 
-):
-    check_admin_user = db.execute(select(AdminUserModel).where(AdminUserModel.id == user_id)).scalar_one_or_none()
-    check_normal_user = db.execute(select(UserModel).where(UserModel.id == user_id)).scalar_one_or_none()
+def _price_filters(product_filter: ProductFilterSchema) -> list:
+    price_conditions = []
+    if product_filter is None:
+        return price_conditions
     
-    if not check_admin_user or not check_normal_user:
+    if product_filter.min_price is not None:
+        price_conditions.append(ProductModel.price >= product_filter.min_price)
+    if product_filter.max_price is not None:
+        price_conditions.append(ProductModel.price <= product_filter.max_price)
+        
+    return price_conditions
+
+
+def _stock_filters(product_filter: ProductFilterSchema) -> list:
+    stock_conditions = []
+    if product_filter is None:
+        return stock_conditions
+    
+    if product_filter.in_stock is True:
+        stock_conditions.append(ProductModel.available_quantity > 0)
+    if product_filter.in_stock is False:
+        stock_conditions.append(ProductModel.available_quantity <= 0)
+        
+    return stock_conditions
+
+
+def _scope_filters(product_filter: ProductFilterSchema) -> list:
+    scope_conditions = []
+    if product_filter is None:
+        return scope_conditions
+    
+    if product_filter.admin_user_id is not None:
+        scope_conditions.append(ProductModel.associated_admin_user_id == product_filter.admin_user_id)
+    if product_filter.posted_after is not None:
+        scope_conditions.append(ProductModel.date_posted >= product_filter.posted_after)
+    if product_filter.posted_before is not None:
+        scope_conditions.append(ProductModel.date_posted < product_filter.posted_before)
+        
+    return scope_conditions
+
+
+def _build_product_filters(product_filter: ProductFilterSchema) -> list:
+    return _scope_filters(product_filter) + _price_filters(product_filter) + _stock_filters(product_filter)
+
+
+# sort key -> (column, descending), each pairs with an index on (column, id) so a page is one index range scan
+_PRODUCT_SORTS = {
+    "oldest": (ProductModel.date_posted, False),
+    "newest": (ProductModel.date_posted, True),
+    "price_asc": (ProductModel.price, False),
+    "price_desc": (ProductModel.price, True),
+    "name_asc": (ProductModel.name, False),
+    "name_desc": (ProductModel.name, True),
+}
+
+
+def _encode_product_cursor(product, sort: str) -> str:
+    sort_column, _ = _PRODUCT_SORTS[sort]
+    sort_value = getattr(product, sort_column.key)
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+        
+    # the sort key rides along so a cursor from one ordering is never applied to another
+    return encode_cursor([sort, sort_value, product.id])
+
+
+def _decode_product_cursor(cursor: str, sort: str) -> tuple:
+    try:
+        cursor_sort, sort_value, product_id = decode_cursor(cursor)
+        if cursor_sort != sort:
+            raise ValueError(f"cursor was made for the {cursor_sort} sort")
+        
+        if _PRODUCT_SORTS[sort][0] is ProductModel.date_posted:
+            sort_value = datetime.fromisoformat(sort_value)
+            
+        return sort_value, str(product_id)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Invalid product cursor was passed: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Why are you even here when you know you not supposed to be 🗿"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor was passed"
         )
         
+
+# fields a listing can project, compact is the grid view preset without the 2000 character description
+PRODUCT_LISTING_FIELDS = tuple(DisplayProductSchema.model_fields)
+COMPACT_PRODUCT_FIELDS = tuple(CompactProductSchema.model_fields)
+
+
+def _resolve_product_fields(fields: str = None) -> tuple:
+    if not fields:
+        return PRODUCT_LISTING_FIELDS
+    if fields == "compact":
+        return COMPACT_PRODUCT_FIELDS
+    
+    requested_fields = { field.strip() for field in fields.split(",") if field.strip() }
+    unknown_fields = requested_fields - set(PRODUCT_LISTING_FIELDS)
+    if unknown_fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields {', '.join(sorted(unknown_fields))}, pick from {', '.join(PRODUCT_LISTING_FIELDS)} or compact"
+        )
+        
+    # the id always comes back so clients can tell the items apart
+    requested_fields.add("id")
+    return tuple(field for field in PRODUCT_LISTING_FIELDS if field in requested_fields)
+
+
+def _product_columns(product_fields: tuple) -> list:
+    # quantity is read through available_quantity so hot products report the stock in their slots too
+    return [
+        ProductModel.available_quantity.label("quantity") if field == "quantity" else getattr(ProductModel, field)
+        for field in product_fields
+    ]
+
+
+def _serialize_product_row(product_row, product_fields: tuple) -> dict:
+    # rows come straight from a column select, no orm objects or schema validation in between
+    serialized_product = { field: getattr(product_row, field) for field in product_fields }
+    if serialized_product.get("price") is not None:
+        serialized_product["price"] = float(serialized_product["price"])
+        
+    return serialized_product
+
+
+def _resolve_page_size(limit: int = None) -> int:
+    return resolve_page_size(limit, PRODUCTS_PAGE_SIZE, PRODUCTS_MAX_PAGE_SIZE)
+
+
+def _products_listing_query(sort: str = "oldest", product_fields: tuple = PRODUCT_LISTING_FIELDS):
+    sort_column, descending = _PRODUCT_SORTS[sort]
+    
+    # the sort column is selected even when it was not asked for, the next cursor is built from it
+    listing_columns = _product_columns(product_fields)
+    if sort_column.key not in product_fields:
+        listing_columns.append(sort_column)
+        
+    if descending:
+        return select(*listing_columns).order_by(sort_column.desc(), ProductModel.id.desc())
+    
+    return select(*listing_columns).order_by(sort_column, ProductModel.id)
+
+
+def _after_cursor_condition(sort: str, sort_value, product_id: str):
+    sort_column, descending = _PRODUCT_SORTS[sort]
+    if descending:
+        return or_(sort_column < sort_value, and_(sort_column == sort_value, ProductModel.id < product_id))
+    
+    return or_(sort_column > sort_value, and_(sort_column == sort_value, ProductModel.id > product_id))
+
+
+def _price_facet_buckets() -> list:
+    bucket_bounds = sorted(set(PRODUCT_PRICE_FACET_BOUNDS))
+    return [
+        (lower_bound, bucket_bounds[position + 1] if position + 1 < len(bucket_bounds) else None)
+        for position, lower_bound in enumerate(bucket_bounds)
+    ]
+
+
+def _count_where(*conditions):
+    # sum(case) instead of count(*) filter (...) so it runs the same on every dialect
+    return func.coalesce(func.sum(case((and_(true(), *conditions), 1), else_=0)), 0)
+
+
+async def _product_facets(db: AsyncSession, product_filter: ProductFilterSchema) -> dict:
+    price_conditions = _price_filters(product_filter)
+    stock_conditions = _stock_filters(product_filter)
+    price_buckets = _price_facet_buckets()
+    
+    # one pass over the rows in scope: each facet counts with every filter except its own,
+    # so picking a price range still shows how many products sit in the other ranges
+    facet_columns = [
+        _count_where(*price_conditions, *stock_conditions),
+        _count_where(*price_conditions, ProductModel.available_quantity > 0),
+        _count_where(*price_conditions, ProductModel.available_quantity <= 0),
+    ]
+    for lower_bound, upper_bound in price_buckets:
+        bucket_conditions = [ProductModel.price >= lower_bound]
+        if upper_bound is not None:
+            bucket_conditions.append(ProductModel.price < upper_bound)
+        facet_columns.append(_count_where(*stock_conditions, *bucket_conditions))
+        
+    facet_row = (await db.execute(select(*facet_columns).where(*_scope_filters(product_filter)))).one()
+    
+    return {
+        "total": int(facet_row[0]),
+        "stock": { "in_stock": int(facet_row[1]), "out_of_stock": int(facet_row[2]) },
+        "price_buckets": [
+            { "min_price": lower_bound, "max_price": upper_bound, "count": int(bucket_count) }
+            for (lower_bound, upper_bound), bucket_count in zip(price_buckets, facet_row[3:])
+        ]
+    }
+
+
+async def view_all_products(
+    db: AsyncSession,
+    cursor: str = None,
+    limit: int = None,
+    product_filter: ProductFilterSchema = None,
+    sort: str = "oldest",
+    include_facets: bool = False,
+    fields: str = None
+):
+    page_size = _resolve_page_size(limit)
+    product_fields = _resolve_product_fields(fields)
+    if sort not in _PRODUCT_SORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Sort has to be one of {', '.join(_PRODUCT_SORTS)}"
+        )
+        
+    filter_cache_key = product_filter.model_dump_json(exclude_none=True) if product_filter is not None else ""
+    listing_cache_key = f"listing:{sort}:{filter_cache_key}:{int(include_facets)}:{','.join(product_fields)}:{cursor or ''}:{page_size}"
+    cached_products_page = await product_cache.get(listing_cache_key)
+    if cached_products_page is not None:
+        return cached_products_page
+        
+    products_query = _products_listing_query(sort, product_fields).where(*_build_product_filters(product_filter))
+    
+    if cursor:
+        last_sort_value, last_product_id = _decode_product_cursor(cursor, sort)
+        products_query = products_query.where(_after_cursor_condition(sort, last_sort_value, last_product_id))
+        
     try:
-        all_products = db.execute(select(ProductModel)).scalars().all()
+        # fetch one extra row so we know if there is another page without running a count
+        products_page = (await db.execute(products_query.limit(page_size + 1))).all()
         
-        if not all_products:
-            return []
+        next_cursor = None
+        if len(products_page) > page_size:
+            products_page = products_page[:page_size]
+            next_cursor = _encode_product_cursor(products_page[-1], sort)
+            
+        serialized_products_page = {
+            "items": [_serialize_product_row(product_row, product_fields) for product_row in products_page],
+            "next_cursor": next_cursor
+        }
+        if include_facets:
+            serialized_products_page["facets"] = await _product_facets(db, product_filter)
+            
+        products_page_body = dumps_json(serialized_products_page)
+        # deletes do not move any row's timestamp, so listings are validated by content only
+        products_page_payload = EncodedPayload(body=products_page_body, etag=content_etag(products_page_body))
+        await product_cache.set(listing_cache_key, products_page_payload)
         
-        return all_products
+        return products_page_payload
         
     except Exception as e:
         print(f"Unable to fetch products from the db: {str(e)}")
@@ -139,21 +440,62 @@ def view_all_products(
             detail="Unable to fetch products at this time sorry"
         )
         
-def view_single_product(
-    db: Session,
-    user_id: str ,
+
+def stream_all_products(fields: str = None):
+    product_fields = _resolve_product_fields(fields)
+    
+    # the stream outlives the request scoped session, so it gets its own session and
+    # walks a server side cursor in batches instead of loading the catalog into memory
+    async def _generate_products_ndjson():
+        async with AsyncLocalSession() as stream_db:
+            try:
+                products_result = await stream_db.stream(
+                    _products_listing_query(product_fields=product_fields),
+                    execution_options={ "yield_per": PRODUCTS_STREAM_BATCH_SIZE }
+                )
+                
+                async for product_row in products_result:
+                    yield dumps_json(_serialize_product_row(product_row, product_fields)) + b"\n"
+                    
+            except Exception as e:
+                print(f"There was an error trying to stream the products: {str(e)}")
+                raise
+            
+    return _generate_products_ndjson()
+    
+
+# product etags name the row version and the available stock, so If-None-Match is answered
+# without reading the body. every edit of a product has to bump the version, sales never do
+# (whether they come off the product row or the stock slots) and only move the stock part
+
+def product_etag(product_instance) -> str:
+    return f'"{product_instance.id}-{product_instance.version}-{product_instance.available_quantity}"'
+
+
+def _matches_product_version(if_match: str, product_instance: ProductModel) -> bool:
+    # If-Match only compares the version, so stock sold in the meantime is not a conflicting edit.
+    # a quantity set by the edit is the whole new stock, sales since it was loaded are not added back.
+    # the W/ prefix only comes from compressing the response, it is the same version
+    current_version = f"{product_instance.id}-{product_instance.version}"
+    for client_etag in if_match.split(","):
+        client_etag = client_etag.strip().removeprefix("W/")
+        if client_etag == "*" or client_etag.strip('"').rsplit("-", 1)[0] == current_version:
+            return True
+    return False
+
+
+async def view_single_product(
+    db: AsyncSession,
     product_id: str
 ):
-    check_admin_user = db.execute(select(AdminUserModel).where(AdminUserModel.id == user_id)).scalar_one_or_none()
-    check_normal_user = db.execute(select(UserModel).where(UserModel.id == user_id)).scalar_one_or_none()
-    
-    if not check_admin_user or not check_normal_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Why are you even here when you know you not supposed to be 🗿"
-        )
+    # a cached payload carries its validators, so a revalidation against a warm cache is
+    # answered without touching the row or serializing anything. a miss fills the cache even
+    # when the client copy turns out to be current, so the next poll is a hit
+    cached_product = await product_cache.get(f"product:{product_id}")
+    if cached_product is not None:
+        return cached_product
         
-    single_product_instance = db.execute(select(ProductModel).where(ProductModel.id == product_id)).scalar_one_or_none()
+    single_product_instance = (await db.execute(select(ProductModel).where(ProductModel.id == product_id))).scalar_one_or_none()
     if not single_product_instance:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -161,7 +503,16 @@ def view_single_product(
         )
         
     try:
-        return single_product_instance    
+        # the schema's compiled serializer writes the json bytes directly
+        product_body = DisplayProductSchema.model_validate(single_product_instance).model_dump_json().encode("utf-8")
+        product_payload = EncodedPayload(
+            body=product_body,
+            etag=product_etag(single_product_instance),
+            last_modified=single_product_instance.updated_at
+        )
+        await product_cache.set(f"product:{product_id}", product_payload)
+        
+        return product_payload
         
     except Exception as e:
         print(f"There was an error trying to get the product details: {str(e)}")
@@ -171,8 +522,8 @@ def view_single_product(
         )
         
 
-def edit_a_product(
-    db: Session,
+async def edit_a_product(
+    db: AsyncSession,
     user_id: str,
     product_id: str,
     name: str = Form(None, description="new product name"),
@@ -180,21 +531,15 @@ def edit_a_product(
     price: int = Form(None, description="new product price"),
     quantity: int = Form(None, description="new product price"),
     product_header_image: UploadFile = File(None, description="new product header image"),
+    if_match: str = None
 ):
-    check_admin_user = db.execute(select(AdminUserModel).where(AdminUserModel.id == user_id)).scalar_one_or_none()
-    
-    if not check_admin_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Why are you even here when you know you not supposed to be 🗿"
-        )
-        
-    product_instance = db.execute(select(ProductModel).where(
+    # user_id comes from an admin principal, so owning the row is the only check left
+    product_instance = (await db.execute(select(ProductModel).where(
         and_(
             ProductModel.id == product_id,
-            ProductModel.associated_admin_user_id == check_admin_user.id
+            ProductModel.associated_admin_user_id == user_id
         )
-    )).scalar_one_or_none()
+    ))).scalar_one_or_none()
     
     if not product_instance:
         raise HTTPException(
@@ -202,10 +547,19 @@ def edit_a_product(
             detail="Requested product to edit was not found sorry."
         )
         
+    if if_match is not None and not _matches_product_version(if_match, product_instance):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This product was changed since you loaded it, reload it and try again"
+        )
+        
+    staged_product_image = None
+    if product_header_image is not None:
+        staged_product_image = await stage_image(product_header_image)
+        
     try:
-        if product_header_image is not None:
-            new_product_header_image_url = _upload_image_to_cloudinary(image_file=product_header_image)
-            product_instance.product_header_image = new_product_header_image_url
+        if staged_product_image is not None:
+            product_instance.product_header_image = staged_product_image.url
         if name is not None:
             product_instance.name = name 
         if description is not None:
@@ -214,14 +568,45 @@ def edit_a_product(
             product_instance.price = price 
         if quantity is not None:
             product_instance.quantity = quantity
+            # the new quantity is the whole stock, the rebalancer spreads it over the slots again
+            if product_instance.is_hot:
+                await db.execute(
+                    update(ProductStockSlotModel)
+                    .where(ProductStockSlotModel.product_id == product_id)
+                    .values(quantity=0)
+                )
+                
+        queue_product_cache_invalidation(db, product_id)
+        if staged_product_image is not None:
+            queue_image_upload(
+                db,
+                staged_product_image,
+                ProductModel.product_header_image,
+                follow_up_events=[(PRODUCT_CACHE_INVALIDATION_TOPIC, { "product_ids": [product_id] })]
+            )
             
-        db.commit()
-        db.refresh()
+        await db.commit()
+        # committed, the file belongs to the queued upload now
+        staged_product_image = None
+        await db.refresh(product_instance)
         
         return product_instance
         
+    except StaleDataError:
+        # version_id_col turned the update into "where version = <what we read>" and another
+        # writer got there first, nothing was written and no row lock was ever held
+        await db.rollback()
+        if staged_product_image is not None:
+            discard_staged_image(staged_product_image)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This product was changed while you were editing it, reload it and try again"
+        )
+        
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        if staged_product_image is not None:
+            discard_staged_image(staged_product_image)
         print(f"There was an error trying to edit the product details: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -229,42 +614,43 @@ def edit_a_product(
         )
         
 
-def delete_a_product(
-    db: Session,
+async def delete_a_product(
+    db: AsyncSession,
     user_id: str,
     product_id: str
 ):
-    check_admin_user = db.execute(select(AdminUserModel).where(AdminUserModel.id == user_id)).scalar_one_or_none()
-    
-    if not check_admin_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Why are you even here when you know you not supposed to be 🗿"
-        )
-        
-    product_instance = db.execute(select(ProductModel).where(
-        and_(
-            ProductModel.id == product_id,
-            ProductModel.associated_admin_user_id == check_admin_user.id
-        )
-    )).scalar_one_or_none()
-    
-    if not product_instance:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Requested product to edit was not found sorry."
-        )
-        
+    # user_id comes from an admin principal, so owning the row is the only check left.
+    # a core delete keeps version_id_col out of the where clause, an orm delete of the loaded
+    # row would fail when the image upload swapped its url in and moved the version meanwhile
     try:
-        db.delete(product_instance)
-        db.commit()
+        deleted_product_id = (await db.execute(
+            delete(ProductModel)
+            .where(
+                and_(
+                    ProductModel.id == product_id,
+                    ProductModel.associated_admin_user_id == user_id
+                )
+            )
+            .returning(ProductModel.id)
+            .execution_options(synchronize_session=False)
+        )).scalar_one_or_none()
         
-        return { "message": "Product has been deleted" }
+        if deleted_product_id is not None:
+            queue_product_cache_invalidation(db, product_id)
+        await db.commit()
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"There was an error trying to delete the product: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Unable to delete the requested product due to an error 🤣"
-        )
\ No newline at end of file
+        )
+        
+    if deleted_product_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Requested product to edit was not found sorry."
+        )
+        
+    return { "message": "Product has been deleted" }
\ No newline at end of file
@@ -0,0 +1,288 @@
+from .schemas import *
+from .models import *
+from .crud import queue_product_cache_invalidation
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, delete, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+from dotenv import load_dotenv
+from ..database import AsyncLocalSession
+import asyncio
+import os
+import random
+
+load_dotenv()
+
+PRODUCT_STOCK_SLOTS = int(os.getenv("PRODUCT_STOCK_SLOTS", "8"))
+# slots with enough stock a checkout tries, in random order, before it falls back to the product row
+PRODUCT_STOCK_SLOT_ATTEMPTS = int(os.getenv("PRODUCT_STOCK_SLOT_ATTEMPTS", "3"))
+PRODUCT_STOCK_REBALANCE_INTERVAL = float(os.getenv("PRODUCT_STOCK_REBALANCE_INTERVAL", "5"))
+# slots get evened out once the emptiest one holds less than this share of the fullest one
+PRODUCT_STOCK_REBALANCE_SKEW = float(os.getenv("PRODUCT_STOCK_REBALANCE_SKEW", "0.5"))
+
+_inventory_stats = { "slot_reservations": 0, "row_reservations": 0, "spread_reservations": 0, "rebalanced": 0 }
+
+
+class OutOfStockError(Exception):
+    def __init__(self, product_id: str):
+        self.product_id = product_id
+
+
+def _split_stock(quantity: int, slots: int) -> list:
+    per_slot, remainder = divmod(max(quantity, 0), slots)
+    return [per_slot + (1 if slot < remainder else 0) for slot in range(slots)]
+
+
+# every reservation is a single conditional update, the stock check and the decrement can never
+# be split by another checkout: a slot or row without enough left just matches nothing
+
+async def _reserve_from_slots(db: AsyncSession, product_id: str, quantity: int) -> bool:
+    # the read takes no locks, a slot that sold out since just fails its update and the next one is tried
+    candidate_slots = list((await db.execute(
+        select(ProductStockSlotModel.slot)
+        .where(ProductStockSlotModel.product_id == product_id, ProductStockSlotModel.quantity >= quantity)
+    )).scalars().all())
+    random.shuffle(candidate_slots)
+
+    for slot in candidate_slots[:PRODUCT_STOCK_SLOT_ATTEMPTS]:
+        reserved_slot = await db.execute(
+            update(ProductStockSlotModel)
+            .where(
+                ProductStockSlotModel.product_id == product_id,
+                ProductStockSlotModel.slot == slot,
+                ProductStockSlotModel.quantity >= quantity
+            )
+            .values(quantity=ProductStockSlotModel.quantity - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if reserved_slot.rowcount == 1:
+            _inventory_stats["slot_reservations"] += 1
+            return True
+
+    return False
+
+
+async def _reserve_from_product_row(db: AsyncSession, product_id: str, quantity: int) -> bool:
+    # a sale leaves the version alone like a slot sale does, the etag still moves with the stock
+    reserved_product = await db.execute(
+        update(ProductModel)
+        .where(
+            ProductModel.id == product_id,
+            ProductModel.quantity >= quantity
+        )
+        .values(quantity=ProductModel.quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if reserved_product.rowcount == 1:
+        _inventory_stats["row_reservations"] += 1
+        return True
+
+    return False
+
+
+async def _reserve_across_slots(db: AsyncSession, product_id: str, quantity: int) -> bool:
+    # no single slot holds the whole line, so it is taken piece by piece, fullest slots first.
+    # whatever was taken stays in the caller's transaction and is rolled back with it on failure
+    stock_slots = (await db.execute(
+        select(ProductStockSlotModel.slot, ProductStockSlotModel.quantity)
+        .where(ProductStockSlotModel.product_id == product_id, ProductStockSlotModel.quantity > 0)
+        .order_by(ProductStockSlotModel.quantity.desc())
+    )).all()
+
+    remaining_quantity = quantity
+    for stock_slot in stock_slots:
+        taken_quantity = min(stock_slot.quantity, remaining_quantity)
+        taken_slot = await db.execute(
+            update(ProductStockSlotModel)
+            .where(
+                ProductStockSlotModel.product_id == product_id,
+                ProductStockSlotModel.slot == stock_slot.slot,
+                ProductStockSlotModel.quantity >= taken_quantity
+            )
+            .values(quantity=ProductStockSlotModel.quantity - taken_quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if taken_slot.rowcount == 1:
+            remaining_quantity -= taken_quantity
+        if remaining_quantity == 0:
+            break
+
+    if remaining_quantity > 0 and not await _reserve_from_product_row(db, product_id, remaining_quantity):
+        return False
+
+    _inventory_stats["spread_reservations"] += 1
+    return True
+
+
+async def reserve_stock(
+    db: AsyncSession,
+    product_id: str,
+    quantity: int,
+    is_hot: bool = False
+):
+    # hot products are sold out of a random slot, so concurrent checkouts mostly lock different
+    # rows. everything else (and hot stock that was not spread yet) comes off the product row
+    if is_hot and await _reserve_from_slots(db, product_id, quantity):
+        return
+    if await _reserve_from_product_row(db, product_id, quantity):
+        return
+    if is_hot and await _reserve_across_slots(db, product_id, quantity):
+        return
+
+    raise OutOfStockError(product_id)
+
+
+async def set_product_hot(
+    db: AsyncSession,
+    user_id: str,
+    product_id: str,
+    sharding_data: ProductStockShardingSchema
+):
+    # user_id comes from an admin principal, so owning the row is the only check left
+    product_instance = (await db.execute(select(ProductModel).where(
+        and_(
+            ProductModel.id == product_id,
+            ProductModel.associated_admin_user_id == user_id
+        )
+    ))).scalar_one_or_none()
+
+    if not product_instance:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Requested product was not found sorry."
+        )
+
+    if product_instance.is_hot == sharding_data.is_hot:
+        return product_instance
+
+    try:
+        if sharding_data.is_hot:
+            # the current stock moves into the slots right away, the product row keeps nothing
+            slot_quantities = _split_stock(product_instance.quantity or 0, sharding_data.slots or PRODUCT_STOCK_SLOTS)
+            db.add_all([
+                ProductStockSlotModel(product_id=product_id, slot=slot, quantity=slot_quantity)
+                for slot, slot_quantity in enumerate(slot_quantities)
+            ])
+            product_instance.quantity = 0
+        else:
+            # the slots are deleted and summed in one statement, so a sale cannot land in between
+            slot_quantities = (await db.execute(
+                delete(ProductStockSlotModel)
+                .where(ProductStockSlotModel.product_id == product_id)
+                .returning(ProductStockSlotModel.quantity)
+                .execution_options(synchronize_session=False)
+            )).scalars().all()
+            product_instance.quantity = (product_instance.quantity or 0) + sum(slot_quantities)
+
+        product_instance.is_hot = sharding_data.is_hot
+        queue_product_cache_invalidation(db, product_id)
+        await db.commit()
+        await db.refresh(product_instance)
+
+        return product_instance
+
+    except StaleDataError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This product was changed while you were editing it, reload it and try again"
+        )
+
+    except Exception as e:
+        await db.rollback()
+        print(f"There was an error trying to change the stock slots of the product: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to change the stock slots of this product"
+        )
+
+
+def _needs_rebalance(reserve_quantity: int, slot_quantities: list) -> bool:
+    if reserve_quantity > 0:
+        return True
+
+    emptiest_slot, fullest_slot = min(slot_quantities), max(slot_quantities)
+    if fullest_slot - emptiest_slot <= 1:
+        return False
+    return emptiest_slot < fullest_slot * PRODUCT_STOCK_REBALANCE_SKEW
+
+
+async def rebalance_product_stock(db: AsyncSession, product_id: str) -> bool:
+    # the product row and its slots are locked while the stock is moved, checkouts of this
+    # product wait for the commit and then see the new split. the total never changes, so
+    # the version and the cached product stay as they are
+    reserve_quantity = (await db.execute(
+        select(ProductModel.quantity)
+        .where(ProductModel.id == product_id, ProductModel.is_hot.is_(True))
+        .with_for_update()
+    )).scalar_one_or_none()
+    if reserve_quantity is None:
+        return False
+
+    stock_slots = (await db.execute(
+        select(ProductStockSlotModel)
+        .where(ProductStockSlotModel.product_id == product_id)
+        .order_by(ProductStockSlotModel.slot)
+        .with_for_update()
+    )).scalars().all()
+    if not stock_slots or not _needs_rebalance(reserve_quantity or 0, [stock_slot.quantity for stock_slot in stock_slots]):
+        await db.rollback()
+        return False
+
+    total_quantity = (reserve_quantity or 0) + sum(stock_slot.quantity for stock_slot in stock_slots)
+    for stock_slot, slot_quantity in zip(stock_slots, _split_stock(total_quantity, len(stock_slots))):
+        stock_slot.quantity = slot_quantity
+
+    await db.execute(
+        update(ProductModel)
+        .where(ProductModel.id == product_id)
+        .values(quantity=0)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    return True
+
+
+class StockRebalancer:
+    def __init__(self, interval: float = PRODUCT_STOCK_REBALANCE_INTERVAL):
+        self.interval = interval
+        self._rebalancer_task = None
+
+    async def start(self):
+        self._rebalancer_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._rebalancer_task is not None:
+            self._rebalancer_task.cancel()
+            await asyncio.gather(self._rebalancer_task, return_exceptions=True)
+            self._rebalancer_task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.rebalance_all()
+            except Exception as e:
+                print(f"There was an error trying to rebalance the stock slots: {str(e)}")
+
+    async def rebalance_all(self):
+        async with AsyncLocalSession() as db:
+            hot_product_ids = (await db.execute(select(ProductModel.id).where(ProductModel.is_hot.is_(True)))).scalars().all()
+
+        # one short transaction per product, so a busy product never holds up the others
+        for product_id in hot_product_ids:
+            async with AsyncLocalSession() as db:
+                try:
+                    if await rebalance_product_stock(db, product_id):
+                        _inventory_stats["rebalanced"] += 1
+                except Exception as e:
+                    await db.rollback()
+                    print(f"Unable to rebalance the stock slots of product {product_id}: {str(e)}")
+
+
+def get_inventory_stats() -> dict:
+    return dict(_inventory_stats)
+
+
+stock_rebalancer = StockRebalancer()
@@ -1,11 +1,28 @@
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Integer, Double
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Integer, Double, Index, select, func, case, false
+from sqlalchemy.orm import relationship, column_property
 from datetime import datetime, timezone
 from uuid import uuid4
 from ..database import Base
 
+# stock of hot products is split over a few of these rows, so concurrent checkouts of the same
+# product decrement different rows instead of queueing on the product row lock
+class ProductStockSlotModel(Base):
+    __tablename__ = "product_stock_slots"
+    
+    product_id = Column(String, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    slot = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
+
 class ProductModel(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # edit/delete/bulk writes filter on the owner, listings walk (sort column, id) for every sort key
+        Index("ix_products_admin_user_id_id", "associated_admin_user_id", "id"),
+        Index("ix_products_admin_user_id_date_posted_id", "associated_admin_user_id", "date_posted", "id"),
+        Index("ix_products_date_posted_id", "date_posted", "id"),
+        Index("ix_products_price_id", "price", "id"),
+    )
     
     id = Column(String, primary_key=True, index=True, default=lambda: uuid4().hex)
     associated_admin_user_id = Column(String, ForeignKey("admin_users.id"), nullable=False)
@@ -15,5 +32,30 @@ class ProductModel(Base):
     quantity = Column(Integer, default=1)
     product_header_image = Column(String, nullable=False)
     date_posted = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # set by every update statement, orm or bulk, it backs Last-Modified and the product etag
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # bumped by every edit, orm flushes through version_id_col and core update statements themselves.
+    # sales only change the stock and leave it alone
+    version = Column(Integer, nullable=False, server_default="1")
+    # hot products keep their stock in product_stock_slots, quantity is then only the part not spread yet
+    is_hot = Column(Boolean, nullable=False, server_default=false())
+    
+    # what can actually be sold, the slots are only summed for hot products
+    available_quantity = column_property(
+        case(
+            (
+                is_hot,
+                quantity + func.coalesce(
+                    select(func.sum(ProductStockSlotModel.quantity))
+                    .where(ProductStockSlotModel.product_id == id)
+                    .scalar_subquery(),
+                    0
+                )
+            ),
+            else_=quantity
+        )
+    )
+    
+    admin_user = relationship("AdminUserModel", back_populates="products")
     
-    admin_user = relationship("AdminUserModel", back_populates="products")
\ No newline at end of file
+    __mapper_args__ = { "version_id_col": version }
\ No newline at end of file
@@ -1,10 +1,17 @@
 from .crud import *
+from .bulk import *
+from .search import *
+from .inventory import set_product_hot
 from .schemas import *
-from ..authentication.routes import user_oauth, admin_oauth
-from ..authentication.jwt_handeler import *
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status, Depends, UploadFile, File, Form, APIRouter
-from ..database import get_db
+from ..authentication.dependencies import get_current_admin_principal, get_current_user_principal
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status, Depends, UploadFile, File, Form, APIRouter, Query, Request, Header, Response
+from fastapi.responses import StreamingResponse
+from ..database import get_async_db
+from ..responses import conditional_json_response
+from ..idempotency.keys import run_idempotent, request_fingerprint
+from ..images.ingestion import stage_image, discard_staged_image
+from functools import partial
 
 
 router = APIRouter(
@@ -13,127 +20,283 @@ router = APIRouter(
 )
 
 
-@router.post("/admin/new", status_code=status.HTTP_201_CREATED)
-def create_new_product_route(
-    db: Session = Depends(get_db),
+@router.post("/admin/new", status_code=status.HTTP_201_CREATED, response_model=DisplayProductSchema)
+async def create_new_product_route(
+    db: AsyncSession = Depends(get_async_db),
     name: str = Form(..., description="product name"),
     description: str = Form(..., description="description"),
     price: int = Form(..., description="price"),
     quantity: int = Form(..., description="quantity"),
     product_header_image: UploadFile = File(..., description="product_header_image"),
-    current_user_token: str = Depends(admin_oauth)
+    idempotency_key: str = Header(None, description="retries with the same key get the first response back instead of creating the product again"),
+    current_user: dict = Depends(get_current_admin_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
-    
-    return upload_new_product(
+    # staged up front so the fingerprint covers the image content, not just what the file is called
+    staged_product_image = await stage_image(product_header_image)
+
+    try:
+        idempotent_response = await run_idempotent(
+            scope="products:create",
+            user_id=current_user["user_id"],
+            idempotency_key=idempotency_key,
+            fingerprint=request_fingerprint(name, description, price, quantity, staged_product_image.sha256),
+            handler=partial(
+                upload_new_product,
+                db=db,
+                associated_admin_user_id=current_user["user_id"],
+                name=name,
+                description=description,
+                price=price,
+                quantity=quantity,
+                staged_product_image=staged_product_image,
+            ),
+            serialize=lambda product_instance: DisplayProductSchema.model_validate(product_instance).model_dump(mode="json"),
+            status_code=status.HTTP_201_CREATED
+        )
+    except HTTPException:
+        # the handler never took the image over, a conflict or a failed create leaves it behind
+        discard_staged_image(staged_product_image)
+        raise
+
+    # a replay answers with the product the first request made, this copy of the image is not needed
+    if idempotent_response.replayed:
+        discard_staged_image(staged_product_image)
+    return idempotent_response.to_response()
+
+
+@router.post("/admin/import", status_code=status.HTTP_200_OK, response_model=ProductImportReportSchema, response_model_exclude_none=True)
+async def bulk_import_products_route(
+    db: AsyncSession = Depends(get_async_db),
+    import_file: UploadFile = File(..., description="csv with a header row, or ndjson with one product per line"),
+    import_format: str = Query(None, description="csv or ndjson, guessed from the file when left out"),
+    current_user: dict = Depends(get_current_admin_principal)
+):
+    return await bulk_import_products(
         db=db,
-        associated_admin_user_id=user_id,
-        name=name,
-        description=description,
-        price=price,
-        quantity=quantity,
-        product_header_image=product_header_image,
+        associated_admin_user_id=current_user["user_id"],
+        import_file=import_file,
+        import_format=import_format
     )
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-def get_all_products_route_user_side(
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(user_oauth)
+@router.patch("/admin/bulk", status_code=status.HTTP_200_OK, response_model=BulkWriteResultSchema)
+async def bulk_update_products_route(
+    update_data: BulkUpdateProductsSchema,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_admin_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
-    
-    return view_all_products(
+    return await bulk_update_products(
+        db=db,
+        user_id=current_user["user_id"],
+        update_data=update_data
+    )
+
+
+@router.post("/admin/bulk/delete", status_code=status.HTTP_200_OK, response_model=BulkWriteResultSchema)
+async def bulk_delete_products_route(
+    delete_data: BulkDeleteProductsSchema,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_admin_principal)
+):
+    return await bulk_delete_products(
+        db=db,
+        user_id=current_user["user_id"],
+        delete_data=delete_data
+    )
+
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=ProductPageSchema)
+async def get_all_products_route_user_side(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    cursor: str = Query(None, description="cursor returned by the previous page"),
+    limit: int = Query(None, description="page size"),
+    product_filter: ProductFilterSchema = Depends(),
+    sort: ProductSortKey = Query("oldest", description="listing order, the cursor only works with the sort it came from"),
+    include_facets: bool = Query(False, description="add price bucket and stock counts for the filtered listing"),
+    fields: str = Query(None, description="comma separated fields to return (id is always included), or compact for id, name, price and image"),
+    current_user: dict = Depends(get_current_user_principal)
+):
+    products_page_payload = await view_all_products(
         db=db ,
-        user_id=user_id
+        cursor=cursor,
+        limit=limit,
+        product_filter=product_filter,
+        sort=sort,
+        include_facets=include_facets,
+        fields=fields
+    )
+    return conditional_json_response(request.headers, products_page_payload)
+    
+
+@router.get("/stream", status_code=status.HTTP_200_OK)
+async def stream_all_products_route_user_side(
+    fields: str = Query(None, description="comma separated fields to return (id is always included), or compact for id, name, price and image"),
+    current_user: dict = Depends(get_current_user_principal)
+):
+    return StreamingResponse(
+        stream_all_products(fields=fields),
+        media_type="application/x-ndjson"
     )
     
 
-@router.get("/admin/products", status_code=status.HTTP_200_OK)
-def get_all_products_route_admin_side(
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(admin_oauth)
+@router.get("/search", status_code=status.HTTP_200_OK, response_model=ProductPageSchema)
+async def search_products_route_user_side(
+    request: Request,
+    q: str = Query(..., min_length=1, description="words to look for in product names and descriptions, each one matched as a prefix"),
+    db: AsyncSession = Depends(get_async_db),
+    cursor: str = Query(None, description="cursor returned by the previous page"),
+    limit: int = Query(None, description="page size"),
+    fields: str = Query(None, description="comma separated fields to return (id is always included), or compact for id, name, price and image"),
+    current_user: dict = Depends(get_current_user_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
+    search_page_payload = await search_products(
+        db=db,
+        query=q,
+        cursor=cursor,
+        limit=limit,
+        fields=fields
+    )
+    return conditional_json_response(request.headers, search_page_payload)
     
-    return view_all_products(
+
+@router.get("/admin/products", status_code=status.HTTP_200_OK, response_model=ProductPageSchema)
+async def get_all_products_route_admin_side(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    cursor: str = Query(None, description="cursor returned by the previous page"),
+    limit: int = Query(None, description="page size"),
+    product_filter: ProductFilterSchema = Depends(),
+    sort: ProductSortKey = Query("oldest", description="listing order, the cursor only works with the sort it came from"),
+    include_facets: bool = Query(False, description="add price bucket and stock counts for the filtered listing"),
+    fields: str = Query(None, description="comma separated fields to return (id is always included), or compact for id, name, price and image"),
+    current_user: dict = Depends(get_current_admin_principal)
+):
+    products_page_payload = await view_all_products(
         db=db ,
-        user_id=user_id
+        cursor=cursor,
+        limit=limit,
+        product_filter=product_filter,
+        sort=sort,
+        include_facets=include_facets,
+        fields=fields
     )
+    return conditional_json_response(request.headers, products_page_payload)
     
 
-@router.get("/{product_id}", status_code=status.HTTP_200_OK)
-def get_single_product_details_route_user_side(
-    product_id: str,
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(user_oauth)
+@router.get("/admin/products/stream", status_code=status.HTTP_200_OK)
+async def stream_all_products_route_admin_side(
+    fields: str = Query(None, description="comma separated fields to return (id is always included), or compact for id, name, price and image"),
+    current_user: dict = Depends(get_current_admin_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
+    return StreamingResponse(
+        stream_all_products(fields=fields),
+        media_type="application/x-ndjson"
+    )
     
-    return view_single_product(
+
+@router.get("/admin/products/search", status_code=status.HTTP_200_OK, response_model=ProductPageSchema)
+async def search_products_route_admin_side(
+    request: Request,
+    q: str = Query(..., min_length=1, description="words to look for in product names and descriptions, each one matched as a prefix"),
+    db: AsyncSession = Depends(get_async_db),
+    cursor: str = Query(None, description="cursor returned by the previous page"),
+    limit: int = Query(None, description="page size"),
+    fields: str = Query(None, description="comma separated fields to return (id is always included), or compact for id, name, price and image"),
+    current_user: dict = Depends(get_current_admin_principal)
+):
+    search_page_payload = await search_products(
         db=db,
-        user_id=user_id,
-        product_id=product_id
+        query=q,
+        cursor=cursor,
+        limit=limit,
+        fields=fields
     )
+    return conditional_json_response(request.headers, search_page_payload)
     
 
-@router.get("/admin/{product_id}", status_code=status.HTTP_200_OK)
-def get_single_product_details_route_user_side(
+@router.get("/{product_id}", status_code=status.HTTP_200_OK, response_model=DisplayProductSchema)
+async def get_single_product_details_route_user_side(
+    request: Request,
     product_id: str,
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(admin_oauth)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
+    product_payload = await view_single_product(
+        db=db,
+        product_id=product_id
+    )
+    return conditional_json_response(request.headers, product_payload)
     
-    return view_single_product(
+
+@router.get("/admin/{product_id}", status_code=status.HTTP_200_OK, response_model=DisplayProductSchema)
+async def get_single_product_details_route_admin_side(
+    request: Request,
+    product_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_admin_principal)
+):
+    product_payload = await view_single_product(
         db=db,
-        user_id=user_id,
         product_id=product_id
     )
+    return conditional_json_response(request.headers, product_payload)
     
 
-@router.put("/admin/edit/{product_id}", status_code=status.HTTP_202_ACCEPTED)
-def edit_product_details_route(
+@router.put("/admin/edit/{product_id}", status_code=status.HTTP_202_ACCEPTED, response_model=DisplayProductSchema)
+async def edit_product_details_route(
     product_id: str,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     name: str = Form(None, description="new product name"),
     description: str = Form(None, description="new description"),
     price: int = Form(None, description="new product price"),
     quantity: int = Form(None, description="new product price"),
     product_header_image: UploadFile = File(None, description="new product header image"),
-    current_user_token: str = Depends(admin_oauth)
+    if_match: str = Header(None, description="etag from the last read, the edit is refused with 409 if the product changed since"),
+    current_user: dict = Depends(get_current_admin_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
-    
-    return edit_a_product(
+    edited_product_instance = await edit_a_product(
         db=db,
-        user_id=user_id,
+        user_id=current_user["user_id"],
         product_id=product_id,
         name=name,
         description=description,
         price=price,
         quantity=quantity,
-        product_header_image=product_header_image
+        product_header_image=product_header_image,
+        if_match=if_match
     )
+    response.headers["ETag"] = product_etag(edited_product_instance)
+    return edited_product_instance
     
 
-@router.delete("/admin/delete/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_product_route(
+@router.put("/admin/hot/{product_id}", status_code=status.HTTP_202_ACCEPTED, response_model=DisplayProductSchema)
+async def set_product_hot_route(
     product_id: str,
-    db: Session = Depends(get_db),
-    current_user_token: str = Depends(admin_oauth)
+    sharding_data: ProductStockShardingSchema,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_admin_principal)
 ):
-    current_user_details = get_current_user_handeler(access_token=current_user_token)
-    user_id = current_user_details["user_id"]
+    hot_product_instance = await set_product_hot(
+        db=db,
+        user_id=current_user["user_id"],
+        product_id=product_id,
+        sharding_data=sharding_data
+    )
+    response.headers["ETag"] = product_etag(hot_product_instance)
+    return hot_product_instance
     
-    return delete_a_product(
+
+@router.delete("/admin/delete/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_product_route(
+    product_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_admin_principal)
+):
+    return await delete_a_product(
         db=db,
-        user_id=user_id,
+        user_id=current_user["user_id"],
         product_id=product_id
-    )
\ No newline at end of file
+    )
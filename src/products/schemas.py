@@ -1,7 +1,12 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, AliasChoices, model_validator
+from typing import List, Optional, Literal
 from datetime import datetime
 
 
+# listing sort keys, every one of them is walked by keyset with the product id as the tie breaker
+ProductSortKey = Literal["oldest", "newest", "price_asc", "price_desc", "name_asc", "name_desc"]
+
+
 class CreateProductSchema(BaseModel):
     name: str = Field(..., description="product name")
     description: str = Field(..., description="product description")
@@ -18,9 +23,121 @@ class DisplayProductSchema(BaseModel):
     name: str 
     description: str 
     product_header_image: str 
-    quantity: int 
+    # read off available_quantity on product rows, so the stock slots of hot products are counted
+    quantity: int = Field(..., validation_alias=AliasChoices("available_quantity", "quantity"))
     price: float 
     
     class Config:
-        from_attributes = True 
-        
\ No newline at end of file
+        from_attributes = True
+        
+
+class CompactProductSchema(BaseModel):
+    id: str
+    name: str
+    price: float
+    product_header_image: str
+    
+    class Config:
+        from_attributes = True
+        
+
+# listing items only carry the fields that were asked for, see fields= on the listing routes
+class ProductListItemSchema(BaseModel):
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    product_header_image: Optional[str] = None
+    quantity: Optional[int] = None
+    price: Optional[float] = None
+    
+    class Config:
+        from_attributes = True
+        
+
+class ProductPriceBucketSchema(BaseModel):
+    min_price: int = Field(..., description="lowest price in the bucket, inclusive")
+    max_price: Optional[int] = Field(None, description="highest price in the bucket, exclusive, null for the last bucket")
+    count: int
+    
+
+class ProductStockFacetSchema(BaseModel):
+    in_stock: int
+    out_of_stock: int
+    
+
+class ProductFacetsSchema(BaseModel):
+    total: int = Field(..., description="products matching every filter")
+    price_buckets: List[ProductPriceBucketSchema] = Field(..., description="counts ignore the price filter so other ranges stay visible")
+    stock: ProductStockFacetSchema = Field(..., description="counts ignore the in_stock filter")
+    
+
+class ProductPageSchema(BaseModel):
+    items: List[ProductListItemSchema]
+    next_cursor: Optional[str] = Field(None, description="opaque cursor for the next page, null on the last page")
+    facets: Optional[ProductFacetsSchema] = Field(None, description="only when include_facets is set")
+    
+    class Config:
+        from_attributes = True
+        
+
+class ProductImportRowResultSchema(BaseModel):
+    row: int = Field(..., description="1 based row number in the uploaded file")
+    status: Literal["created", "failed"]
+    id: Optional[str] = None
+    errors: Optional[List[str]] = None
+    
+
+class ProductImportReportSchema(BaseModel):
+    created: int
+    failed: int
+    results: List[ProductImportRowResultSchema]
+    
+
+class ProductFilterSchema(BaseModel):
+    min_price: Optional[int] = Field(None, description="lowest price, inclusive")
+    max_price: Optional[int] = Field(None, description="highest price, inclusive")
+    in_stock: Optional[bool] = Field(None, description="only products with (true) or without (false) stock")
+    admin_user_id: Optional[str] = Field(None, description="only products posted by this admin")
+    posted_after: Optional[datetime] = Field(None, description="posted at or after this time")
+    posted_before: Optional[datetime] = Field(None, description="posted before this time")
+    
+    class Config:
+        from_attributes = True
+        
+
+class BulkProductSelectionSchema(BaseModel):
+    ids: Optional[List[str]] = Field(None, max_length=10000, description="products to change")
+    filter: Optional[ProductFilterSchema] = Field(None, description="change every product matching this filter instead")
+    
+    @model_validator(mode="after")
+    def check_single_selection(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Pass either ids or filter")
+        return self
+    
+
+class BulkUpdateProductsSchema(BulkProductSelectionSchema):
+    price: Optional[int] = Field(None, ge=0, description="new price")
+    price_change_percent: Optional[float] = Field(None, gt=-100, description="relative price change, -20 takes 20% off")
+    quantity: Optional[int] = Field(None, ge=0, description="new quantity")
+    
+    @model_validator(mode="after")
+    def check_changes(self):
+        if self.price is not None and self.price_change_percent is not None:
+            raise ValueError("Pass either price or price_change_percent")
+        if self.price is None and self.price_change_percent is None and self.quantity is None:
+            raise ValueError("Nothing to update")
+        return self
+    
+
+class BulkDeleteProductsSchema(BulkProductSelectionSchema):
+    pass
+
+
+class BulkWriteResultSchema(BaseModel):
+    affected: int
+
+
+class ProductStockShardingSchema(BaseModel):
+    is_hot: bool = Field(..., description="spread the stock over slots (true) or fold it back into the product row (false)")
+    slots: Optional[int] = Field(None, ge=2, le=64, description="how many slots to spread over, defaults to PRODUCT_STOCK_SLOTS")
@@ -0,0 +1,162 @@
+from .schemas import *
+from .models import *
+from .crud import product_cache, _resolve_page_size, _resolve_product_fields, _product_columns, _serialize_product_row
+from ..pagination import encode_cursor, decode_cursor
+from fastapi import HTTPException, status
+from ..responses import EncodedPayload, content_etag, dumps_json
+from sqlalchemy import select, and_, or_, func, literal, literal_column, table, column
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+import os
+import re
+
+load_dotenv()
+
+PRODUCT_SEARCH_MAX_TERMS = int(os.getenv("PRODUCT_SEARCH_MAX_TERMS", "8"))
+PRODUCT_SEARCH_MAX_QUERY_LENGTH = int(os.getenv("PRODUCT_SEARCH_MAX_QUERY_LENGTH", "200"))
+
+# the search index lives next to the products table and is created in migration 0003:
+# postgres gets a gin index over this exact expression (the planner only uses it when the
+# query repeats it verbatim), sqlite gets an fts5 table kept in sync by triggers, rebuilt in
+# 0012 as an external content table whose rows share the products rowid
+PRODUCT_SEARCH_FTS_TABLE = "products_fts"
+PRODUCT_SEARCH_PG_INDEX = "ix_products_search"
+
+_PG_SEARCH_DOCUMENT = literal_column(
+    "(setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B'))"
+)
+_SQLITE_SEARCH_TABLE = literal_column(PRODUCT_SEARCH_FTS_TABLE)
+_SQLITE_SEARCH_ROWS = table(PRODUCT_SEARCH_FTS_TABLE, column("rowid"))
+_SQLITE_PRODUCT_ROWID = literal_column("products.rowid")
+
+_SEARCH_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _parse_search_terms(query: str) -> list:
+    # only word characters reach the database, so nothing the client types can be read
+    # as tsquery or fts5 syntax
+    search_terms = [term.lower() for term in _SEARCH_TERM_PATTERN.findall(query[:PRODUCT_SEARCH_MAX_QUERY_LENGTH])]
+    if not search_terms:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search query needs at least one word"
+        )
+
+    return search_terms[:PRODUCT_SEARCH_MAX_TERMS]
+
+
+# every term is a prefix, so "blu sho" matches "blue shoes", and every term has to match.
+# each dialect returns (match condition, rank) with a higher rank meaning a better match
+
+def _postgres_search(search_terms: list):
+    search_query = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{term}:*" for term in search_terms))
+    return _PG_SEARCH_DOCUMENT.op("@@")(search_query), func.ts_rank_cd(_PG_SEARCH_DOCUMENT, search_query)
+
+
+def _sqlite_search(search_terms: list):
+    search_query = " ".join(f'"{term}"*' for term in search_terms)
+    # bm25 is lower for better matches, the weights line up with (name, description)
+    return _SQLITE_SEARCH_TABLE.match(search_query), -func.bm25(_SQLITE_SEARCH_TABLE, 10.0, 1.0)
+
+
+def _fallback_search(search_terms: list):
+    term_conditions = [
+        or_(ProductModel.name.ilike(f"%{term}%"), ProductModel.description.ilike(f"%{term}%"))
+        for term in search_terms
+    ]
+    return and_(*term_conditions), literal(0.0)
+
+
+def _product_search_query(dialect_name: str, search_terms: list, product_fields: tuple):
+    search_columns = _product_columns(product_fields)
+
+    if dialect_name == "postgresql":
+        match_condition, search_rank = _postgres_search(search_terms)
+        search_query = select(*search_columns, search_rank.label("rank")).where(match_condition)
+
+    elif dialect_name == "sqlite":
+        match_condition, search_rank = _sqlite_search(search_terms)
+        search_query = (
+            select(*search_columns, search_rank.label("rank"))
+            .select_from(_SQLITE_SEARCH_ROWS)
+            .join(ProductModel, _SQLITE_PRODUCT_ROWID == _SQLITE_SEARCH_ROWS.c.rowid)
+            .where(match_condition)
+        )
+
+    else:
+        match_condition, search_rank = _fallback_search(search_terms)
+        search_query = select(*search_columns, search_rank.label("rank")).where(match_condition)
+
+    return search_query, search_rank
+
+
+async def search_products(
+    db: AsyncSession,
+    query: str,
+    cursor: str = None,
+    limit: int = None,
+    fields: str = None
+):
+    page_size = _resolve_page_size(limit)
+    product_fields = _resolve_product_fields(fields)
+    search_terms = _parse_search_terms(query)
+
+    search_cache_key = f"search:{' '.join(search_terms)}:{','.join(product_fields)}:{cursor or ''}:{page_size}"
+    cached_search_page = await product_cache.get(search_cache_key)
+    if cached_search_page is not None:
+        return cached_search_page
+
+    search_query, search_rank = _product_search_query(db.bind.dialect.name, search_terms, product_fields)
+
+    # keyset over (rank, id), the rank is recomputed for the same terms so it lines up with the cursor
+    if cursor:
+        try:
+            last_rank, last_product_id = decode_cursor(cursor)
+            last_rank = float(last_rank)
+            last_product_id = str(last_product_id)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Invalid search cursor was passed: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor was passed"
+            )
+
+        search_query = search_query.where(
+            or_(
+                search_rank < last_rank,
+                and_(
+                    search_rank == last_rank,
+                    ProductModel.id > last_product_id
+                )
+            )
+        )
+
+    try:
+        search_page = (await db.execute(
+            search_query.order_by(search_rank.desc(), ProductModel.id).limit(page_size + 1)
+        )).all()
+
+        next_cursor = None
+        if len(search_page) > page_size:
+            search_page = search_page[:page_size]
+            next_cursor = encode_cursor([float(search_page[-1].rank), search_page[-1].id])
+
+        serialized_search_page = {
+            "items": [_serialize_product_row(product_row, product_fields) for product_row in search_page],
+            "next_cursor": next_cursor
+        }
+        search_page_body = dumps_json(serialized_search_page)
+        search_page_payload = EncodedPayload(body=search_page_body, etag=content_etag(search_page_body))
+        await product_cache.set(search_cache_key, search_page_payload)
+
+        return search_page_payload
+
+    except Exception as e:
+        print(f"There was an error trying to search products: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to search products at this time sorry"
+        )
@@ -0,0 +1,91 @@
+from fastapi.responses import JSONResponse, Response
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import json
+
+# orjson is optional, without it everything still works on the stdlib encoder, just slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def loads_json(raw_value):
+    if orjson is not None:
+        return orjson.loads(raw_value)
+
+    return json.loads(raw_value)
+
+
+# default response class for the whole app, same output as JSONResponse with a faster encoder
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
+# for bodies that were encoded ahead of time (usually straight out of the product cache), the
+# bytes go out as they are and skip response model validation and encoding altogether
+
+class RawJSONResponse(Response):
+    media_type = "application/json"
+
+
+@dataclass
+class EncodedPayload:
+    body: bytes
+    etag: str
+    last_modified: datetime = None
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # the DateTime columns are stored without a timezone, they always hold utc
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def is_not_modified(request_headers, etag: str, last_modified: datetime = None) -> bool:
+    # If-None-Match wins when both are sent, If-Modified-Since is only looked at without it
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        client_etags = { client_etag.strip().removeprefix("W/") for client_etag in if_none_match.split(",") }
+        return etag in client_etags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    try:
+        modified_since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+    # http dates only have second precision
+    return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(modified_since)
+
+
+def conditional_json_response(request_headers, payload: EncodedPayload) -> Response:
+    validator_headers = { "ETag": payload.etag, "Cache-Control": "private, no-cache" }
+    if payload.last_modified is not None:
+        validator_headers["Last-Modified"] = format_datetime(_as_utc(payload.last_modified), usegmt=True)
+
+    if is_not_modified(request_headers, payload.etag, payload.last_modified):
+        return Response(status_code=304, headers=validator_headers)
+
+    return RawJSONResponse(payload.body, headers=validator_headers)
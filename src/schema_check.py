@@ -0,0 +1,58 @@
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from alembic.runtime.migration import MigrationContext
+from alembic.autogenerate import compare_metadata
+from dotenv import load_dotenv
+from .database import engine
+from .models import Base, include_schema_object
+import os
+
+load_dotenv()
+
+# strict refuses to start on a database that is behind the models, warn only prints the drift, off skips it
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "strict").strip().lower()
+ALEMBIC_CONFIG_PATH = os.getenv("ALEMBIC_CONFIG_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini"))
+
+
+class SchemaOutOfDateError(RuntimeError):
+    pass
+
+
+def _describe_schema_diff(schema_diff) -> list:
+    described_diff = []
+    for diff_entry in schema_diff:
+        # column level changes come back as a list of tuples, table level ones as a single tuple
+        if isinstance(diff_entry, list):
+            described_diff.extend(f"{entry[0]} {entry[2]}.{entry[3]}" for entry in diff_entry)
+        elif diff_entry[0] in ("add_column", "remove_column"):
+            described_diff.append(f"{diff_entry[0]} {diff_entry[2]}.{diff_entry[3].name}")
+        else:
+            described_diff.append(f"{diff_entry[0]} {getattr(diff_entry[1], 'name', diff_entry[1])}")
+    return described_diff
+
+
+def check_database_schema() -> dict:
+    if DB_SCHEMA_CHECK == "off":
+        return { "checked": False }
+
+    alembic_config = Config(ALEMBIC_CONFIG_PATH)
+    alembic_config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_CONFIG_PATH), "migrations"))
+    head_revision = ScriptDirectory.from_config(alembic_config).get_current_head()
+
+    with engine.connect() as connection:
+        migration_context = MigrationContext.configure(connection, opts={ "include_object": include_schema_object })
+        current_revision = migration_context.get_current_revision()
+        schema_diff = compare_metadata(migration_context, Base.metadata)
+
+    schema_problems = []
+    if current_revision != head_revision:
+        schema_problems.append(f"database is at revision {current_revision}, the code expects {head_revision}")
+    schema_problems.extend(_describe_schema_diff(schema_diff))
+
+    if schema_problems:
+        message = "The database schema does not match the models, run `alembic upgrade head`: " + "; ".join(schema_problems)
+        if DB_SCHEMA_CHECK == "strict":
+            raise SchemaOutOfDateError(message)
+        print(message)
+
+    return { "checked": True, "revision": current_revision, "head": head_revision, "problems": schema_problems }
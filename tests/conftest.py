@@ -0,0 +1,137 @@
+import os
+import tempfile
+
+# the app reads its settings at import time, so the test environment is in place before anything
+# from src is imported. load_dotenv never overrides these, a local .env cannot point the suite
+# at a real database
+_TEST_ROOT = tempfile.mkdtemp(prefix="ecom_tests_")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TEST_ROOT, 'test.db')}",
+    "JWT_SECRET": "test-secret-that-is-long-enough-for-hs256",
+    "JWT_ALGORITHM": "HS256",
+    "PASSWORD_HASH_ROUNDS": "4",
+    "PASSWORD_HASH_WORKERS": "2",
+    "CACHE_BACKEND": "memory",
+    "IMAGE_STORAGE_PROVIDER": "local",
+    "IMAGE_STAGING_DIR": os.path.join(_TEST_ROOT, "staging"),
+    "IMAGE_LOCAL_STORAGE_DIR": os.path.join(_TEST_ROOT, "images"),
+    "OUTBOX_POLL_INTERVAL": "0.05",
+    "OUTBOX_RETRY_BACKOFF": "0.05",
+    "PRODUCT_STOCK_REBALANCE_INTERVAL": "3600",
+})
+
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+import pytest
+import time
+
+from src.database import engine
+from src.models import Base
+from src.main import app
+from src.products.crud import product_cache
+from src.idempotency.keys import _completed_responses
+from src.authentication.dependencies import _principal_cache
+from src.authentication.token_registry import _revoked_families
+from src.images.ingestion import PENDING_IMAGE_BASE_URL, _image_url_by_digest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# smallest valid png, staging sniffs the magic bytes so the content has to be a real image header
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+# async tests run on anyio's pytest plugin (it ships with fastapi), always on asyncio like the app
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def _migrated_app():
+    alembic_config = Config(os.path.join(PROJECT_ROOT, "alembic.ini"))
+    alembic_config.set_main_option("script_location", os.path.join(PROJECT_ROOT, "migrations"))
+    command.upgrade(alembic_config, "head")
+
+    # entering the client runs the lifespan: schema check, outbox dispatcher, cache subscriptions
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def client(_migrated_app):
+    yield _migrated_app
+
+    # every test starts from empty tables and cold caches
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(delete(table))
+    for cache in (product_cache.local, _completed_responses, _principal_cache, _image_url_by_digest):
+        cache.clear()
+    _revoked_families.clear()
+
+
+def _sign_up_and_in(client, signup_path: str, signin_path: str, username: str, signin_data: dict) -> dict:
+    signup_response = client.post(signup_path, data={ "username": username, "email": f"{username}@example.com", "password": "correct horse" })
+    assert signup_response.status_code == 201, signup_response.text
+
+    signin_response = client.post(signin_path, json={ **signin_data, "password": "correct horse" })
+    assert signin_response.status_code == 200, signin_response.text
+    return signin_response.json()
+
+
+@pytest.fixture
+def admin_tokens(client) -> dict:
+    return _sign_up_and_in(client, "/auth/admin/signup", "/auth/admin/signin", "admin", { "email": "admin@example.com" })
+
+
+@pytest.fixture
+def user_tokens(client) -> dict:
+    return _sign_up_and_in(client, "/auth/signup", "/auth/signin", "shopper", { "username": "shopper" })
+
+
+@pytest.fixture
+def admin_headers(admin_tokens) -> dict:
+    return { "Authorization": f"Bearer {admin_tokens['access_token']}" }
+
+
+@pytest.fixture
+def user_headers(user_tokens) -> dict:
+    return { "Authorization": f"Bearer {user_tokens['access_token']}" }
+
+
+@pytest.fixture
+def create_product(client, admin_headers):
+    def create(name: str, price: int = 10, quantity: int = 5, description: str = "a product", image: bytes = PNG_BYTES, headers: dict = None):
+        create_response = client.post(
+            "/products/admin/new",
+            data={ "name": name, "description": description, "price": price, "quantity": quantity },
+            files={ "product_header_image": ("header.png", image, "image/png") },
+            headers={ **admin_headers, **(headers or {}) }
+        )
+        assert create_response.status_code == 201, create_response.text
+        return create_response.json()
+
+    return create
+
+
+@pytest.fixture
+def wait_for_stored_image(client, admin_headers):
+    # the header image is uploaded by the outbox after the create commits, and swapping its url
+    # in bumps the product version. tests that edit with the version they read wait for it first
+    def wait(product_id: str, timeout: float = 5.0) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            product = client.get(f"/products/{product_id}", headers=admin_headers).json()
+            if not product["product_header_image"].startswith(PENDING_IMAGE_BASE_URL):
+                return product
+            assert time.monotonic() < deadline, "the header image was never uploaded"
+            time.sleep(0.02)
+
+    return wait
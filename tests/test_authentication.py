@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
+from src.database import engine
+from src.authentication import dependencies, password_hashing
+from src.authentication.token_registry import TokenRevocationSync, _revoked_families
+from src.authentication.models import UserModel
+from src.authentication.jwt_handeler import JWT_SECRET, JWT_ALGORITHM
+from src.products.schemas import DisplayProductSchema
+import bcrypt
+import jwt
+import pytest
+
+
+def _signed_token(**claims) -> str:
+    return jwt.encode({ "type": "access", **claims }, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def test_me_is_answered_from_the_token_claims(client, user_headers, monkeypatch):
+    async def no_lookups(**kwargs):
+        raise AssertionError("tokens with claims should not hit the database")
+    monkeypatch.setattr(dependencies, "_lookup_user_type", no_lookups)
+
+    me_response = client.get("/auth/me", headers=user_headers)
+
+    assert me_response.status_code == 200
+    assert me_response.json()["username"] == "shopper"
+    assert me_response.json()["user_type"] == "user"
+
+
+def test_expired_and_invalid_tokens_get_401(client, user_tokens):
+    claims = jwt.decode(user_tokens["access_token"], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    expired_token = _signed_token(**{ **claims, "exp": int((datetime.now(timezone.utc) - timedelta(minutes=1)).timestamp()) })
+    forged_token = jwt.encode(claims, "some-other-secret-that-is-long-enough", algorithm=JWT_ALGORITHM)
+
+    for bad_token in (expired_token, forged_token, "not.a.token"):
+        assert client.get("/auth/me", headers={ "Authorization": f"Bearer {bad_token}" }).status_code == 401
+
+
+def test_refresh_tokens_are_not_access_tokens(client, user_tokens):
+    refresh_as_access = client.get("/auth/me", headers={ "Authorization": f"Bearer {user_tokens['refresh_token']}" })
+
+    assert refresh_as_access.status_code == 401
+
+
+def test_customer_tokens_are_refused_on_admin_routes(client, user_headers):
+    assert client.get("/auth/admin/me", headers=user_headers).status_code == 401
+    assert client.get("/products/admin/products", headers=user_headers).status_code == 401
+
+
+def test_tokens_without_claims_fall_back_to_a_lookup(client, user_tokens, admin_tokens):
+    claims = jwt.decode(user_tokens["access_token"], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    legacy_token = _signed_token(sub=claims["sub"], username=claims["username"], exp=claims["exp"])
+
+    me_response = client.get("/auth/me", headers={ "Authorization": f"Bearer {legacy_token}" })
+    assert me_response.status_code == 200
+    assert me_response.json()["user_type"] == "user"
+
+    # a made up subject is not anybody
+    unknown_token = _signed_token(sub="no-such-user", username="ghost", exp=claims["exp"])
+    assert client.get("/auth/me", headers={ "Authorization": f"Bearer {unknown_token}" }).status_code == 401
+
+
+def test_edit_and_hot_responses_use_the_display_shape(client, create_product, wait_for_stored_image, admin_headers):
+    created_product = create_product("Desk", quantity=8)
+    wait_for_stored_image(created_product["id"])
+    display_fields = set(DisplayProductSchema.model_fields)
+
+    edit_response = client.put(f"/products/admin/edit/{created_product['id']}", data={ "name": "Standing desk" }, headers=admin_headers)
+    assert edit_response.status_code == 202, edit_response.text
+    assert set(edit_response.json()) == display_fields
+    assert edit_response.json()["name"] == "Standing desk"
+
+    hot_response = client.put(f"/products/admin/hot/{created_product['id']}", json={ "is_hot": True, "slots": 4 }, headers=admin_headers)
+    assert hot_response.status_code == 202, hot_response.text
+    assert set(hot_response.json()) == display_fields
+    assert hot_response.json()["quantity"] == 8
+
+
+@pytest.mark.anyio
+async def test_passwords_hash_and_verify_in_the_pool():
+    hashed_password = await password_hashing.hash_password("correct horse")
+
+    assert await password_hashing.verify_password("correct horse", hashed_password)
+    assert not await password_hashing.verify_password("battery staple", hashed_password)
+    assert not password_hashing.password_needs_rehash(hashed_password)
+    assert password_hashing.password_needs_rehash(bcrypt.hashpw(b"correct horse", bcrypt.gensalt(rounds=5)).decode("utf-8"))
+
+
+def test_signin_upgrades_hashes_made_at_another_cost(client, user_tokens):
+    old_cost_hash = bcrypt.hashpw(b"correct horse", bcrypt.gensalt(rounds=5)).decode("utf-8")
+    with engine.begin() as connection:
+        connection.execute(update(UserModel).where(UserModel.username == "shopper").values(password=old_cost_hash))
+
+    signin_response = client.post("/auth/signin", json={ "username": "shopper", "password": "correct horse" })
+    assert signin_response.status_code == 200
+
+    with engine.connect() as connection:
+        stored_hash = connection.execute(select(UserModel.password).where(UserModel.username == "shopper")).scalar_one()
+    assert not password_hashing.password_needs_rehash(stored_hash)
+    assert client.post("/auth/signin", json={ "username": "shopper", "password": "correct horse" }).status_code == 200
+
+
+def test_wrong_passwords_get_401(client, user_tokens):
+    assert client.post("/auth/signin", json={ "username": "shopper", "password": "battery staple" }).status_code == 401
+
+
+def test_a_full_hashing_queue_answers_429(client, user_tokens, monkeypatch):
+    monkeypatch.setattr(password_hashing, "_in_flight", password_hashing.PASSWORD_HASH_MAX_QUEUE)
+
+    busy_response = client.post("/auth/signin", json={ "username": "shopper", "password": "correct horse" })
+
+    assert busy_response.status_code == 429
+    assert busy_response.headers["retry-after"] == str(password_hashing.PASSWORD_HASH_RETRY_AFTER_SECONDS)
+
+
+def _me(client, tokens: dict):
+    return client.get("/auth/me", headers={ "Authorization": f"Bearer {tokens['access_token']}" })
+
+
+def _refresh(client, tokens: dict):
+    return client.post("/auth/refresh", json={ "refresh_token": tokens["refresh_token"] })
+
+
+def test_refreshing_rotates_the_refresh_token(client, user_tokens):
+    refresh_response = _refresh(client, user_tokens)
+
+    assert refresh_response.status_code == 200
+    rotated_tokens = refresh_response.json()
+    assert rotated_tokens["refresh_token"] != user_tokens["refresh_token"]
+    assert _me(client, rotated_tokens).json()["user_type"] == "user"
+    assert _refresh(client, rotated_tokens).status_code == 200
+
+
+def test_reusing_a_refresh_token_revokes_the_whole_sign_in(client, user_tokens):
+    rotated_tokens = _refresh(client, user_tokens).json()
+
+    # the old token turning up again means a copy is out there
+    assert _refresh(client, user_tokens).status_code == 401
+
+    assert _refresh(client, rotated_tokens).status_code == 401
+    assert _me(client, rotated_tokens).status_code == 401
+    assert _me(client, user_tokens).status_code == 401
+
+
+def test_logout_only_ends_its_own_sign_in(client, user_tokens):
+    other_sign_in = client.post("/auth/signin", json={ "username": "shopper", "password": "correct horse" }).json()
+
+    assert client.post("/auth/logout", json={ "refresh_token": user_tokens["refresh_token"] }).status_code == 200
+
+    assert _me(client, user_tokens).status_code == 401
+    assert _refresh(client, user_tokens).status_code == 401
+    assert _me(client, other_sign_in).status_code == 200
+    assert _refresh(client, other_sign_in).status_code == 200
+
+
+def test_access_tokens_cannot_be_used_to_refresh(client, user_tokens):
+    assert client.post("/auth/refresh", json={ "refresh_token": user_tokens["access_token"] }).status_code == 400
+
+
+@pytest.mark.anyio
+async def test_other_workers_pick_up_revocations(client, user_tokens):
+    assert client.post("/auth/logout", json={ "refresh_token": user_tokens["refresh_token"] }).status_code == 200
+    family_id = jwt.decode(user_tokens["access_token"], JWT_SECRET, algorithms=[JWT_ALGORITHM])["fam"]
+
+    # a worker that never saw the logout starts with no revocations in memory
+    _revoked_families.clear()
+
+    starting_worker_sync = TokenRevocationSync()
+    await starting_worker_sync.start()
+    await starting_worker_sync.stop()
+
+    assert family_id in _revoked_families
+    assert _me(client, user_tokens).status_code == 401
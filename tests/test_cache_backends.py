@@ -0,0 +1,139 @@
+from datetime import datetime
+from src.cache import TTLCache, TieredCache, RedisCacheBackend
+from src.cache.stand_in_server import StandInRedisServer
+from src.responses import EncodedPayload
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def stand_in_server():
+    server = await StandInRedisServer(port=0).start()
+    yield server
+    await server.stop()
+
+
+def _backend(server, **backend_options) -> RedisCacheBackend:
+    backend_options.setdefault("subscribe_retry_delay", 0.05)
+    return RedisCacheBackend(f"redis://127.0.0.1:{server.port}/0", **backend_options)
+
+
+def _tiered_cache(server) -> TieredCache:
+    return TieredCache(namespace="products", local=TTLCache(maxsize=100, ttl=60), backend=_backend(server))
+
+
+async def _eventually(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition was never met"
+        await asyncio.sleep(0.01)
+
+
+async def test_values_round_trip_with_their_encoding(stand_in_server):
+    backend = _backend(stand_in_server)
+    encoded_payload = EncodedPayload(body=b'{"id":"1"}', etag='"abc"', last_modified=datetime(2026, 1, 2, 3, 4, 5))
+
+    await backend.set("raw", b"\x00\x01body")
+    await backend.set("payload", encoded_payload)
+    await backend.set("json", { "items": [1, 2], "next_cursor": None })
+
+    assert await backend.get("raw") == b"\x00\x01body"
+    assert await backend.get("payload") == encoded_payload
+    assert await backend.get("json") == { "items": [1, 2], "next_cursor": None }
+    assert await backend.get("missing") is None
+
+    await backend.close()
+
+
+async def test_entries_expire_after_their_ttl(stand_in_server):
+    backend = _backend(stand_in_server)
+
+    await backend.set("short", b"lived", ttl=0.05)
+    assert await backend.get("short") == b"lived"
+
+    await asyncio.sleep(0.1)
+    assert await backend.get("short") is None
+
+    await backend.close()
+
+
+async def test_delete_prefix_only_drops_matching_keys(stand_in_server):
+    backend = _backend(stand_in_server)
+    for key in ("listing:a", "listing:b", "search:a", "product:1"):
+        await backend.set(key, b"x")
+
+    await backend.delete_prefix("listing:")
+
+    assert await backend.get("listing:a") is None
+    assert await backend.get("listing:b") is None
+    assert await backend.get("search:a") == b"x"
+    assert await backend.get("product:1") == b"x"
+
+    await backend.close()
+
+
+async def test_a_full_pool_times_out_instead_of_hanging(stand_in_server):
+    backend = _backend(stand_in_server, pool_size=1, timeout=0.1)
+    held_connection = await backend._acquire()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await backend.execute("PING")
+    assert backend.stats()["pool_timeouts"] == 1
+
+    await backend._release(held_connection)
+    assert await backend.execute("PING") == "PONG"
+
+    await backend.close()
+
+
+async def test_tiered_caches_share_entries_and_invalidations(stand_in_server):
+    first_worker, second_worker = _tiered_cache(stand_in_server), _tiered_cache(stand_in_server)
+    await first_worker.start()
+    await second_worker.start()
+
+    await first_worker.set("product:1", b"first")
+    await first_worker.set("listing:oldest", b"page")
+    # the second worker has nothing local, it is filled from the shared tier
+    assert await second_worker.get("product:1") == b"first"
+    assert await second_worker.get("listing:oldest") == b"page"
+    assert second_worker.stats()["backend_hits"] == 2
+
+    await first_worker.invalidate(keys=("product:1",), prefixes=("listing:",))
+
+    # the published message drops the second worker's local copies, not just the shared ones
+    await _eventually(lambda: second_worker.stats()["remote_invalidations"] == 1)
+    assert second_worker.local.get("product:1") is None
+    assert second_worker.local.get("listing:oldest") is None
+    assert await second_worker.get("product:1") is None
+
+    await first_worker.close()
+    await second_worker.close()
+
+
+async def test_subscriber_reconnects_after_the_server_restarts(stand_in_server):
+    listening_worker = _tiered_cache(stand_in_server)
+    await listening_worker.start()
+    await listening_worker.set("product:1", b"cached")
+
+    port = stand_in_server.port
+    await stand_in_server.stop()
+    restarted_server = await StandInRedisServer(port=port).start()
+    try:
+        await _eventually(lambda: listening_worker.backend.stats()["subscriber_reconnects"] >= 1)
+
+        publishing_worker = _tiered_cache(restarted_server)
+        # publish until the reconnected subscriber is back on the channel
+        for _ in range(40):
+            await publishing_worker.invalidate(keys=("product:1",))
+            await asyncio.sleep(0.05)
+            if listening_worker.stats()["remote_invalidations"]:
+                break
+
+        assert listening_worker.local.get("product:1") is None
+        await publishing_worker.close()
+
+    finally:
+        await listening_worker.close()
+        await restarted_server.stop()
@@ -0,0 +1,62 @@
+from sqlalchemy import select, func
+from src.database import AsyncLocalSession, get_async_db, get_pool_stats, _build_async_database_url
+from src import database
+from src.products.models import ProductModel
+import pytest
+
+
+def test_async_url_swaps_in_the_async_driver():
+    assert _build_async_database_url("postgresql://app:secret@db:5432/shop") == "postgresql+asyncpg://app:secret@db:5432/shop"
+    assert _build_async_database_url("postgres://app@db/shop") == "postgresql+asyncpg://app@db/shop"
+    assert _build_async_database_url("postgresql+psycopg2://app@db/shop") == "postgresql+asyncpg://app@db/shop"
+    assert _build_async_database_url("sqlite:///./shop.db") == "sqlite+aiosqlite:///./shop.db"
+
+    with pytest.raises(ValueError):
+        _build_async_database_url("mysql://app@db/shop")
+
+
+@pytest.mark.anyio
+async def test_async_sessions_read_what_the_api_wrote(client, create_product):
+    created_product = create_product("Async lamp")
+
+    async with AsyncLocalSession() as db:
+        stored_name = (await db.execute(select(ProductModel.name).where(ProductModel.id == created_product["id"]))).scalar_one()
+    assert stored_name == "Async lamp"
+
+    # the request dependency hands out a session and closes it once the request is done
+    db_dependency = get_async_db()
+    db = await db_dependency.__anext__()
+    assert (await db.execute(select(func.count()).select_from(ProductModel))).scalar_one() == 1
+    with pytest.raises(StopAsyncIteration):
+        await db_dependency.__anext__()
+
+
+def test_sqlite_engines_skip_pool_sizing():
+    engine_options = database._build_engine_options("sqlite:///./shop.db")
+
+    assert engine_options == { "echo": database.DB_ECHO, "pool_pre_ping": database.DB_POOL_PRE_PING, "pool_recycle": database.DB_POOL_RECYCLE }
+
+
+def test_postgres_engines_get_pool_sizing_and_statement_timeouts(monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 7)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 3)
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 2500)
+
+    asyncpg_options = database._build_engine_options("postgresql+asyncpg://app@db/shop")
+    psycopg_options = database._build_engine_options("postgresql://app@db/shop")
+
+    assert asyncpg_options["pool_size"] == 7 and asyncpg_options["max_overflow"] == 3
+    assert asyncpg_options["connect_args"] == { "server_settings": { "statement_timeout": "2500" } }
+    assert psycopg_options["connect_args"] == { "options": "-c statement_timeout=2500" }
+
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 0)
+    assert "connect_args" not in database._build_engine_options("postgresql://app@db/shop")
+
+
+def test_pool_stats_count_checkouts(client, user_headers):
+    checkouts_before = get_pool_stats()["async"]["checkouts"]
+
+    assert client.get("/products/", headers=user_headers).status_code == 200
+
+    # the outbox dispatcher shares the pool, so only the counter is checked and not what is idle
+    assert get_pool_stats()["async"]["checkouts"] > checkouts_before
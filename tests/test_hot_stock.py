@@ -0,0 +1,95 @@
+from sqlalchemy import select
+from src.database import engine
+from src.products.models import ProductModel, ProductStockSlotModel
+from src.products.inventory import stock_rebalancer
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+
+def _make_hot(client, admin_headers, product_id: str, slots: int = 4, is_hot: bool = True):
+    hot_response = client.put(f"/products/admin/hot/{product_id}", json={ "is_hot": is_hot, "slots": slots }, headers=admin_headers)
+    assert hot_response.status_code == 202, hot_response.text
+    return hot_response.json()
+
+
+def _checkout(client, user_headers, product_id: str, quantity: int = 1):
+    return client.post("/orders/checkout", json={ "items": [{ "product_id": product_id, "quantity": quantity }] }, headers=user_headers)
+
+
+def _stock_rows(product_id: str) -> tuple:
+    with engine.connect() as connection:
+        row_quantity = connection.execute(select(ProductModel.quantity).where(ProductModel.id == product_id)).scalar_one()
+        slot_quantities = connection.execute(
+            select(ProductStockSlotModel.quantity).where(ProductStockSlotModel.product_id == product_id).order_by(ProductStockSlotModel.slot)
+        ).scalars().all()
+    return row_quantity, slot_quantities
+
+
+def _available(client, headers, product_id: str) -> int:
+    return client.get(f"/products/{product_id}", headers=headers).json()["quantity"]
+
+
+def test_hot_products_spread_their_stock_over_slots(client, create_product, wait_for_stored_image, admin_headers):
+    lamp = create_product("Lamp", quantity=10)
+    wait_for_stored_image(lamp["id"])
+
+    assert _make_hot(client, admin_headers, lamp["id"], slots=4)["quantity"] == 10
+    assert _stock_rows(lamp["id"]) == (0, [3, 3, 2, 2])
+
+    # un-hot puts every slot back on the row
+    assert _make_hot(client, admin_headers, lamp["id"], is_hot=False)["quantity"] == 10
+    assert _stock_rows(lamp["id"]) == (10, [])
+
+
+def test_concurrent_hot_checkouts_never_oversell(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    lamp = create_product("Lamp", quantity=6)
+    wait_for_stored_image(lamp["id"])
+    _make_hot(client, admin_headers, lamp["id"], slots=3)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        checkout_statuses = list(executor.map(lambda _: _checkout(client, user_headers, lamp["id"]).status_code, range(10)))
+
+    assert sorted(checkout_statuses) == [201] * 6 + [409] * 4
+    assert _stock_rows(lamp["id"]) == (0, [0, 0, 0])
+    assert _available(client, user_headers, lamp["id"]) == 0
+
+
+def test_lines_bigger_than_a_slot_are_taken_across_slots(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    lamp = create_product("Lamp", quantity=8)
+    wait_for_stored_image(lamp["id"])
+    _make_hot(client, admin_headers, lamp["id"], slots=4)
+
+    assert _checkout(client, user_headers, lamp["id"], 7).status_code == 201
+    assert _available(client, user_headers, lamp["id"]) == 1
+    assert _checkout(client, user_headers, lamp["id"], 2).status_code == 409
+    assert _available(client, user_headers, lamp["id"]) == 1
+
+
+def test_sales_leave_the_version_alone(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    lamp = create_product("Lamp", quantity=8)
+    wait_for_stored_image(lamp["id"])
+    _make_hot(client, admin_headers, lamp["id"], slots=2)
+    read_etag = client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"]
+
+    assert _checkout(client, user_headers, lamp["id"], 3).status_code == 201
+
+    # the etag moves with the stock so readers revalidate, an edit made from the earlier read still applies
+    assert client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"] != read_etag
+    edit_response = client.put(f"/products/admin/edit/{lamp['id']}", data={ "price": 99 }, headers={ **admin_headers, "If-Match": read_etag })
+    assert edit_response.status_code == 202
+
+
+@pytest.mark.anyio
+async def test_rebalancing_spreads_new_stock_over_the_slots(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    lamp = create_product("Lamp", quantity=4)
+    wait_for_stored_image(lamp["id"])
+    _make_hot(client, admin_headers, lamp["id"], slots=2)
+
+    # a new quantity lands on the row and empties the slots until the rebalancer runs
+    assert client.put(f"/products/admin/edit/{lamp['id']}", data={ "quantity": 9 }, headers=admin_headers).status_code == 202
+    assert _stock_rows(lamp["id"]) == (9, [0, 0])
+
+    await stock_rebalancer.rebalance_all()
+
+    assert _stock_rows(lamp["id"]) == (0, [5, 4])
+    assert _available(client, user_headers, lamp["id"]) == 9
@@ -0,0 +1,85 @@
+from src.idempotency.keys import _completed_responses
+from concurrent.futures import ThreadPoolExecutor
+from conftest import PNG_BYTES
+
+
+def _create(client, admin_headers, idempotency_key: str, name: str = "Lamp", price: int = 10):
+    return client.post(
+        "/products/admin/new",
+        data={ "name": name, "description": "a lamp", "price": price, "quantity": 5 },
+        files={ "product_header_image": ("header.png", PNG_BYTES, "image/png") },
+        headers={ **admin_headers, "Idempotency-Key": idempotency_key }
+    )
+
+
+def _checkout(client, user_headers, idempotency_key: str, product_id: str, quantity: int = 1):
+    return client.post(
+        "/orders/checkout",
+        json={ "items": [{ "product_id": product_id, "quantity": quantity }] },
+        headers={ **user_headers, "Idempotency-Key": idempotency_key }
+    )
+
+
+def test_retried_creates_replay_the_first_product(client, admin_headers):
+    first_create = _create(client, admin_headers, "create-1")
+    retried_create = _create(client, admin_headers, "create-1")
+
+    assert first_create.status_code == retried_create.status_code == 201
+    assert "idempotent-replayed" not in first_create.headers
+    assert retried_create.headers["idempotent-replayed"] == "true"
+    assert retried_create.json() == first_create.json()
+
+    # the table answers once the local copy is gone, as it would on another worker
+    _completed_responses.clear()
+    assert _create(client, admin_headers, "create-1").json()["id"] == first_create.json()["id"]
+
+    assert len(client.get("/products/", headers=admin_headers).json()["items"]) == 1
+
+
+def test_reusing_a_key_for_another_request_is_refused(client, admin_headers):
+    assert _create(client, admin_headers, "create-1", price=10).status_code == 201
+
+    reused_key = _create(client, admin_headers, "create-1", price=12)
+
+    assert reused_key.status_code == 422
+    assert len(client.get("/products/", headers=admin_headers).json()["items"]) == 1
+
+
+def test_bad_keys_are_refused(client, admin_headers):
+    assert _create(client, admin_headers, "").status_code == 400
+    assert _create(client, admin_headers, "k" * 256).status_code == 400
+
+
+def test_retried_checkouts_take_the_stock_once(client, create_product, user_headers):
+    lamp = create_product("Lamp", quantity=5)
+
+    first_checkout = _checkout(client, user_headers, "order-1", lamp["id"], 2)
+    retried_checkout = _checkout(client, user_headers, "order-1", lamp["id"], 2)
+
+    assert retried_checkout.json()["id"] == first_checkout.json()["id"]
+    assert client.get(f"/products/{lamp['id']}", headers=user_headers).json()["quantity"] == 3
+    assert len(client.get("/orders/", headers=user_headers).json()["items"]) == 1
+
+
+def test_failed_checkouts_release_their_key(client, create_product, admin_headers, user_headers):
+    lamp = create_product("Lamp", quantity=1)
+
+    assert _checkout(client, user_headers, "order-1", lamp["id"], 2).status_code == 409
+
+    client.patch("/products/admin/bulk", json={ "ids": [lamp["id"]], "quantity": 5 }, headers=admin_headers)
+    # only successes are stored, so the retry runs for real once there is stock
+    retried_checkout = _checkout(client, user_headers, "order-1", lamp["id"], 2)
+    assert retried_checkout.status_code == 201
+    assert "idempotent-replayed" not in retried_checkout.headers
+
+
+def test_concurrent_retries_place_one_order(client, create_product, user_headers):
+    lamp = create_product("Lamp", quantity=5)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        checkout_responses = list(executor.map(lambda _: _checkout(client, user_headers, "order-1", lamp["id"]), range(6)))
+
+    # a retry that overlaps the first request is told to come back, a later one gets the replay
+    assert { checkout_response.status_code for checkout_response in checkout_responses } <= { 201, 409 }
+    assert len({ checkout_response.json()["id"] for checkout_response in checkout_responses if checkout_response.status_code == 201 }) == 1
+    assert client.get(f"/products/{lamp['id']}", headers=user_headers).json()["quantity"] == 4
@@ -0,0 +1,129 @@
+from src.images.ingestion import IMAGE_STAGING_DIR, PENDING_IMAGE_BASE_URL, get_image_upload_stats
+from src.images.storage import IMAGE_LOCAL_STORAGE_DIR, IMAGE_LOCAL_BASE_URL
+from src.images.uploads import stream_upload_to_path
+from fastapi import HTTPException, UploadFile
+from uuid import uuid4
+from conftest import PNG_BYTES
+import hashlib
+import io
+import os
+import pytest
+
+
+def _unique_png() -> bytes:
+    # bytes after the end of the png do not change what it sniffs as, they only change its hash
+    return PNG_BYTES + uuid4().bytes
+
+
+def _staged_files() -> set:
+    return set(os.listdir(IMAGE_STAGING_DIR))
+
+
+def test_uploads_are_staged_then_swapped_for_the_stored_url(client, create_product, wait_for_stored_image):
+    created_product = create_product("Lamp", image=_unique_png())
+    assert created_product["product_header_image"].startswith(PENDING_IMAGE_BASE_URL)
+
+    stored_product = wait_for_stored_image(created_product["id"])
+
+    assert stored_product["product_header_image"].startswith(IMAGE_LOCAL_BASE_URL)
+    stored_filename = stored_product["product_header_image"].rsplit("/", 1)[1]
+    assert os.path.exists(os.path.join(IMAGE_LOCAL_STORAGE_DIR, stored_filename))
+    # the staged copy is gone once the provider has it
+    assert stored_filename not in _staged_files()
+
+
+def test_refused_creates_leave_no_staged_files(client, create_product, wait_for_stored_image, admin_headers):
+    wait_for_stored_image(create_product("Lamp", image=_unique_png())["id"])
+    staged_before = _staged_files()
+
+    duplicate_response = client.post(
+        "/products/admin/new",
+        data={ "name": "Lamp", "description": "again", "price": 10, "quantity": 1 },
+        files={ "product_header_image": ("header.png", _unique_png(), "image/png") },
+        headers=admin_headers
+    )
+
+    assert duplicate_response.status_code == 400
+    assert _staged_files() <= staged_before
+
+
+def test_failed_edits_leave_no_staged_files(client, create_product, wait_for_stored_image, admin_headers):
+    wait_for_stored_image(create_product("Lamp", image=_unique_png())["id"])
+    desk = wait_for_stored_image(create_product("Desk", image=_unique_png())["id"])
+    staged_before = _staged_files()
+
+    # renaming onto an existing name fails on the unique constraint, after the new image was staged
+    failed_edit = client.put(
+        f"/products/admin/edit/{desk['id']}",
+        data={ "name": "Lamp" },
+        files={ "product_header_image": ("header.png", _unique_png(), "image/png") },
+        headers=admin_headers
+    )
+
+    assert failed_edit.status_code == 500
+    assert _staged_files() <= staged_before
+    assert client.get(f"/products/{desk['id']}", headers=admin_headers).json()["product_header_image"] == desk["product_header_image"]
+
+
+@pytest.mark.anyio
+async def test_streamed_uploads_are_hashed_and_typed(tmp_path):
+    image_bytes = _unique_png()
+    destination_path = str(tmp_path / "upload.part")
+
+    streamed_upload = await stream_upload_to_path(UploadFile(io.BytesIO(image_bytes), filename="anything.txt"), destination_path)
+
+    assert (streamed_upload.content_type, streamed_upload.extension) == ("image/png", ".png")
+    assert streamed_upload.size == len(image_bytes)
+    assert streamed_upload.sha256 == hashlib.sha256(image_bytes).hexdigest()
+    with open(destination_path, "rb") as streamed_file:
+        assert streamed_file.read() == image_bytes
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("upload_bytes, max_bytes, expected_status", [
+    (b"plain text pretending to be a png", 1024, 415),
+    (PNG_BYTES, 16, 413),
+    (b"", 1024, 400),
+])
+async def test_rejected_uploads_leave_no_partial_file(tmp_path, upload_bytes, max_bytes, expected_status):
+    destination_path = str(tmp_path / "upload.part")
+
+    with pytest.raises(HTTPException) as rejection:
+        await stream_upload_to_path(UploadFile(io.BytesIO(upload_bytes), filename="header.png"), destination_path, max_bytes=max_bytes)
+
+    assert rejection.value.status_code == expected_status
+    assert not os.path.exists(destination_path)
+
+
+def test_product_images_are_sniffed_not_trusted(client, admin_headers):
+    text_upload = client.post(
+        "/products/admin/new",
+        data={ "name": "Lamp", "description": "a lamp", "price": 10, "quantity": 1 },
+        files={ "product_header_image": ("header.png", b"definitely not an image", "image/png") },
+        headers=admin_headers
+    )
+
+    assert text_upload.status_code == 415
+
+
+def test_identical_images_are_stored_once(client, create_product, wait_for_stored_image):
+    image_bytes = _unique_png()
+    stored_files_before = set(os.listdir(IMAGE_LOCAL_STORAGE_DIR))
+    deduplicated_before = get_image_upload_stats()["deduplicated"]
+
+    # both are staged before either upload ran, the second upload finds the first one's url
+    first_product = create_product("Lamp", image=image_bytes)
+    second_product = create_product("Desk", image=image_bytes)
+    first_url = wait_for_stored_image(first_product["id"])["product_header_image"]
+    second_url = wait_for_stored_image(second_product["id"])["product_header_image"]
+
+    assert first_url == second_url
+    assert len(set(os.listdir(IMAGE_LOCAL_STORAGE_DIR)) - stored_files_before) == 1
+
+    # once stored, the same bytes skip staging and go straight onto the row
+    staged_before = _staged_files()
+    third_product = create_product("Chair", image=image_bytes)
+
+    assert third_product["product_header_image"] == first_url
+    assert _staged_files() <= staged_before
+    assert get_image_upload_stats()["deduplicated"] >= deduplicated_before + 2
@@ -0,0 +1,86 @@
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+from src.middleware import CompressionMiddleware, get_compression_stats
+import gzip
+import pytest
+
+_LARGE_BODY = b'{"items":[' + b",".join(b'{"name":"product"}' for _ in range(200)) + b"]}"
+
+
+@pytest.fixture
+def compressing_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/small")
+    async def small():
+        return Response(b'{"ok":true}', media_type="application/json")
+
+    @app.get("/large")
+    async def large():
+        return Response(_LARGE_BODY, media_type="application/json", headers={ "ETag": '"large"' })
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" + b"\x00" * 2000, media_type="image/png")
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for position in range(3):
+                yield f'{{"line":{position}}}\n'.encode("utf-8")
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+def _get_raw(client, path: str, accept_encoding: str = "gzip"):
+    # the raw stream keeps the compressed bytes, the client would otherwise decode them for us
+    with client.stream("GET", path, headers={ "Accept-Encoding": accept_encoding }) as raw_response:
+        return raw_response, b"".join(raw_response.iter_raw())
+
+
+def test_large_json_is_gzipped_with_a_weak_etag(compressing_client):
+    large_response, raw_body = _get_raw(compressing_client, "/large")
+
+    assert large_response.headers["content-encoding"] == "gzip"
+    assert large_response.headers["vary"] == "Accept-Encoding"
+    assert large_response.headers["etag"] == 'W/"large"'
+    assert int(large_response.headers["content-length"]) == len(raw_body) < len(_LARGE_BODY)
+    assert gzip.decompress(raw_body) == _LARGE_BODY
+
+
+def test_small_and_binary_bodies_go_out_as_they_are(compressing_client):
+    small_response, _ = _get_raw(compressing_client, "/small")
+    image_response, _ = _get_raw(compressing_client, "/image")
+
+    assert "content-encoding" not in small_response.headers
+    # small bodies could have been compressed, so caches still have to key on the encoding
+    assert small_response.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in image_response.headers
+
+
+def test_clients_that_refuse_gzip_get_plain_bodies(compressing_client):
+    for accept_encoding in ("identity", "gzip;q=0", ""):
+        plain_response, raw_body = _get_raw(compressing_client, "/large", accept_encoding)
+        assert "content-encoding" not in plain_response.headers, accept_encoding
+        assert raw_body == _LARGE_BODY
+
+
+def test_streams_are_compressed_chunk_by_chunk(compressing_client):
+    stream_response, raw_body = _get_raw(compressing_client, "/stream")
+
+    assert stream_response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in stream_response.headers
+    assert gzip.decompress(raw_body) == b'{"line":0}\n{"line":1}\n{"line":2}\n'
+
+
+def test_repeated_bodies_are_compressed_once(compressing_client):
+    _get_raw(compressing_client, "/large")
+    cache_hits_before = get_compression_stats()["cache_hits"]
+
+    _, raw_body = _get_raw(compressing_client, "/large")
+
+    assert get_compression_stats()["cache_hits"] == cache_hits_before + 1
+    assert gzip.decompress(raw_body) == _LARGE_BODY
@@ -0,0 +1,51 @@
+from src.schema_check import check_database_schema
+from conftest import PROJECT_ROOT
+import os
+import subprocess
+import sys
+
+
+def _run_against(database_path: str, *args) -> subprocess.CompletedProcess:
+    # env.py and the schema check both build their engine from DATABASE_URL at import time,
+    # so a separate database needs a separate interpreter
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=PROJECT_ROOT,
+        env={ **os.environ, "DATABASE_URL": f"sqlite:///{database_path}" },
+        capture_output=True,
+        text=True,
+        timeout=120
+    )
+
+
+_CHECK_SCHEMA = "from src.schema_check import check_database_schema; print(check_database_schema())"
+
+
+def test_the_test_database_matches_the_models(client):
+    schema_report = check_database_schema()
+
+    assert schema_report["revision"] == schema_report["head"]
+    assert schema_report["problems"] == []
+
+
+def test_migrations_downgrade_to_base_and_back(tmp_path):
+    database_path = str(tmp_path / "migrations.db")
+
+    for alembic_args in (("upgrade", "head"), ("downgrade", "base"), ("upgrade", "head")):
+        migration_run = _run_against(database_path, "-m", "alembic", *alembic_args)
+        assert migration_run.returncode == 0, migration_run.stderr
+
+    schema_check_run = _run_against(database_path, "-c", _CHECK_SCHEMA)
+    assert schema_check_run.returncode == 0, schema_check_run.stderr
+    assert "'problems': []" in schema_check_run.stdout
+
+
+def test_strict_schema_check_refuses_a_database_behind_head(tmp_path):
+    database_path = str(tmp_path / "behind.db")
+
+    migration_run = _run_against(database_path, "-m", "alembic", "upgrade", "0013")
+    assert migration_run.returncode == 0, migration_run.stderr
+
+    schema_check_run = _run_against(database_path, "-c", _CHECK_SCHEMA)
+    assert schema_check_run.returncode != 0
+    assert "SchemaOutOfDateError" in schema_check_run.stderr
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _checkout(client, user_headers, *items, headers: dict = None):
+    return client.post(
+        "/orders/checkout",
+        json={ "items": [{ "product_id": product_id, "quantity": quantity } for product_id, quantity in items] },
+        headers={ **user_headers, **(headers or {}) }
+    )
+
+
+def _stock(client, headers, product_id: str) -> int:
+    return client.get(f"/products/{product_id}", headers=headers).json()["quantity"]
+
+
+def test_checkout_places_the_order_and_takes_the_stock(client, create_product, user_headers):
+    lamp, desk = create_product("Lamp", price=10, quantity=5), create_product("Desk", price=100, quantity=2)
+
+    checkout_response = _checkout(client, user_headers, (lamp["id"], 2), (desk["id"], 1), (lamp["id"], 1))
+
+    assert checkout_response.status_code == 201, checkout_response.text
+    placed_order = checkout_response.json()
+    assert placed_order["status"] == "placed"
+    assert placed_order["total_price"] == 130
+    assert sorted((item["product_id"], item["quantity"]) for item in placed_order["items"]) == sorted([(lamp["id"], 3), (desk["id"], 1)])
+    assert _stock(client, user_headers, lamp["id"]) == 2
+    assert _stock(client, user_headers, desk["id"]) == 1
+
+
+def test_out_of_stock_carts_reserve_nothing(client, create_product, user_headers):
+    lamp, desk = create_product("Lamp", quantity=5), create_product("Desk", quantity=1)
+
+    checkout_response = _checkout(client, user_headers, (lamp["id"], 2), (desk["id"], 2))
+
+    assert checkout_response.status_code == 409
+    # the lamp reservation went back with the failed desk one
+    assert _stock(client, user_headers, lamp["id"]) == 5
+    assert _stock(client, user_headers, desk["id"]) == 1
+    assert client.get("/orders/", headers=user_headers).json()["items"] == []
+
+
+def test_unknown_products_and_admins_cannot_check_out(client, create_product, admin_headers, user_headers):
+    lamp = create_product("Lamp")
+
+    assert _checkout(client, user_headers, ("no-such-product", 1)).status_code == 404
+    assert _checkout(client, admin_headers, (lamp["id"], 1)).status_code == 403
+
+
+def test_concurrent_checkouts_never_oversell(client, create_product, user_headers):
+    lamp = create_product("Lamp", quantity=5)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        checkout_statuses = list(executor.map(lambda _: _checkout(client, user_headers, (lamp["id"], 1)).status_code, range(12)))
+
+    assert sorted(checkout_statuses) == [201] * 5 + [409] * 7
+    assert _stock(client, user_headers, lamp["id"]) == 0
+
+
+def test_orders_page_newest_first(client, create_product, user_headers):
+    lamp = create_product("Lamp", quantity=10)
+    placed_order_ids = [_checkout(client, user_headers, (lamp["id"], 1)).json()["id"] for _ in range(5)]
+
+    listed_order_ids, cursor = [], None
+    while True:
+        orders_page = client.get("/orders/", params={ "limit": 2, **({ "cursor": cursor } if cursor else {}) }, headers=user_headers).json()
+        listed_order_ids.extend(order["id"] for order in orders_page["items"])
+        cursor = orders_page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert listed_order_ids == placed_order_ids[::-1]
+    assert client.get("/orders/", params={ "cursor": "garbage" }, headers=user_headers).status_code == 400
+
+
+def test_orders_outlive_their_products(client, create_product, admin_headers, user_headers):
+    lamp = create_product("Lamp", price=10, quantity=5)
+    placed_order = _checkout(client, user_headers, (lamp["id"], 2)).json()
+
+    assert client.delete(f"/products/admin/delete/{lamp['id']}", headers=admin_headers).status_code == 204
+
+    kept_order = client.get(f"/orders/{placed_order['id']}", headers=user_headers)
+    assert kept_order.status_code == 200
+    assert kept_order.json()["total_price"] == 20
+    assert kept_order.json()["items"][0]["product_id"] == lamp["id"]
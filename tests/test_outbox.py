@@ -0,0 +1,115 @@
+from sqlalchemy import select, update
+from src.database import AsyncLocalSession
+from src.outbox import dispatcher
+from src.outbox.dispatcher import OutboxDispatcher, add_outbox_event, _outbox_handlers
+from src.outbox.models import OutboxEventModel
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def delivered(client) -> dict:
+    return { "test.first": [], "test.second": [] }
+
+
+@pytest.fixture
+def register_handler(delivered, monkeypatch):
+    # test topics are registered after the app's dispatcher started, so only the dispatcher
+    # made in each test ever claims them
+    def register(topic: str, fail: bool = False):
+        async def handle(payloads: list):
+            if fail:
+                raise RuntimeError("storage is down")
+            delivered[topic].extend(payloads)
+        monkeypatch.setitem(_outbox_handlers, topic, handle)
+
+    register("test.first")
+    register("test.second")
+    return register
+
+
+async def _add_events(*events):
+    async with AsyncLocalSession() as db:
+        for topic, payload, node_local in events:
+            add_outbox_event(db, topic, payload, node_local=node_local)
+        await db.commit()
+
+
+async def _outbox_rows(topic: str) -> list:
+    async with AsyncLocalSession() as db:
+        return (await db.execute(select(OutboxEventModel).where(OutboxEventModel.topic == topic))).scalars().all()
+
+
+async def test_events_are_delivered_in_order_and_removed(delivered, register_handler):
+    await _add_events(*[("test.first", { "position": position }, False) for position in range(3)])
+
+    assert await OutboxDispatcher(batch_size=10).dispatch_batch("test.first") == 3
+
+    assert delivered["test.first"] == [{ "position": 0 }, { "position": 1 }, { "position": 2 }]
+    assert await _outbox_rows("test.first") == []
+
+
+async def test_topics_are_claimed_independently(delivered, register_handler):
+    await _add_events(("test.first", { "id": 1 }, False), ("test.second", { "id": 2 }, False))
+
+    assert await OutboxDispatcher(batch_size=10).dispatch_batch("test.first") == 1
+
+    assert delivered["test.second"] == []
+    assert len(await _outbox_rows("test.second")) == 1
+
+
+async def test_failed_deliveries_back_off_then_give_up(register_handler, monkeypatch):
+    monkeypatch.setattr(dispatcher, "OUTBOX_MAX_ATTEMPTS", 2)
+    register_handler("test.first", fail=True)
+    outbox_dispatcher = OutboxDispatcher(batch_size=10)
+    await _add_events(("test.first", { "id": 1 }, False))
+
+    assert await outbox_dispatcher.dispatch_batch("test.first") == 1
+    retried_event = (await _outbox_rows("test.first"))[0]
+    assert (retried_event.status, retried_event.attempts, retried_event.last_error) == ("pending", 1, "storage is down")
+    # not due again until the backoff ran out
+    assert await outbox_dispatcher.dispatch_batch("test.first") == 0
+
+    await asyncio.sleep(dispatcher.OUTBOX_RETRY_BACKOFF * 2)
+    assert await outbox_dispatcher.dispatch_batch("test.first") == 1
+    failed_event = (await _outbox_rows("test.first"))[0]
+    assert (failed_event.status, failed_event.attempts) == ("failed", 2)
+
+    # failed events stay for a look by hand and are never claimed again
+    await asyncio.sleep(dispatcher.OUTBOX_RETRY_BACKOFF * 4)
+    assert await outbox_dispatcher.dispatch_batch("test.first") == 0
+
+
+async def test_node_local_events_stay_on_their_node(delivered, register_handler):
+    await _add_events(("test.first", { "node": "this" }, True), ("test.first", { "node": "other" }, True))
+    async with AsyncLocalSession() as db:
+        await db.execute(
+            update(OutboxEventModel)
+            .where(OutboxEventModel.payload.contains("other"))
+            .values(node_id="some-other-node")
+        )
+        await db.commit()
+
+    assert await OutboxDispatcher(batch_size=10).dispatch_batch("test.first") == 1
+
+    assert delivered["test.first"] == [{ "node": "this" }]
+    assert [outbox_row.node_id for outbox_row in await _outbox_rows("test.first")] == ["some-other-node"]
+
+
+async def test_a_timed_out_claim_cannot_finish_someone_elses_event(delivered, register_handler):
+    await _add_events(("test.first", { "id": 1 }, False))
+    stalled_dispatcher, live_dispatcher = OutboxDispatcher(batch_size=10), OutboxDispatcher(batch_size=10)
+
+    stalled_events, stalled_claim = await stalled_dispatcher._claim_batch("test.first")
+    # the stalled worker's claim runs out, another worker delivers the event and a new one takes its id
+    async with AsyncLocalSession() as db:
+        await db.execute(update(OutboxEventModel).values(available_at=dispatcher._utcnow()))
+        await db.commit()
+    assert await live_dispatcher.dispatch_batch("test.first") == 1
+    await _add_events(("test.first", { "id": 2 }, False))
+
+    await stalled_dispatcher._finish_batch([stalled_event.id for stalled_event in stalled_events], [], stalled_claim)
+
+    assert [outbox_row.payload for outbox_row in await _outbox_rows("test.first")] == ['{"id":2}']
@@ -0,0 +1,140 @@
+import csv
+import json
+
+
+def _import(client, admin_headers, content: bytes, filename: str = "products.csv", **params):
+    return client.post("/products/admin/import", params=params, files={ "import_file": (filename, content, "text/plain") }, headers=admin_headers)
+
+
+def _catalog_names(client, headers) -> list:
+    return sorted(product["name"] for product in client.get("/products/", params={ "limit": 100 }, headers=headers).json()["items"])
+
+
+def test_csv_imports_report_each_row(client, create_product, admin_headers):
+    create_product("Lamp")
+    csv_content = (
+        "name,description,product_header_image,quantity,price\n"
+        "Desk,a desk,https://img/desk.png,3,120\n"
+        "Chair,a chair,https://img/chair.png,-1,40\n"
+        "Lamp,already there,https://img/lamp.png,1,10\n"
+        "Shelf,a shelf,https://img/shelf.png,two,30\n"
+        "Desk,again in this file,https://img/desk.png,1,120\n"
+        "Rug,a rug,https://img/rug.png,2,12.5\n"
+        "Stool,a stool,https://img/stool.png,4,15\n"
+    ).encode("utf-8")
+
+    import_response = _import(client, admin_headers, csv_content)
+
+    assert import_response.status_code == 200, import_response.text
+    import_report = import_response.json()
+    assert (import_report["created"], import_report["failed"]) == (2, 5)
+    assert [row_result["status"] for row_result in import_report["results"]] == ["created", "failed", "failed", "failed", "failed", "failed", "created"]
+    assert "quantity" in import_report["results"][1]["errors"][0]
+    assert "already exists" in import_report["results"][2]["errors"][0]
+    assert "earlier in this file" in import_report["results"][4]["errors"][0]
+    assert _catalog_names(client, admin_headers) == ["Desk", "Lamp", "Stool"]
+
+
+def test_ndjson_imports_skip_broken_lines(client, admin_headers):
+    ndjson_content = "\n".join([
+        json.dumps({ "name": "Desk", "description": "a desk", "product_header_image": "https://img/desk.png", "quantity": 3, "price": 120 }),
+        "{not json",
+        json.dumps(["not", "an", "object"]),
+        "",
+        json.dumps({ "name": "Chair", "description": "a chair", "product_header_image": "https://img/chair.png", "quantity": 1, "price": 40 }),
+    ]).encode("utf-8")
+
+    import_report = _import(client, admin_headers, ndjson_content, filename="products.ndjson").json()
+
+    assert (import_report["created"], import_report["failed"]) == (2, 2)
+    assert [row_result["row"] for row_result in import_report["results"] if row_result["status"] == "failed"] == [2, 3]
+    assert _catalog_names(client, admin_headers) == ["Chair", "Desk"]
+
+
+def test_malformed_csv_lines_fail_alone(client, admin_headers):
+    csv_content = (
+        "name,description,product_header_image,quantity,price\n"
+        "Desk,a desk,https://img/desk.png,3,120\n"
+        f"Chair,{'x' * 200},https://img/chair.png,1,40\n"
+        "Stool,a stool,https://img/stool.png,4,15\n"
+    ).encode("utf-8")
+
+    # a field over the csv module's limit is the cheapest way to get a csv.Error out of a line
+    previous_field_size_limit = csv.field_size_limit(100)
+    try:
+        import_report = _import(client, admin_headers, csv_content).json()
+    finally:
+        csv.field_size_limit(previous_field_size_limit)
+
+    assert (import_report["created"], import_report["failed"]) == (2, 1)
+    assert import_report["results"][1]["errors"][0].startswith("Invalid csv")
+
+
+def test_non_utf8_imports_are_refused(client, admin_headers):
+    latin1_content = "name,description,product_header_image,quantity,price\nCafé,a café,https://img/cafe.png,1,5\n".encode("latin-1")
+
+    import_response = _import(client, admin_headers, latin1_content)
+
+    assert import_response.status_code == 400
+    assert "utf-8" in import_response.json()["detail"]
+
+
+def test_unknown_import_formats_are_refused(client, admin_headers):
+    assert _import(client, admin_headers, b"name\nDesk\n", import_format="xlsx").status_code == 400
+
+
+def _other_admin_headers(client) -> dict:
+    client.post("/auth/admin/signup", data={ "username": "other", "email": "other@example.com", "password": "correct horse" })
+    signin_response = client.post("/auth/admin/signin", json={ "email": "other@example.com", "password": "correct horse" })
+    return { "Authorization": f"Bearer {signin_response.json()['access_token']}" }
+
+
+def _prices(client, headers) -> dict:
+    return { product["name"]: product["price"] for product in client.get("/products/", params={ "limit": 100 }, headers=headers).json()["items"] }
+
+
+def test_bulk_updates_by_ids_and_by_filter(client, create_product, wait_for_stored_image, admin_headers):
+    desk, lamp, _ = create_product("Desk", price=100), create_product("Lamp", price=20), create_product("Rug", price=50)
+    wait_for_stored_image(desk["id"])
+    desk_etag = client.get(f"/products/{desk['id']}", headers=admin_headers).headers["etag"]
+
+    by_ids = client.patch("/products/admin/bulk", json={ "ids": [desk["id"], lamp["id"]], "quantity": 9 }, headers=admin_headers)
+    assert by_ids.json() == { "affected": 2 }
+
+    by_filter = client.patch("/products/admin/bulk", json={ "filter": { "min_price": 50 }, "price_change_percent": -10 }, headers=admin_headers)
+    assert by_filter.json() == { "affected": 2 }
+
+    assert _prices(client, admin_headers) == { "Desk": 90, "Lamp": 20, "Rug": 45 }
+    desk_after = client.get(f"/products/{desk['id']}", headers=admin_headers)
+    assert desk_after.json()["quantity"] == 9
+    # bulk writes are edits, the version moves so stale If-Match headers stop matching
+    assert desk_after.headers["etag"] != desk_etag
+
+
+def test_bulk_writes_only_touch_the_callers_products(client, create_product, admin_headers):
+    create_product("Desk", price=100)
+    other_admin_headers = _other_admin_headers(client)
+    create_product("Lamp", price=100, headers=other_admin_headers)
+
+    assert client.patch("/products/admin/bulk", json={ "filter": {}, "price": 1 }, headers=admin_headers).json() == { "affected": 1 }
+    assert client.post("/products/admin/bulk/delete", json={ "filter": {} }, headers=other_admin_headers).json() == { "affected": 1 }
+
+    assert _prices(client, admin_headers) == { "Desk": 1 }
+
+
+def test_bulk_deletes(client, create_product, admin_headers):
+    desk, _, _ = create_product("Desk", price=100), create_product("Lamp", price=20), create_product("Rug", price=50)
+
+    assert client.post("/products/admin/bulk/delete", json={ "ids": [desk["id"]] }, headers=admin_headers).json() == { "affected": 1 }
+    assert client.post("/products/admin/bulk/delete", json={ "filter": { "max_price": 30 } }, headers=admin_headers).json() == { "affected": 1 }
+
+    assert _prices(client, admin_headers) == { "Rug": 50 }
+    assert client.get(f"/products/{desk['id']}", headers=admin_headers).status_code == 404
+
+
+def test_bulk_writes_need_exactly_one_selection(client, create_product, admin_headers):
+    desk = create_product("Desk")
+
+    assert client.patch("/products/admin/bulk", json={ "price": 1 }, headers=admin_headers).status_code == 422
+    assert client.patch("/products/admin/bulk", json={ "ids": [desk["id"]], "filter": {}, "price": 1 }, headers=admin_headers).status_code == 422
+    assert client.post("/products/admin/bulk/delete", json={}, headers=admin_headers).status_code == 422
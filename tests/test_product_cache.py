@@ -0,0 +1,76 @@
+from src.cache import TTLCache
+from src.products.crud import product_cache
+import time
+
+
+def test_ttl_cache_evicts_the_least_recently_used_entry():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    # reading a makes b the oldest
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_entries_expire():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("short", "lived", ttl=0.01)
+    cache.set("long", "lived")
+
+    time.sleep(0.02)
+
+    assert cache.get("short") is None
+    assert cache.get("long") == "lived"
+    assert cache.stats()["expirations"] == 1
+
+
+def test_ttl_cache_deletes_by_key_and_prefix():
+    cache = TTLCache(maxsize=10, ttl=60)
+    for key in ("product:1", "product:2", "listing:oldest", "listing:newest"):
+        cache.set(key, key)
+
+    cache.delete("product:1")
+    cache.delete_prefix("listing:")
+
+    assert cache.get("product:1") is None
+    assert cache.get("listing:oldest") is None and cache.get("listing:newest") is None
+    assert cache.get("product:2") == "product:2"
+
+
+def test_product_details_are_served_from_the_cache(client, create_product, user_headers):
+    created_product = create_product("Lamp")
+
+    first_read = client.get(f"/products/{created_product['id']}", headers=user_headers)
+    hits_before = product_cache.local.stats()["hits"]
+    second_read = client.get(f"/products/{created_product['id']}", headers=user_headers)
+
+    assert first_read.json() == second_read.json()
+    assert product_cache.local.stats()["hits"] == hits_before + 1
+
+
+def test_edits_are_visible_right_after_they_commit(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    created_product = create_product("Lamp", price=10)
+    wait_for_stored_image(created_product["id"])
+    assert client.get(f"/products/{created_product['id']}", headers=user_headers).json()["price"] == 10
+    assert client.get("/products/", headers=user_headers).json()["items"][0]["price"] == 10
+
+    edit_response = client.put(f"/products/admin/edit/{created_product['id']}", data={ "price": 25 }, headers=admin_headers)
+    assert edit_response.status_code == 202
+
+    # the detail and the cached listing page were both dropped with the commit
+    assert client.get(f"/products/{created_product['id']}", headers=user_headers).json()["price"] == 25
+    assert client.get("/products/", headers=user_headers).json()["items"][0]["price"] == 25
+
+
+def test_new_products_show_up_in_cached_listings(client, create_product, user_headers):
+    create_product("Lamp")
+    assert len(client.get("/products/", headers=user_headers).json()["items"]) == 1
+
+    create_product("Desk")
+
+    assert len(client.get("/products/", headers=user_headers).json()["items"]) == 2
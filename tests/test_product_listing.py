@@ -0,0 +1,145 @@
+from src.pagination import encode_cursor
+import json
+
+
+def _walk_pages(client, headers, **params) -> list:
+    pages = []
+    cursor = None
+    while True:
+        page_response = client.get("/products/", params={ **params, **({ "cursor": cursor } if cursor else {}) }, headers=headers)
+        assert page_response.status_code == 200, page_response.text
+        pages.append(page_response.json()["items"])
+        cursor = page_response.json()["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_cover_every_product_once(client, create_product, user_headers):
+    created_ids = [create_product(f"Product {position}", price=position)["id"] for position in range(7)]
+
+    pages = _walk_pages(client, user_headers, limit=3)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [product["id"] for page in pages for product in page] == created_ids
+
+
+def test_each_sort_pages_in_its_own_order(client, create_product, user_headers):
+    for name, price in (("Cherry", 30), ("Apple", 10), ("Banana", 20), ("Date", 20)):
+        create_product(name, price=price)
+
+    price_desc = [product["name"] for page in _walk_pages(client, user_headers, limit=2, sort="price_desc") for product in page]
+    name_asc = [product["name"] for page in _walk_pages(client, user_headers, limit=3, sort="name_asc") for product in page]
+
+    assert price_desc[0] == "Cherry" and price_desc[-1] == "Apple"
+    assert sorted(price_desc[1:3]) == ["Banana", "Date"]
+    assert name_asc == ["Apple", "Banana", "Cherry", "Date"]
+
+
+def test_a_cursor_only_works_with_the_sort_it_came_from(client, create_product, user_headers):
+    for position in range(3):
+        create_product(f"Product {position}", price=position)
+
+    first_page = client.get("/products/", params={ "limit": 1, "sort": "price_asc" }, headers=user_headers).json()
+
+    switched_sort = client.get("/products/", params={ "limit": 1, "sort": "name_asc", "cursor": first_page["next_cursor"] }, headers=user_headers)
+    assert switched_sort.status_code == 400
+
+
+def test_malformed_cursors_are_rejected(client, user_headers):
+    for bad_cursor in ("not-base64!", encode_cursor(["oldest", "not a date", "id"]), encode_cursor(["oldest"])):
+        bad_cursor_response = client.get("/products/", params={ "cursor": bad_cursor }, headers=user_headers)
+        assert bad_cursor_response.status_code == 400, bad_cursor
+
+
+def test_page_size_is_bounded(client, user_headers):
+    assert client.get("/products/", params={ "limit": -1 }, headers=user_headers).status_code == 400
+    assert client.get("/products/", params={ "limit": 100000 }, headers=user_headers).status_code == 400
+
+
+def test_stream_returns_every_product_as_ndjson(client, create_product, user_headers):
+    created_ids = [create_product(f"Product {position}")["id"] for position in range(4)]
+
+    stream_response = client.get("/products/stream", headers=user_headers)
+
+    assert stream_response.status_code == 200
+    assert stream_response.headers["content-type"].startswith("application/x-ndjson")
+    streamed_products = [json.loads(line) for line in stream_response.text.splitlines() if line]
+    assert [product["id"] for product in streamed_products] == created_ids
+
+
+def _listed_names(client, headers, **params) -> list:
+    listing_response = client.get("/products/", params={ "limit": 100, **params }, headers=headers)
+    assert listing_response.status_code == 200, listing_response.text
+    return [product["name"] for product in listing_response.json()["items"]]
+
+
+def test_filters_narrow_the_listing(client, create_product, admin_headers, user_headers):
+    for name, price, quantity in (("Pen", 5, 10), ("Lamp", 40, 0), ("Desk", 300, 2), ("Chair", 80, 1)):
+        create_product(name, price=price, quantity=quantity)
+    admin_user_id = client.get("/auth/admin/me", headers=admin_headers).json()["user_id"]
+
+    assert _listed_names(client, user_headers, min_price=40, max_price=80) == ["Lamp", "Chair"]
+    assert _listed_names(client, user_headers, in_stock=True, sort="price_asc") == ["Pen", "Chair", "Desk"]
+    assert _listed_names(client, user_headers, in_stock=False) == ["Lamp"]
+    assert _listed_names(client, user_headers, admin_user_id=admin_user_id, max_price=10) == ["Pen"]
+    assert _listed_names(client, user_headers, admin_user_id="someone-else") == []
+    assert _listed_names(client, user_headers, posted_after="2000-01-01T00:00:00Z", sort="newest") == ["Chair", "Desk", "Lamp", "Pen"]
+    assert _listed_names(client, user_headers, posted_before="2000-01-01T00:00:00Z") == []
+
+
+def test_filters_and_cursors_page_together(client, create_product, user_headers):
+    for position in range(6):
+        create_product(f"Product {position}", price=position * 10)
+
+    pages = _walk_pages(client, user_headers, limit=2, min_price=20, sort="price_desc")
+
+    assert [product["price"] for page in pages for product in page] == [50, 40, 30, 20]
+
+
+def test_facets_count_everything_but_their_own_filter(client, create_product, user_headers):
+    for name, price, quantity in (("Pen", 5, 10), ("Lamp", 40, 0), ("Desk", 300, 2), ("Chair", 80, 1)):
+        create_product(name, price=price, quantity=quantity)
+
+    faceted_page = client.get("/products/", params={ "include_facets": True, "min_price": 25, "max_price": 100, "in_stock": True }, headers=user_headers).json()
+    facets = faceted_page["facets"]
+
+    assert [product["name"] for product in faceted_page["items"]] == ["Chair"]
+    assert facets["total"] == 1
+    # the stock facet ignores in_stock, the price buckets ignore the price range
+    assert facets["stock"] == { "in_stock": 1, "out_of_stock": 1 }
+    bucket_counts = { bucket["min_price"]: bucket["count"] for bucket in facets["price_buckets"] }
+    assert bucket_counts[0] == 1 and bucket_counts[50] == 1 and bucket_counts[250] == 1
+    assert sum(bucket_counts.values()) == 3
+
+    assert "facets" not in client.get("/products/", headers=user_headers).json()
+
+
+def test_fields_project_the_listed_products(client, create_product, user_headers):
+    create_product("Lamp", price=40, quantity=3)
+
+    projected_item = client.get("/products/", params={ "fields": "name, price" }, headers=user_headers).json()["items"][0]
+    compact_item = client.get("/products/", params={ "fields": "compact" }, headers=user_headers).json()["items"][0]
+    full_item = client.get("/products/", headers=user_headers).json()["items"][0]
+
+    # the id always comes along
+    assert set(projected_item) == { "id", "name", "price" } and projected_item["price"] == 40.0
+    assert set(compact_item) == { "id", "name", "price", "product_header_image" }
+    assert set(full_item) == { "id", "name", "description", "product_header_image", "quantity", "price" }
+    assert full_item["quantity"] == 3
+
+
+def test_fields_work_on_search_and_sorted_pages(client, create_product, user_headers):
+    for position in range(3):
+        create_product(f"Lamp {position}", price=position)
+
+    searched_items = client.get("/products/search", params={ "q": "lamp", "fields": "name" }, headers=user_headers).json()["items"]
+    # the sort column is not asked for, the cursor still has to work without it in the output
+    sorted_pages = _walk_pages(client, user_headers, limit=1, sort="price_desc", fields="name")
+
+    assert all(set(item) == { "id", "name" } for item in searched_items)
+    assert [page[0]["name"] for page in sorted_pages] == ["Lamp 2", "Lamp 1", "Lamp 0"]
+
+
+def test_unknown_fields_are_rejected(client, user_headers):
+    assert client.get("/products/", params={ "fields": "name,password" }, headers=user_headers).status_code == 400
+    assert client.get("/products/search", params={ "q": "lamp", "fields": "version" }, headers=user_headers).status_code == 400
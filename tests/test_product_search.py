@@ -0,0 +1,60 @@
+def _search(client, headers, q: str, **params):
+    return client.get("/products/search", params={ "q": q, **params }, headers=headers)
+
+
+def _found_names(client, headers, q: str) -> list:
+    search_response = _search(client, headers, q)
+    assert search_response.status_code == 200, search_response.text
+    return [product["name"] for product in search_response.json()["items"]]
+
+
+def test_every_term_matches_as_a_prefix(client, create_product, user_headers):
+    create_product("Blue shoes", description="running shoes")
+    create_product("Blue hat", description="a warm hat")
+    create_product("Red shoes", description="dancing shoes")
+
+    assert _found_names(client, user_headers, "blu sho") == ["Blue shoes"]
+    assert sorted(_found_names(client, user_headers, "SHOES")) == ["Blue shoes", "Red shoes"]
+    assert _found_names(client, user_headers, "green") == []
+
+
+def test_name_matches_rank_above_description_matches(client, create_product, user_headers):
+    create_product("Garden chair", description="sits well next to a lamp")
+    create_product("Desk lamp", description="bright and small")
+
+    assert _found_names(client, user_headers, "lamp") == ["Desk lamp", "Garden chair"]
+
+
+def test_search_pages_cover_every_match_once(client, create_product, user_headers):
+    created_ids = { create_product(f"Lamp {position}", description="a lamp")["id"] for position in range(5) }
+
+    found_ids, cursor = [], None
+    while True:
+        search_page = _search(client, user_headers, "lamp", limit=2, **({ "cursor": cursor } if cursor else {})).json()
+        found_ids.extend(product["id"] for product in search_page["items"])
+        cursor = search_page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(found_ids) == 5 and set(found_ids) == created_ids
+
+
+def test_search_follows_edits_and_deletes(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    lamp = create_product("Desk lamp")
+    wait_for_stored_image(lamp["id"])
+    assert _found_names(client, user_headers, "lamp") == ["Desk lamp"]
+
+    assert client.put(f"/products/admin/edit/{lamp['id']}", data={ "name": "Floor light" }, headers=admin_headers).status_code == 202
+    assert _found_names(client, user_headers, "lamp") == []
+    assert _found_names(client, user_headers, "floor") == ["Floor light"]
+
+    assert client.delete(f"/products/admin/delete/{lamp['id']}", headers=admin_headers).status_code == 204
+    assert _found_names(client, user_headers, "floor") == []
+
+
+def test_query_syntax_is_never_passed_through(client, create_product, user_headers):
+    create_product("Blue shoes")
+
+    # quotes, stars, brackets and the like are dropped, only the words are searched for
+    assert _found_names(client, user_headers, 'blue" * (shoes:&') == ["Blue shoes"]
+    assert _search(client, user_headers, "!!! ***").status_code == 400
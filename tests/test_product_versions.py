@@ -0,0 +1,52 @@
+def _edit(client, admin_headers, product_id: str, if_match: str = None, **form_data):
+    return client.put(
+        f"/products/admin/edit/{product_id}",
+        data=form_data,
+        headers={ **admin_headers, **({ "If-Match": if_match } if if_match else {}) }
+    )
+
+
+def test_edits_move_the_version(client, create_product, wait_for_stored_image, admin_headers):
+    lamp = create_product("Lamp", price=10)
+    wait_for_stored_image(lamp["id"])
+    read_etag = client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"]
+
+    edit_response = _edit(client, admin_headers, lamp["id"], read_etag, price=20)
+
+    assert edit_response.status_code == 202
+    assert edit_response.headers["etag"] != read_etag
+    assert client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"] == edit_response.headers["etag"]
+
+
+def test_stale_if_match_is_refused_with_409(client, create_product, wait_for_stored_image, admin_headers):
+    lamp = create_product("Lamp", price=10)
+    wait_for_stored_image(lamp["id"])
+    read_etag = client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"]
+
+    # two admins loaded the same version, the second one to save loses
+    assert _edit(client, admin_headers, lamp["id"], read_etag, price=20).status_code == 202
+    stale_edit = _edit(client, admin_headers, lamp["id"], read_etag, price=30)
+
+    assert stale_edit.status_code == 409
+    assert client.get(f"/products/{lamp['id']}", headers=admin_headers).json()["price"] == 20
+
+
+def test_weak_and_wildcard_if_match_are_accepted(client, create_product, wait_for_stored_image, admin_headers):
+    lamp = create_product("Lamp", price=10)
+    wait_for_stored_image(lamp["id"])
+    read_etag = client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"]
+
+    # compressed responses carry the weak form of the same etag
+    assert _edit(client, admin_headers, lamp["id"], f'"other", W/{read_etag}', price=20).status_code == 202
+    assert _edit(client, admin_headers, lamp["id"], "*", price=30).status_code == 202
+    assert _edit(client, admin_headers, lamp["id"], '"not-a-version"', price=40).status_code == 409
+
+
+def test_bulk_edits_invalidate_earlier_etags(client, create_product, wait_for_stored_image, admin_headers):
+    lamp = create_product("Lamp", price=10)
+    wait_for_stored_image(lamp["id"])
+    read_etag = client.get(f"/products/{lamp['id']}", headers=admin_headers).headers["etag"]
+
+    assert client.patch("/products/admin/bulk", json={ "ids": [lamp["id"]], "price": 15 }, headers=admin_headers).status_code == 200
+
+    assert _edit(client, admin_headers, lamp["id"], read_etag, price=20).status_code == 409
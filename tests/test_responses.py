@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from src import responses
+from src.responses import dumps_json, loads_json, FastJSONResponse, RawJSONResponse, is_not_modified
+import json
+import pytest
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def json_encoder(request, monkeypatch):
+    # both encoders have to produce the same bytes, orjson is only a speedup
+    if request.param == "orjson" and responses.orjson is None:
+        pytest.skip("orjson is not installed")
+    if request.param == "stdlib":
+        monkeypatch.setattr(responses, "orjson", None)
+    return request.param
+
+
+def test_dumps_json_is_compact_utf8(json_encoder):
+    encoded_value = dumps_json({ "name": "Café lamp", "price": 12.5, "tags": ["a", "b"], "next_cursor": None })
+
+    assert encoded_value == '{"name":"Café lamp","price":12.5,"tags":["a","b"],"next_cursor":null}'.encode("utf-8")
+    assert loads_json(encoded_value) == json.loads(encoded_value)
+
+
+def test_dumps_json_handles_datetimes(json_encoder):
+    encoded_value = dumps_json({ "date_created": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc) })
+
+    assert loads_json(encoded_value)["date_created"].startswith("2026-01-02")
+
+
+def test_fast_and_raw_responses_send_json(json_encoder):
+    fast_response = FastJSONResponse({ "id": "1", "price": 10.0 })
+    raw_response = RawJSONResponse(b'{"id":"1","price":10.0}')
+
+    assert fast_response.body == raw_response.body
+    assert fast_response.media_type == raw_response.media_type == "application/json"
+
+
+def test_cached_pages_are_sent_as_the_same_bytes(client, create_product, user_headers):
+    create_product("Lamp")
+
+    first_page = client.get("/products/", headers=user_headers)
+    cached_page = client.get("/products/", headers=user_headers)
+
+    assert cached_page.headers["content-type"] == "application/json"
+    assert cached_page.content == first_page.content
+    assert cached_page.headers["etag"] == first_page.headers["etag"]
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    last_modified = datetime(2026, 1, 2, 3, 4, 5, 678000)
+
+    assert is_not_modified({ "if-none-match": '"a", W/"b"' }, '"b"', last_modified)
+    assert is_not_modified({ "if-none-match": "*" }, '"b"')
+    assert not is_not_modified({ "if-none-match": '"a"', "if-modified-since": "Fri, 02 Jan 2026 03:04:05 GMT" }, '"b"', last_modified)
+    # http dates drop the microseconds, the same second is not modified
+    assert is_not_modified({ "if-modified-since": "Fri, 02 Jan 2026 03:04:05 GMT" }, '"b"', last_modified)
+    assert not is_not_modified({ "if-modified-since": "Fri, 02 Jan 2026 03:04:04 GMT" }, '"b"', last_modified)
+    assert not is_not_modified({ "if-modified-since": "not a date" }, '"b"', last_modified)
+
+
+def test_product_reads_revalidate_to_304(client, create_product, wait_for_stored_image, admin_headers, user_headers):
+    lamp = create_product("Lamp")
+    wait_for_stored_image(lamp["id"])
+
+    product_response = client.get(f"/products/{lamp['id']}", headers=user_headers)
+    etag, last_modified = product_response.headers["etag"], product_response.headers["last-modified"]
+
+    by_etag = client.get(f"/products/{lamp['id']}", headers={ **user_headers, "If-None-Match": etag })
+    by_date = client.get(f"/products/{lamp['id']}", headers={ **user_headers, "If-Modified-Since": last_modified })
+    assert by_etag.status_code == 304 and by_etag.content == b""
+    # a 304 cannot tell whether the body would have been compressed, so its etag may be the weak form
+    assert by_etag.headers["etag"].removeprefix("W/") == etag
+    assert by_date.status_code == 304
+
+    assert client.put(f"/products/admin/edit/{lamp['id']}", data={ "price": 99 }, headers=admin_headers).status_code == 202
+
+    after_edit = client.get(f"/products/{lamp['id']}", headers={ **user_headers, "If-None-Match": etag })
+    assert after_edit.status_code == 200
+    assert after_edit.headers["etag"] != etag and after_edit.json()["price"] == 99
+
+
+def test_listing_pages_revalidate_by_content(client, create_product, user_headers):
+    create_product("Lamp")
+    listing_etag = client.get("/products/", headers=user_headers).headers["etag"]
+
+    assert client.get("/products/", headers={ **user_headers, "If-None-Match": listing_etag }).status_code == 304
+
+    create_product("Desk")
+    assert client.get("/products/", headers={ **user_headers, "If-None-Match": listing_etag }).status_code == 200